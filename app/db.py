@@ -1,11 +1,17 @@
 """
 Модуль для работы с подключением к PostgreSQL (asyncpg + пул подключений).
+
+При многопроцессном запуске (app/serve.py, API_WORKERS > 1) каждый процесс
+держит свой пул: его размер выводится из max_connections сервера,
+чтобы все процессы вместе не выбирали лимит подключений PostgreSQL.
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
 import os
-from typing import AsyncGenerator, Optional, Set
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional, Set
 
 import asyncpg
 from asyncpg import Connection, Pool
@@ -19,12 +25,72 @@ DB_NAME: str = os.getenv("POSTGRES_DB", "ai_scan_db")
 DB_HOST: str = os.getenv("POSTGRES_HOST", "localhost")
 DB_PORT: str = os.getenv("POSTGRES_PORT", "5432")
 
+# число процессов API (см. app/serve.py)
+API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))
+
+# подключения, которые оставляем summary-воркеру, миграциям и psql
+DB_RESERVED_CONNECTIONS: int = int(os.getenv("DB_RESERVED_CONNECTIONS", "10"))
+
+# границы размера пула одного процесса
+DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+
+# канал NOTIFY: любой процесс, изменивший sites, сообщает остальным
+SITES_CHANNEL: str = "sites_changed"
+
+# канал NOTIFY для summary-воркера: в events появились новые события
+EVENTS_CHANNEL: str = "events_ingested"
+
+# не чаще одного NOTIFY events_ingested в секунду на процесс
+EVENTS_NOTIFY_INTERVAL_SEC: float = 1.0
+_events_notified_at: float = float("-inf")
+
+# страховочное обновление кэша сайтов (если NOTIFY потерялся при реконнекте)
+SITES_REFRESH_SEC: int = int(os.getenv("SITES_REFRESH_SEC", "60"))
+
 # глобальный пул подключений
 _pool: Optional[Pool] = None
 
+# отдельное соединение под LISTEN (в пуле его держать нельзя)
+_listener_conn: Optional[Connection] = None
+_sites_watchdog: Optional[asyncio.Task] = None
+_sites_refreshes: Set[asyncio.Task] = set()
+
 # кэш активных сайтов: сюда будем грузить id, у которых is_active = TRUE
 active_sites_cache: Set[str] = set()
 
+# настройки SDK активных сайтов: str(site_id) → sites.sdk_config
+site_sdk_config: Dict[str, Dict[str, Any]] = {}
+
+
+async def _connect() -> Connection:
+    return await asyncpg.connect(
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        host=DB_HOST,
+        port=DB_PORT,
+    )
+
+
+async def _pool_max_size() -> int:
+    """
+    Размер пула одного процесса:
+    (max_connections - резерв) / число процессов, в границах
+    DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE.
+    Одно соединение на процесс уходит под LISTEN — его тоже учитываем.
+    """
+    conn: Connection = await _connect()
+    try:
+        max_connections = int(await conn.fetchval("SHOW max_connections"))
+    finally:
+        await conn.close()
+
+    available = max_connections - DB_RESERVED_CONNECTIONS
+    per_process = available // max(API_WORKERS, 1) - 1
+
+    return max(DB_POOL_MIN_SIZE, min(DB_POOL_MAX_SIZE, per_process))
+
 
 async def get_pool() -> Pool:
     """
@@ -36,19 +102,68 @@ async def get_pool() -> Pool:
     global _pool
 
     if _pool is None:
+        max_size = await _pool_max_size()
         _pool = await asyncpg.create_pool(
             user=DB_USER,
             password=DB_PASSWORD,
             database=DB_NAME,
             host=DB_HOST,
             port=DB_PORT,
-            min_size=1,
-            max_size=10,
+            min_size=min(DB_POOL_MIN_SIZE, max_size),
+            max_size=max_size,
         )
 
     return _pool
 
 
+async def warm_up_pool(statements: Iterable[str]) -> None:
+    """
+    Прогревает пул при старте процесса: открывает min_size соединений
+    и заранее готовит «горячие» запросы на каждом из них,
+    чтобы первые запросы после деплоя не платили за connect + Parse.
+
+    executemany с пустым набором строк только готовит выражение
+    и кладёт его в statement cache соединения, ничего не выполняя.
+    """
+    pool: Pool = await get_pool()
+    statements = list(statements)
+
+    conns: List[Connection] = []
+    try:
+        for _ in range(pool.get_min_size()):
+            conns.append(await pool.acquire())
+
+        for conn in conns:
+            for sql in statements:
+                await conn.executemany(sql, [])
+    finally:
+        for conn in conns:
+            await pool.release(conn)
+
+
+async def close_pool() -> None:
+    """
+    Закрывает LISTEN-соединение и пул (вызывается на shutdown).
+    """
+    global _pool, _listener_conn, _sites_watchdog
+
+    if _sites_watchdog is not None:
+        _sites_watchdog.cancel()
+        try:
+            await _sites_watchdog
+        except asyncio.CancelledError:
+            pass
+        _sites_watchdog = None
+
+    if _listener_conn is not None:
+        await _listener_conn.close()
+        _listener_conn = None
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
 async def get_connection() -> AsyncGenerator[Connection, None]:
     """
     FastAPI dependency:
@@ -68,15 +183,91 @@ async def get_connection() -> AsyncGenerator[Connection, None]:
 
 async def refresh_active_sites() -> None:
     """
-    Обновляет кэш active_sites_cache:
-    загружает id всех сайтов, у которых is_active = TRUE.
+    Обновляет кэш active_sites_cache (и site_sdk_config):
+    загружает id и настройки SDK всех сайтов, у которых is_active = TRUE.
+
+    Кэши обновляются на месте, чтобы модули,
+    импортировавшие их, видели актуальные данные.
     """
-    global active_sites_cache
     pool: Pool = await get_pool()
 
     async with pool.acquire() as conn:
         rows = await conn.fetch(
-            "SELECT id FROM sites WHERE is_active = TRUE"
+            "SELECT id, sdk_config FROM sites WHERE is_active = TRUE"
         )
 
-    active_sites_cache = {row["id"] for row in rows}
+    fresh = {row["id"] for row in rows}
+    active_sites_cache.intersection_update(fresh)
+    active_sites_cache.update(fresh)
+
+    configs = {
+        str(row["id"]): json.loads(row["sdk_config"]) if row["sdk_config"] else {}
+        for row in rows
+    }
+    for site_id in set(site_sdk_config) - set(configs):
+        del site_sdk_config[site_id]
+    site_sdk_config.update(configs)
+
+
+async def notify_sites_changed(conn: Connection) -> None:
+    """
+    Сообщает всем процессам API, что таблица sites изменилась.
+    В транзакции NOTIFY доставляется только после COMMIT.
+    """
+    await conn.execute("SELECT pg_notify($1, '')", SITES_CHANNEL)
+
+
+async def notify_events_ingested(conn: Connection) -> None:
+    """
+    Будит summary-воркер, если тот спит с пустой events.
+    Троттлинг: не больше одного NOTIFY в секунду на процесс —
+    воркеру важен сам факт новых событий, а не их число.
+    """
+    global _events_notified_at
+
+    now = asyncio.get_running_loop().time()
+    if now - _events_notified_at < EVENTS_NOTIFY_INTERVAL_SEC:
+        return
+
+    _events_notified_at = now
+    await conn.execute("SELECT pg_notify($1, '')", EVENTS_CHANNEL)
+
+
+def _on_sites_changed(conn: Connection, pid: int, channel: str, payload: str) -> None:
+    # держим ссылку на задачу, иначе её может собрать GC до завершения
+    task = asyncio.get_running_loop().create_task(refresh_active_sites())
+    _sites_refreshes.add(task)
+    task.add_done_callback(_sites_refreshes.discard)
+
+
+async def _listen_sites() -> None:
+    global _listener_conn
+
+    _listener_conn = await _connect()
+    await _listener_conn.add_listener(SITES_CHANNEL, _on_sites_changed)
+
+
+async def _watch_sites() -> None:
+    """
+    Страховка для LISTEN: периодически обновляет кэш
+    и переподключает слушателя, если соединение оборвалось.
+    """
+    while True:
+        await asyncio.sleep(SITES_REFRESH_SEC)
+        try:
+            if _listener_conn is None or _listener_conn.is_closed():
+                await _listen_sites()
+            await refresh_active_sites()
+        except (OSError, asyncpg.PostgresError) as e:
+            print("[SITES CACHE ERROR]", repr(e))
+
+
+async def start_sites_listener() -> None:
+    """
+    Подписывает процесс на изменения sites (LISTEN sites_changed)
+    и запускает страховочное периодическое обновление кэша.
+    """
+    global _sites_watchdog
+
+    await _listen_sites()
+    _sites_watchdog = asyncio.get_running_loop().create_task(_watch_sites())
@@ -0,0 +1,99 @@
+"""
+Словарь кликнутых элементов (site_structure).
+
+Клик хранится в events и session_summary как element_id — целое
+число вместо трёх строк (текст, id и class кнопки). Каждый процесс API
+держит LRU-кэш (site_url, text, id, class) → element_id; промахи пачки
+разрешаются одним upsert в site_structure.
+"""
+
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from asyncpg import Connection
+
+# (site_url, text, button_id, button_class)
+ElementKey = Tuple[str, Optional[str], Optional[str], Optional[str]]
+
+ELEMENT_CACHE_SIZE: int = int(os.getenv("ELEMENT_CACHE_SIZE", "50000"))
+
+ELEMENT_TYPE_BUTTON: str = "button"
+
+UPSERT_ELEMENTS_SQL: str = """
+    INSERT INTO site_structure (site_url, element_type, text_current, button_id, button_class)
+    SELECT k.site_url, $5, k.text_current, k.button_id, k.button_class
+    FROM unnest($1::text[], $2::text[], $3::text[], $4::text[])
+        AS k(site_url, text_current, button_id, button_class)
+    ON CONFLICT (site_url, element_type, text_current, button_id, button_class)
+    DO UPDATE SET last_seen = NOW()
+    RETURNING element_id, site_url, text_current, button_id, button_class
+"""
+
+
+def _sort_key(key: ElementKey) -> tuple:
+    # None сортируется раньше любой строки
+    return tuple((value is not None, value or "") for value in key)
+
+
+class ElementInterner:
+    """
+    LRU (site_url, text, id, class) → site_structure.element_id.
+    last_seen в site_structure обновляется при промахе кэша.
+    """
+
+    def __init__(self, max_size: int = ELEMENT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._cache: "OrderedDict[ElementKey, int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def intern(self, conn: Connection, keys: List[ElementKey]) -> List[int]:
+        """
+        Возвращает element_id для каждого ключа (в том же порядке).
+        """
+        resolved: Dict[ElementKey, int] = {}
+        missing = set()
+
+        for key in keys:
+            element_id = self._cache.get(key)
+            if element_id is None:
+                missing.add(key)
+            else:
+                self._cache.move_to_end(key)
+                resolved[key] = element_id
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            # упорядоченно и без повторов: ON CONFLICT DO UPDATE не может
+            # обновить строку дважды, а общий порядок исключает взаимные
+            # блокировки между процессами
+            batch = sorted(missing, key=_sort_key)
+            rows = await conn.fetch(
+                UPSERT_ELEMENTS_SQL,
+                [k[0] for k in batch],
+                [k[1] for k in batch],
+                [k[2] for k in batch],
+                [k[3] for k in batch],
+                ELEMENT_TYPE_BUTTON,
+            )
+            for row in rows:
+                key = (row["site_url"], row["text_current"], row["button_id"], row["button_class"])
+                resolved[key] = row["element_id"]
+                self._remember(key, row["element_id"])
+
+        return [resolved[key] for key in keys]
+
+    def _remember(self, key: ElementKey, element_id: int) -> None:
+        self._cache[key] = element_id
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+
+# один словарь на процесс API
+element_interner = ElementInterner()
@@ -6,7 +6,7 @@ from datetime import datetime
 import asyncpg
 
 from app.schemas import RegisterRequest, RegisterResponse
-from app.db import get_connection
+from app.db import get_connection, notify_sites_changed
 
 router = APIRouter()
 
@@ -61,6 +61,8 @@ async def register_user(
         payload.site_url,
         payload.site_category,
     )
+    # Остальные процессы API обновят кэш активных сайтов
+    await notify_sites_changed(conn)
 
     # Токен
     dashboard_token: str = f"token_{uuid4()}"
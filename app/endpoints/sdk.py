@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Request
+from fastapi.responses import RedirectResponse, Response
+
+from app.db import site_sdk_config
+from app.sdk_bundle import API_PUBLIC_URL, build_loader, load_sdk_bundle, site_config
+
+router = APIRouter()
+
+JS_MEDIA_TYPE = "application/javascript; charset=utf-8"
+
+# ядро по хэшу не меняется никогда
+CORE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# загрузчик ссылается на текущую версию ядра — держим недолго
+LOADER_CACHE_CONTROL = "public, max-age=300"
+
+
+def _public_base(request: Request) -> str:
+    return (API_PUBLIC_URL or str(request.base_url)).rstrip("/")
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in tags
+
+
+def _pick_encoding(request: Request, available: dict) -> Optional[str]:
+    """
+    Выбирает br/gzip по Accept-Encoding (q=0 — запрет).
+    """
+    accepted = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, 0) > 0:
+            return encoding
+    return None
+
+
+@router.get("/sdk/{version}.js")
+async def sdk_core(request: Request, version: str) -> Response:
+    """
+    Ядро SDK: минифицировано и сжато заранее, кэшируется навсегда.
+    Устаревшая версия перенаправляется на текущую.
+    """
+    bundle = load_sdk_bundle()
+
+    if version != bundle.version:
+        return RedirectResponse(
+            f"{_public_base(request)}/sdk/{bundle.version}.js",
+            status_code=302,
+            headers={"Cache-Control": "no-cache"},
+        )
+
+    headers = {
+        "Cache-Control": CORE_CACHE_CONTROL,
+        "ETag": bundle.etag,
+        "Vary": "Accept-Encoding",
+    }
+
+    if _etag_matches(request, bundle.etag):
+        return Response(status_code=304, headers=headers)
+
+    encoding = _pick_encoding(request, bundle.encoded)
+    if encoding is None:
+        return Response(bundle.body, media_type=JS_MEDIA_TYPE, headers=headers)
+
+    headers["Content-Encoding"] = encoding
+    return Response(bundle.encoded[encoding], media_type=JS_MEDIA_TYPE, headers=headers)
+
+
+@router.get("/sdk.js")
+async def sdk_loader(request: Request, site: Optional[str] = None) -> Response:
+    """
+    Загрузчик SDK для вставки на сайт:
+        <script async src="https://ai-scan.tech/sdk.js?site=<site_id>"></script>
+
+    Встраивает настройки сайта из кэша и подключает текущую версию ядра.
+    Для неизвестного или неактивного сайта возвращает пустой скрипт.
+    """
+    bundle = load_sdk_bundle()
+    base = _public_base(request)
+
+    if site is not None and site not in site_sdk_config:
+        body = b"/* ai_scan: site is not active */\n"
+    else:
+        config = site_config(site_sdk_config.get(site, {})) if site else {}
+        config["apiUrl"] = f"{base}/track"
+        body = build_loader(
+            json.dumps(config, sort_keys=True, separators=(",", ":")),
+            f"{base}/sdk/{bundle.version}.js",
+        )
+
+    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+    headers = {"Cache-Control": LOADER_CACHE_CONTROL, "ETag": etag}
+
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(body, media_type=JS_MEDIA_TYPE, headers=headers)
@@ -1,134 +1,291 @@
 from __future__ import annotations
 
+import ipaddress
+import json
 from datetime import datetime, timezone
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import asyncpg
 from fastapi import APIRouter, Depends, Request
 
-from app.db import get_connection
+from app.db import get_connection, notify_events_ingested
+from app.elements import UPSERT_ELEMENTS_SQL, element_interner
 
 router = APIRouter()
 
+# sendBeacon/keepalive ограничены ~64 КБ, запас — на старые версии SDK
+MAX_BODY_BYTES = 512 * 1024
+MAX_EVENTS_PER_BATCH = 500
+
+MAX_TEXT_LEN = 512
+
+INSERT_EVENT_SQL: str = """
+    INSERT INTO events (
+        site_url,
+        uid,
+        session_id,
+        event_type,
+        event_time,
+        received_at,
+
+        scroll_position_percent,
+
+        element_id,
+        form_slug,
+
+        device_type,
+        os,
+        browser,
+        user_agent,
+        client_ip
+    )
+    VALUES (
+        $1,$2,$3,$4,$5,$6,
+        $7,
+        $8,$9,
+        $10,$11,$12,$13,$14
+    )
+"""
+
+# запросы, которые прогреваются на каждом соединении пула при старте
+HOT_STATEMENTS: List[str] = [INSERT_EVENT_SQL, UPSERT_ELEMENTS_SQL]
+
+
+def _text(value: Any) -> Optional[str]:
+    # NUL и одиночные суррогаты (SDK режет текст по UTF-16, разрывая
+    # эмодзи) PostgreSQL не принимает — весь батч упал бы с 500
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    text = str(value)[:MAX_TEXT_LEN].replace("\x00", "")
+    return text.encode("utf-8", "replace").decode("utf-8")
+
+
+def _percent(value: Any) -> Optional[int]:
+    # клиентское значение: вне 0..100 не должно ронять весь батч на INT-колонке
+    if isinstance(value, bool):
+        return None
+    try:
+        return min(max(int(value), 0), 100)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def _event_time(ts: Any) -> datetime:
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        try:
+            return datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            pass
+    return datetime.now(tz=timezone.utc)
+
+
+def _client_ip(request: Request) -> Optional[str]:
+    """
+    IP клиента: за nginx — первый адрес из X-Real-IP / X-Forwarded-For.
+    Невалидное значение не должно ронять вставку пачки.
+    """
+    raw = (
+        request.headers.get("x-real-ip")
+        or request.headers.get("x-forwarded-for")
+        or (request.client.host if request.client else None)
+    )
+    if not raw:
+        return None
+    try:
+        return str(ipaddress.ip_address(raw.split(",")[0].strip()))
+    except ValueError:
+        return None
+
+
+def _compact_rows(payload: Dict[str, Any]) -> Optional[tuple]:
+    """
+    Компактный формат:
+        {site, uid, sid, ua, ev: [{et: "hb"|"click"|"form", ts, p}]}
+    Возвращает (events, [(event_type, event_time, scroll, text, id, class, form), ...]).
+    """
+    events = payload.get("ev", [])
+    if not isinstance(events, list):
+        return None
+
+    rows = []
+    for ev in events[:MAX_EVENTS_PER_BATCH]:
+        if not isinstance(ev, dict) or not isinstance(ev.get("p", {}), dict):
+            continue
+        et = ev.get("et")
+        p = ev.get("p", {})
+
+        # HEARTBEAT → SCROLL
+        if et == "hb":
+            rows.append(("scroll", _event_time(ev.get("ts")), _percent(p.get("sp")), None, None, None, None))
+
+        # CLICK
+        elif et == "click":
+            rows.append(
+                (
+                    "click",
+                    _event_time(ev.get("ts")),
+                    None,
+                    _text(p.get("button_text")),
+                    _text(p.get("id")),
+                    _text(p.get("cls")),
+                    None,
+                )
+            )
+
+        # FORM SUBMIT
+        elif et == "form":
+            rows.append(("form_submit", _event_time(ev.get("ts")), None, None, None, None, _text(p.get("slug"))))
+
+    return events, rows
+
+
+def _sdk_rows(payload: Dict[str, Any]) -> Optional[tuple]:
+    """
+    Формат sdk/sdk.js:
+        {site_url, uid, session_id, device, events: [{event_type, ts, session_id, payload}]}
+    heartbeat → scroll, click_button:* → click,
+    form_submit_success:<slug> → form_submit, остальное пока не хранится.
+    Старые версии SDK кладут device в payload каждого события.
+    """
+    events = payload.get("events", [])
+    if not isinstance(events, list):
+        return None
+
+    rows = []
+    for ev in events[:MAX_EVENTS_PER_BATCH]:
+        if not isinstance(ev, dict) or not isinstance(ev.get("payload", {}), dict):
+            continue
+        event_type = ev.get("event_type")
+        p = ev.get("payload", {})
+
+        if event_type == "heartbeat":
+            row = ("scroll", _event_time(ev.get("ts")), _percent(p.get("scroll_percent")), None, None, None, None)
+        elif isinstance(event_type, str) and event_type.startswith("click_button:"):
+            row = (
+                "click",
+                _event_time(ev.get("ts")),
+                None,
+                _text(p.get("text")),
+                _text(p.get("id")),
+                _text(p.get("class_name")),
+                None,
+            )
+        elif isinstance(event_type, str) and event_type.startswith("form_submit_success:"):
+            row = (
+                "form_submit",
+                _event_time(ev.get("ts")),
+                None,
+                None,
+                None,
+                None,
+                _text(event_type[len("form_submit_success:"):]),
+            )
+        else:
+            continue
+
+        device = p.get("device")
+        rows.append((row, _text(ev.get("session_id")), device if isinstance(device, dict) else None))
+
+    return events, rows
+
+
+async def _with_element_ids(conn: asyncpg.Connection, records: List[tuple]) -> List[tuple]:
+    """
+    Заменяет (text, id, class) кнопки на element_id из site_structure.
+    Запись: (..., scroll, text, id, class, form_slug, device_type, ...) — индексы 7..9.
+    """
+    keys = [(r[0], r[7], r[8], r[9]) for r in records if r[3] == "click"]
+    element_ids = iter(await element_interner.intern(conn, keys) if keys else [])
+
+    return [
+        r[:7] + (next(element_ids) if r[3] == "click" else None,) + r[10:]
+        for r in records
+    ]
+
 
 @router.post("/track")
 async def track_batch(
     request: Request,
-    payload: Dict[str, Any],
     conn: asyncpg.Connection = Depends(get_connection),
 ):
-    site_url = payload.get("site")
-    uid = payload.get("uid")
-    session_id = payload.get("sid")
-    user_agent = payload.get("ua")
-    events: List[Dict[str, Any]] = payload.get("ev", [])
+    """
+    Пачка событий SDK. Тело читается как JSON независимо
+    от Content-Type: sendBeacon и fetch без preflight шлют text/plain.
+    """
+    body = await request.body()
+    if len(body) > MAX_BODY_BYTES:
+        return {"status": "payload too large"}
 
-    if not site_url or not isinstance(events, list):
+    try:
+        payload = json.loads(body)
+    except ValueError:
         return {"status": "bad payload"}
 
-    client_ip = (
-        request.headers.get("x-real-ip")
-        or request.headers.get("x-forwarded-for")
-        or request.client.host
-    )
+    if not isinstance(payload, dict):
+        return {"status": "bad payload"}
 
-    inserted = 0
-    skipped = 0
+    received_at = datetime.now(tz=timezone.utc)
+    client_ip = _client_ip(request)
+    records = []
 
-    for ev in events:
-        try:
-            if not isinstance(ev, dict):
-                skipped += 1
-                continue
-
-            et = ev.get("et")
-            ts = ev.get("ts")
-            p: Dict[str, Any] = ev.get("p", {})
-
-            if et not in {"hb", "click"}:
-                skipped += 1
-                continue
-
-            # timestamp
-            if isinstance(ts, int):
-                event_time = datetime.fromtimestamp(ts / 1000, tz=timezone.utc)
-            else:
-                event_time = datetime.now(tz=timezone.utc)
-
-            # defaults
-            event_type = None
-            scroll_position_percent = None
-            button_text = None
-            button_id = None
-            button_class = None
-
-            # HEARTBEAT → SCROLL
-            if et == "hb":
-                event_type = "scroll"
-                try:
-                    scroll_position_percent = int(p.get("sp"))
-                except (TypeError, ValueError):
-                    scroll_position_percent = None
-
-            # CLICK
-            elif et == "click":
-                event_type = "click"
-                button_text = p.get("button_text")
-                button_id = p.get("id")
-                button_class = p.get("cls")
-
-            await conn.execute(
-                """
-                INSERT INTO events (
-                    site_url,
-                    uid,
-                    session_id,
-                    event_type,
-                    event_time,
-                    received_at,
-
-                    scroll_position_percent,
-
-                    button_text,
-                    button_id,
-                    button_class,
-
-                    user_agent,
-                    client_ip
-                )
-                VALUES (
-                    $1,$2,$3,$4,$5,$6,
-                    $7,
-                    $8,$9,$10,
-                    $11,$12
+    if "ev" in payload:
+        site_url = _text(payload.get("site"))
+        parsed = _compact_rows(payload)
+        if not site_url or parsed is None:
+            return {"status": "bad payload"}
+
+        events, rows = parsed
+        uid = _text(payload.get("uid"))
+        session_id = _text(payload.get("sid"))
+        user_agent = _text(payload.get("ua"))
+
+        for event_type, event_time, scroll, text, button_id, button_class, form_slug in rows:
+            records.append(
+                (
+                    site_url, uid, session_id, event_type, event_time, received_at,
+                    scroll,
+                    text, button_id, button_class,
+                    form_slug,
+                    None, None, None, user_agent, client_ip,
                 )
-                """,
-                site_url,
-                uid,
-                session_id,
-                event_type,
-                event_time,
-                datetime.now(tz=timezone.utc),
-
-                scroll_position_percent,
-
-                button_text,
-                button_id,
-                button_class,
-
-                user_agent,
-                client_ip,
             )
 
-            inserted += 1
+    else:
+        site_url = _text(payload.get("site_url"))
+        parsed = _sdk_rows(payload)
+        if not site_url or parsed is None:
+            return {"status": "bad payload"}
 
-        except Exception:
-            skipped += 1
-            continue
+        events, rows = parsed
+        uid = _text(payload.get("uid"))
+        batch_session_id = _text(payload.get("session_id"))
+        batch_device = payload.get("device") if isinstance(payload.get("device"), dict) else {}
+
+        for row, session_id, event_device in rows:
+            event_type, event_time, scroll, text, button_id, button_class, form_slug = row
+            device = event_device or batch_device
+            records.append(
+                (
+                    site_url, uid, session_id or batch_session_id, event_type, event_time, received_at,
+                    scroll,
+                    text, button_id, button_class,
+                    form_slug,
+                    _text(device.get("device_type")),
+                    _text(device.get("os")),
+                    _text(device.get("browser")),
+                    _text(device.get("user_agent")),
+                    client_ip,
+                )
+            )
+
+    # одна пачка — один round-trip (плюс upsert новых элементов)
+    if records:
+        await conn.executemany(INSERT_EVENT_SQL, await _with_element_ids(conn, records))
+        await notify_events_ingested(conn)
 
     return {
         "status": "ok",
         "received": len(events),
-        "inserted": inserted,
-        "skipped": skipped,
+        "inserted": len(records),
+        "skipped": len(events) - len(records),
     }
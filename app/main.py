@@ -9,20 +9,33 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 from app.endpoints.register import router as register_router
-from app.endpoints.track import router as track_router
+from app.endpoints.sdk import router as sdk_router
+from app.endpoints.track import router as track_router, HOT_STATEMENTS
 
-from app.db import refresh_active_sites
+from app.db import (
+    close_pool,
+    refresh_active_sites,
+    start_sites_listener,
+    warm_up_pool,
+)
+from app.sdk_bundle import load_sdk_bundle
 
 
 # ------------------------------------------------------
-# Lifespan — выполняется один раз при запуске приложения
+# Lifespan — выполняется один раз при запуске каждого процесса
 # ------------------------------------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Загружаем активные сайты (кэш)
+    # Пул + заранее подготовленные INSERT на всех стартовых соединениях
+    await warm_up_pool(HOT_STATEMENTS)
+    # Загружаем активные сайты (кэш) и подписываемся на их изменения
     await refresh_active_sites()
+    await start_sites_listener()
+    # Минифицируем и сжимаем SDK один раз на процесс
+    load_sdk_bundle()
     yield  # ← передаём управление FastAPI
-    # На shutdown нет действий
+    # Shutdown: закрываем LISTEN-соединение и пул
+    await close_pool()
 
 
 # ------------------------------------------------------
@@ -63,3 +76,4 @@ async def track_get_stub():
 # ------------------------------------------------------
 app.include_router(register_router)
 app.include_router(track_router)
+app.include_router(sdk_router)
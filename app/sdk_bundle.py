@@ -0,0 +1,265 @@
+"""
+Сборка SDK для раздачи из API.
+
+При старте процесса sdk/sdk.js один раз минифицируется
+и сжимается (gzip и, если установлен пакет brotli, br).
+Ядро раздаётся по версионированному URL /sdk/<hash>.js c
+Cache-Control: immutable, а сайты подключают крошечный загрузчик
+/sdk.js?site=<site_id>, в который встроены настройки сайта.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli опционален: без него отдаём gzip
+    brotli = None
+
+SDK_SOURCE_PATH: Path = Path(__file__).resolve().parent.parent / "sdk" / "sdk.js"
+
+# публичный адрес API (за nginx), иначе берётся из запроса
+API_PUBLIC_URL: Optional[str] = os.getenv("API_PUBLIC_URL")
+
+# sites.sdk_config → ключи window.aiScanConfig
+SITE_CONFIG_KEYS: Dict[str, str] = {
+    "batch_size": "batchSize",
+    "flush_delay_ms": "flushDelay",
+    "heartbeat_interval_ms": "heartbeatInterval",
+    "sample_rate": "sampleRate",
+}
+
+# допустимые значения: (минимум, максимум, целое ли); вне диапазона — к границе.
+# batch_size: SDK шлёт fetch keepalive (≤64 КБ), heartbeat ~250 байт —
+# 200 событий укладываются; крупные пачки SDK всё равно режет по байтам.
+SITE_CONFIG_RANGES: Dict[str, Tuple[float, float, bool]] = {
+    "batch_size": (1, 200, True),
+    "flush_delay_ms": (1_000, 300_000, True),
+    "heartbeat_interval_ms": (5_000, 300_000, True),
+    "sample_rate": (0.0, 1.0, False),
+}
+
+
+class SdkBundle:
+    """
+    Минифицированное ядро SDK во всех вариантах кодирования.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.body: bytes = minify_js(source).encode("utf-8")
+        self.version: str = hashlib.sha256(self.body).hexdigest()[:16]
+        self.etag: str = f'"{self.version}"'
+        self.encoded: Dict[str, bytes] = {
+            "gzip": gzip.compress(self.body, compresslevel=9, mtime=0),
+        }
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body, quality=11)
+
+
+_bundle: Optional[SdkBundle] = None
+
+
+def load_sdk_bundle() -> SdkBundle:
+    """
+    Собирает (один раз на процесс) и возвращает бандл SDK.
+    """
+    global _bundle
+
+    if _bundle is None:
+        _bundle = SdkBundle(SDK_SOURCE_PATH.read_text(encoding="utf-8"))
+
+    return _bundle
+
+
+# ------------------------------------------------------
+# Минификация
+# ------------------------------------------------------
+
+# после этих символов «/» начинает регулярное выражение, а не деление
+_REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of")
+
+# пробел вокруг этих символов не нужен
+_PUNCT = set("{}()[];,:=<>!&|?*%^~.+-")
+
+# строку можно приклеить к следующей без риска для ASI
+_JOIN_AFTER = tuple("{;,([:=&|?+")
+_JOIN_BEFORE = tuple("})].,:?&|")
+
+
+# литерал в коде на время сжатия пробелов: \x00<номер>\x00
+_LITERAL_RE = re.compile(r"\x00(\d+)\x00")
+
+
+def _protect_literals(source: str) -> Tuple[str, List[str]]:
+    """
+    Удаляет комментарии и заменяет строки, шаблоны и регулярные
+    выражения метками: дальнейшая обработка пробелов и строк
+    литералы не видит и не портит.
+
+    Returns:
+        (код с метками, литералы по номерам меток).
+    """
+    out: List[str] = []
+    literals: List[str] = []
+    i = 0
+    n = len(source)
+
+    def protect(literal: str) -> None:
+        out.append(f"\x00{len(literals)}\x00")
+        literals.append(literal)
+
+    while i < n:
+        ch = source[i]
+        nxt = source[i + 1] if i + 1 < n else ""
+
+        if ch in "'\"`":
+            j = i + 1
+            while j < n and source[j] != ch:
+                j += 2 if source[j] == "\\" else 1
+            protect(source[i:j + 1])
+            i = j + 1
+            continue
+
+        if ch == "/" and nxt == "/":
+            while i < n and source[i] != "\n":
+                i += 1
+            continue
+
+        if ch == "/" and nxt == "*":
+            end = source.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            out.append(" ")
+            continue
+
+        if ch == "/":
+            stripped = "".join(out).rstrip()
+            is_regex = (
+                not stripped
+                or stripped[-1] in _REGEX_PRECEDERS
+                or re.search(r"\b(%s)$" % "|".join(_REGEX_KEYWORDS), stripped)
+            )
+            if is_regex:
+                j = i + 1
+                in_class = False
+                while j < n:
+                    c = source[j]
+                    if c == "\\":
+                        j += 2
+                        continue
+                    if c == "[":
+                        in_class = True
+                    elif c == "]":
+                        in_class = False
+                    elif c == "/" and not in_class:
+                        break
+                    j += 1
+                j += 1
+                while j < n and source[j].isalpha():  # флаги
+                    j += 1
+                protect(source[i:j])
+                i = j
+                continue
+
+        out.append(ch)
+        i += 1
+
+    return "".join(out), literals
+
+
+_SPACE_RE = re.compile(r"(\S) (?=(\S))")
+
+
+def _drop_space(m: re.Match) -> str:
+    left, right = m.group(1), m.group(2)
+    if left not in _PUNCT and right not in _PUNCT:
+        return m.group(0)
+    # «a + +b», «a - -b» — пробел значим
+    if left in "+-" and right in "+-":
+        return m.group(0)
+    return left
+
+
+def _squeeze_line(line: str) -> str:
+    """
+    Убирает лишние пробелы в строке кода; литералы в ней — метки
+    _protect_literals, поэтому их содержимое не трогается.
+    """
+    return _SPACE_RE.sub(_drop_space, re.sub(r"\s+", " ", line))
+
+
+def minify_js(source: str) -> str:
+    """
+    Консервативная минификация: удаляет комментарии, отступы,
+    пустые строки и лишние пробелы. Переводы строк сохраняются
+    везде, где от них может зависеть автоподстановка «;» (ASI).
+    """
+    if "\x00" in source:
+        raise ValueError("sdk.js не должен содержать NUL")
+
+    code, literals = _protect_literals(source)
+    lines = [_squeeze_line(l.strip()) for l in code.splitlines()]
+    lines = [l for l in lines if l]
+
+    out = ""
+    for line in lines:
+        if out and (out.endswith(_JOIN_AFTER) or line.startswith(_JOIN_BEFORE)):
+            out += line
+        elif out:
+            out += "\n" + line
+        else:
+            out = line
+    return _LITERAL_RE.sub(lambda m: literals[int(m.group(1))], out) + "\n"
+
+
+# ------------------------------------------------------
+# Загрузчик
+# ------------------------------------------------------
+
+def site_config(raw: Any) -> Dict[str, Any]:
+    """
+    Оставляет из sites.sdk_config только поддерживаемые ключи
+    с числовыми значениями (bool, NaN и бесконечности отбрасываются)
+    и приводит их к SITE_CONFIG_RANGES. Не объект (список, строка,
+    число) — пустой конфиг.
+    """
+    config: Dict[str, Any] = {}
+    if not isinstance(raw, dict):
+        return config
+    for key, value in raw.items():
+        if key not in SITE_CONFIG_KEYS:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if not math.isfinite(value):
+            continue
+
+        low, high, integer = SITE_CONFIG_RANGES[key]
+        value = min(max(value, low), high)
+        config[SITE_CONFIG_KEYS[key]] = int(value) if integer else float(value)
+    return config
+
+
+@lru_cache(maxsize=4096)
+def build_loader(config_json: str, core_url: str) -> bytes:
+    """
+    JS-загрузчик: выставляет window.aiScanConfig и асинхронно
+    подключает версионированное ядро. Кэшируется по (конфиг, URL ядра).
+    """
+    # «</script>» внутри JSON не должен закрыть тег при инлайне
+    config_js = config_json.replace("</", "<\\/")
+    src_js = json.dumps(core_url).replace("</", "<\\/")
+    return (
+        "(function(){window.aiScanConfig=" + config_js + ";"
+        "var s=document.createElement(\"script\");s.async=true;s.src=" + src_js + ";"
+        "(document.head||document.documentElement).appendChild(s);})();\n"
+    ).encode("utf-8")
@@ -0,0 +1,46 @@
+"""
+Запуск API в несколько процессов (uvicorn + uvloop + httptools).
+
+Каждый процесс поднимает собственный пул подключений к PostgreSQL
+(размер считается в app/db.py из max_connections и API_WORKERS)
+и прогревает его в lifespan.
+
+Запуск:
+    python -m app.serve
+"""
+
+from __future__ import annotations
+
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
+API_PORT: int = int(os.getenv("API_PORT", "8000"))
+API_WORKERS: int = int(os.getenv("API_WORKERS", "1"))
+
+
+def main() -> None:
+    """
+    Точка входа: стартует uvicorn с API_WORKERS процессами.
+    """
+    # app/db.py в процессах-воркерах читает то же значение
+    os.environ["API_WORKERS"] = str(API_WORKERS)
+
+    uvicorn.run(
+        "app.main:app",
+        host=API_HOST,
+        port=API_PORT,
+        workers=API_WORKERS,
+        loop="uvloop",
+        http="httptools",
+        proxy_headers=True,
+        access_log=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Набор нагрузочных тестов и микробенчмарков ai_scan.
+
+Запуск из корня репозитория:
+    python -m bench <команда> [опции]
+
+Команды:
+- traffic    — генерация синтетического трафика SDK в JSON Lines,
+- aggregator — микробенчмарк summary/aggregator.build_session_summaries,
+- load       — HTTP-нагрузка на app.main:app (POST /track),
+- worker     — время «догонки» summary-воркера для заданного бэклога,
+- summary    — запросы дашборда к session_summary (до/после секционирования),
+- sdk        — запросы sdk/sdk.js на просмотр страницы (в node),
+- funnels    — счётчики воронок против эталона по сырым событиям,
+- compare    — сравнение двух JSON-файлов с результатами.
+
+Результаты каждого прогона пишутся в bench/results/<suite>-<время>.json.
+"""
+
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+SUMMARY_DIR: Path = Path(__file__).resolve().parent.parent / "summary"
+
+
+def add_summary_to_path() -> None:
+    """
+    summary/* импортируют друг друга «плоско» (from db import ...),
+    как при запуске `python summary/worker.py`. Повторяем это для бенчмарков.
+    """
+    path = str(SUMMARY_DIR)
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,73 @@
+"""
+Точка входа: python -m bench <команда> [опции]
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Callable, Dict, List
+
+
+def _traffic(argv: List[str]) -> None:
+    from bench.traffic import main
+    main(argv)
+
+
+def _aggregator(argv: List[str]) -> None:
+    from bench.aggregator_bench import main
+    main(argv)
+
+
+def _load(argv: List[str]) -> None:
+    from bench.load_http import main
+    main(argv)
+
+
+def _worker(argv: List[str]) -> None:
+    from bench.worker_catchup import main
+    main(argv)
+
+
+def _summary(argv: List[str]) -> None:
+    from bench.summary_queries import main
+    main(argv)
+
+
+def _sdk(argv: List[str]) -> None:
+    from bench.sdk_requests import main
+    main(argv)
+
+
+def _funnels(argv: List[str]) -> None:
+    from bench.funnels import main
+    main(argv)
+
+
+def _compare(argv: List[str]) -> None:
+    from bench.results import compare_results
+    if len(argv) != 2:
+        raise SystemExit("usage: python -m bench compare <baseline.json> <candidate.json>")
+    compare_results(argv[0], argv[1])
+
+
+COMMANDS: Dict[str, Callable[[List[str]], None]] = {
+    "traffic": _traffic,
+    "aggregator": _aggregator,
+    "load": _load,
+    "worker": _worker,
+    "summary": _summary,
+    "sdk": _sdk,
+    "funnels": _funnels,
+    "compare": _compare,
+}
+
+
+def main() -> None:
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        names = ", ".join(COMMANDS)
+        raise SystemExit(f"usage: python -m bench <{names}> [опции]")
+    COMMANDS[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == "__main__":
+    main()
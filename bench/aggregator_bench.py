@@ -0,0 +1,110 @@
+"""
+Микробенчмарк summary/aggregator.build_session_summaries.
+
+Для каждого размера (суммарное число событий) генерируются сессии,
+и измеряется только время агрегации — генерация в замер не входит.
+Сессии агрегируются по одной, как это делает summary-воркер,
+поэтому память не растёт с размером прогона.
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import time
+from typing import Any, Dict, List, Optional
+
+from bench import add_summary_to_path
+from bench.results import write_results
+from bench.traffic import TrafficProfile, iter_sessions, session_rows
+
+DEFAULT_SIZES: List[int] = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+
+def run_size(
+    target_events: int,
+    profile: TrafficProfile,
+    seed: int,
+    idle_timeout_sec: int,
+) -> Dict[str, Any]:
+    """
+    Агрегирует сессии, пока суммарно не наберётся target_events событий.
+    """
+    add_summary_to_path()
+    from aggregator import build_session_summaries
+
+    events_total = 0
+    sessions = 0
+    visits = 0
+    max_session_events = 0
+    elapsed = 0.0
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for session in iter_sessions(10**12, profile, seed=seed):
+            rows = session_rows(session)
+
+            started = time.perf_counter()
+            summaries = build_session_summaries(rows, idle_timeout_sec=idle_timeout_sec)
+            elapsed += time.perf_counter() - started
+
+            sessions += 1
+            visits += len(summaries)
+            events_total += len(rows)
+            max_session_events = max(max_session_events, len(rows))
+
+            if events_total >= target_events:
+                break
+            if sessions % 10_000 == 0:
+                gc.collect()
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {
+        "name": f"aggregate_{target_events}",
+        "events": events_total,
+        "sessions": sessions,
+        "visits": visits,
+        "max_session_events": max_session_events,
+        "seconds": elapsed,
+        "events_per_sec": events_total / elapsed if elapsed else 0.0,
+        "ns_per_event": elapsed / events_total * 1e9 if events_total else 0.0,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench aggregator",
+        description="Микробенчмарк build_session_summaries на 1k..10M событий.",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=DEFAULT_SIZES,
+        help="размеры через запятую (по умолчанию 1000,...,10000000)",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--idle-timeout", type=int, default=300)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    profile = TrafficProfile()
+    results: List[Dict[str, Any]] = []
+
+    for size in args.sizes:
+        result = run_size(size, profile, args.seed, args.idle_timeout)
+        results.append(result)
+        print(
+            f"[BENCH] {result['name']}: {result['events']} событий, "
+            f"{result['visits']} визитов, {result['seconds']:.3f} с, "
+            f"{result['events_per_sec']:,.0f} событий/с"
+        )
+
+    write_results(
+        "aggregator",
+        {"sizes": args.sizes, "seed": args.seed, "idle_timeout": args.idle_timeout},
+        results,
+        args.output,
+    )
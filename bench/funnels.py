@@ -0,0 +1,316 @@
+"""
+Воронки конверсии: инкрементальные счётчики против эталона «в лоб».
+
+Синтетический трафик с кликами и отправками форм проходит тот же путь,
+что и в проде:
+1) воронки заводятся до трафика (create_funnel),
+2) первая половина сессий — summary/worker.process_once,
+3) ещё одна воронка заводится посреди потока (пересчёт по истории),
+4) вторая половина сессий — снова воркер,
+5) backfill одного сайта из архива (подмена дней со сдвигом счётчиков).
+
+Эталон считается прямо по сырым событиям, независимо от summary:
+визиты режутся по паузе > IDLE_TIMEOUT_SEC, а прогресс воронки —
+перебором всех упорядоченных наборов действий визита.
+Любое расхождение с funnel_daily — ошибка (код выхода 1).
+
+Заодно сравнивается время отчёта по funnel_daily (O(дней))
+с пересчётом по всем визитам сайта.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from bench import add_summary_to_path
+from bench.pg import temporary_postgres
+from bench.results import write_results
+from bench.traffic import BUTTON_ELEMENT_IDS, TrafficProfile, iter_sessions, session_rows
+from bench.worker_catchup import EVENT_COLUMNS
+
+IDLE_TIMEOUT_SEC = 300
+
+# (сайт, название, шаги); element_id — из BUTTON_ELEMENT_IDS
+EARLY_FUNNELS: List[Tuple[str, str, List[Dict[str, Any]]]] = [
+    (
+        "bench-site-0.example",
+        "lead",
+        [{"click": BUTTON_ELEMENT_IDS["Оставить заявку"]}, {"form": "Оставить_заявку"}],
+    ),
+    (
+        "bench-site-0.example",
+        "signup",
+        [
+            {"click": BUTTON_ELEMENT_IDS["Подробнее"]},
+            {"click": [BUTTON_ELEMENT_IDS["Записаться"]]},
+            {"form": "Записаться"},
+        ],
+    ),
+    (
+        "bench-site-1.example",
+        "buy_twice",
+        [{"click": BUTTON_ELEMENT_IDS["Купить"]}, {"click": BUTTON_ELEMENT_IDS["Купить"]}],
+    ),
+]
+
+LATE_FUNNELS: List[Tuple[str, str, List[Dict[str, Any]]]] = [
+    (
+        "bench-site-0.example",
+        "form_then_contact",
+        [
+            {"form": "Записаться"},
+            {"click": [BUTTON_ELEMENT_IDS["Купить"], BUTTON_ELEMENT_IDS["Позвонить"]]},
+        ],
+    ),
+]
+
+# сайт, который пересчитывается через backfill
+BACKFILL_SITE = "bench-site-0.example"
+
+
+# ----------------------------------------------------------------------
+# ЭТАЛОН
+# ----------------------------------------------------------------------
+
+def _reference_step_matches(step: Dict[str, Any], row: Dict[str, Any]) -> bool:
+    if "click" in step:
+        ids = step["click"] if isinstance(step["click"], list) else [step["click"]]
+        return row["event_type"] == "click" and row["element_id"] in ids
+    return row["event_type"] == "form_submit" and row["form_slug"] == step["form"]
+
+
+def reference_progress(steps: List[Dict[str, Any]], actions: List[Dict[str, Any]]) -> int:
+    """
+    Наибольшее k, для которого есть k действий визита (по порядку),
+    совпадающих с первыми k шагами. Полный перебор сочетаний.
+    """
+    best = 0
+    for k in range(1, len(steps) + 1):
+        if any(
+            all(_reference_step_matches(steps[i], actions[j]) for i, j in enumerate(combo))
+            for combo in itertools.combinations(range(len(actions)), k)
+        ):
+            best = k
+        else:
+            break
+    return best
+
+
+def reference_counters(
+    rows: List[Dict[str, Any]],
+    funnels: Dict[int, Tuple[str, List[Dict[str, Any]]]],
+) -> Counter:
+    """
+    (funnel_id, day, step) → визиты прямо по сырым событиям.
+    """
+    by_session: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        by_session[row["session_id"]].append(row)
+
+    counters: Counter = Counter()
+    for events in by_session.values():
+        events.sort(key=lambda r: r["event_time"])
+
+        visits: List[List[Dict[str, Any]]] = [[events[0]]]
+        for previous, event in zip(events, events[1:]):
+            if (event["event_time"] - previous["event_time"]).total_seconds() > IDLE_TIMEOUT_SEC:
+                visits.append([])
+            visits[-1].append(event)
+
+        for visit in visits:
+            day = visit[0]["event_time"].astimezone(timezone.utc).date()
+            # при равном времени клик раньше формы
+            actions = sorted(
+                (r for r in visit if r["event_type"] in ("click", "form_submit")),
+                key=lambda r: (
+                    r["event_time"],
+                    r["event_type"] != "click",
+                    r["element_id"] if r["event_type"] == "click" else r["form_slug"],
+                ),
+            )
+            for funnel_id, (site_url, steps) in funnels.items():
+                if visit[0]["site_url"] != site_url:
+                    continue
+                # действия, не подходящие ни к одному шагу, перебор не меняют
+                relevant = [a for a in actions if any(_reference_step_matches(s, a) for s in steps)]
+                for step in range(reference_progress(steps, relevant) + 1):
+                    counters[(funnel_id, day, step)] += 1
+
+    return counters
+
+
+# ----------------------------------------------------------------------
+# ПРОГОН
+# ----------------------------------------------------------------------
+
+async def load_events(params: Dict[str, str], rows: List[Dict[str, Any]]) -> None:
+    conn = await asyncpg.connect(**params)
+    try:
+        records = [tuple(row[c] for c in EVENT_COLUMNS) for row in rows]
+        await conn.copy_records_to_table("events", records=records, columns=EVENT_COLUMNS)
+        await conn.execute("ANALYZE events;")
+    finally:
+        await conn.close()
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    profile = TrafficProfile(clicks_per_minute=args.clicks_per_minute, form_submit_probability=0.6)
+    start = datetime.now(tz=timezone.utc) - timedelta(days=args.days + 1)
+
+    rows: List[Dict[str, Any]] = []
+    for session in iter_sessions(
+        args.sessions,
+        profile,
+        seed=args.seed,
+        start_ms=int(start.timestamp() * 1000),
+        spread_sec=args.days * 86_400,
+    ):
+        for row in session_rows(session):
+            # воркер считает сессию завершённой по received_at
+            row["received_at"] = row["event_time"]
+            rows.append(row)
+    half = len(rows) // 2
+    # сессия целиком попадает в одну половину
+    while 0 < half < len(rows) and rows[half]["session_id"] == rows[half - 1]["session_id"]:
+        half += 1
+
+    results: List[Dict[str, Any]] = []
+
+    async with temporary_postgres(args.pg_bin, args.pg_external) as params:
+        archive_dir = tempfile.mkdtemp(prefix="bench-funnels-archive-")
+        os.environ.update(
+            {
+                "POSTGRES_USER": params["user"],
+                "POSTGRES_PASSWORD": params["password"],
+                "POSTGRES_DB": params["database"],
+                "POSTGRES_HOST": params["host"],
+                "POSTGRES_PORT": params["port"],
+                "ARCHIVE_DIR": archive_dir,
+            }
+        )
+        add_summary_to_path()
+        import backfill
+        import funnels
+        import worker
+
+        conn = await asyncpg.connect(**params)
+        try:
+            # служебные таблицы backfill прошлых прогонов здесь не нужны
+            await conn.execute(
+                "TRUNCATE funnels, session_summary_backfill, summary_backfill_shards, "
+                "summary_backfill_days CASCADE;"
+            )
+
+            defined: Dict[int, Tuple[str, List[Dict[str, Any]]]] = {}
+            for site_url, name, steps in EARLY_FUNNELS:
+                defined[await funnels.create_funnel(conn, site_url, name, steps)] = (site_url, steps)
+
+            started = time.perf_counter()
+            await load_events(params, rows[:half])
+            await worker.process_once()
+
+            for site_url, name, steps in LATE_FUNNELS:
+                defined[await funnels.create_funnel(conn, site_url, name, steps)] = (site_url, steps)
+
+            await load_events(params, rows[half:])
+            await worker.process_once()
+            worker_sec = time.perf_counter() - started
+
+            days = sorted({r["event_time"].astimezone(timezone.utc).date() for r in rows})
+            await backfill.backfill(
+                site_url=BACKFILL_SITE,
+                date_from=days[0],
+                date_to=days[-1],
+                jobs=2,
+                idle_timeout_sec=IDLE_TIMEOUT_SEC,
+                archive_dir=archive_dir,
+            )
+
+            actual = Counter(
+                {
+                    (r["funnel_id"], r["day"], r["step"]): r["visits"]
+                    for r in await conn.fetch("SELECT funnel_id, day, step, visits FROM funnel_daily")
+                    if r["visits"]
+                }
+            )
+            expected = reference_counters(rows, defined)
+
+            mismatches = sorted(set(actual) | set(expected), key=str)
+            mismatches = [k for k in mismatches if actual.get(k, 0) != expected.get(k, 0)]
+            for key in mismatches[:10]:
+                print(f"[BENCH] расхождение {key}: funnel_daily {actual.get(key, 0)}, эталон {expected.get(key, 0)}")
+
+            for funnel_id, (site_url, steps) in defined.items():
+                report_started = time.perf_counter()
+                report = await funnels.funnel_report(conn, funnel_id, days[0], days[-1])
+                report_ms = (time.perf_counter() - report_started) * 1000
+
+                scan_started = time.perf_counter()
+                async with conn.transaction():
+                    await funnels.rebuild_funnel(conn, funnel_id)
+                scan_ms = (time.perf_counter() - scan_started) * 1000
+
+                result = {
+                    "name": f"funnel_{funnel_id}",
+                    "site_url": site_url,
+                    "steps": len(steps),
+                    "report": report,
+                    "report_ms": report_ms,
+                    "rescan_ms": scan_ms,
+                }
+                results.append(result)
+                print(
+                    f"[BENCH] воронка {funnel_id} ({site_url}): {' -> '.join(map(str, report))}; "
+                    f"отчёт {report_ms:.1f} мс, пересчёт по визитам {scan_ms:.1f} мс"
+                )
+
+            results.append(
+                {
+                    "name": "funnels_check",
+                    "sessions": args.sessions,
+                    "events": len(rows),
+                    "counters": len(expected),
+                    "mismatches": len(mismatches),
+                    "worker_seconds": worker_sec,
+                }
+            )
+            print(
+                f"[BENCH] счётчиков {len(expected)}, расхождений с эталоном {len(mismatches)}, "
+                f"воркер {worker_sec:.2f} с на {len(rows)} событий"
+            )
+        finally:
+            await conn.execute("TRUNCATE funnels CASCADE;")
+            await conn.close()
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench funnels",
+        description="Счётчики воронок (summary/funnels.py) против эталона по сырым событиям.",
+    )
+    parser.add_argument("--sessions", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--clicks-per-minute", type=float, default=4.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pg-bin", default=None)
+    parser.add_argument("--pg-external", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    write_results("funnels", vars(args).copy(), results, args.output)
+
+    if any(r.get("mismatches") for r in results):
+        raise SystemExit(1)
@@ -0,0 +1,225 @@
+"""
+Асинхронный HTTP-драйвер нагрузки на POST /track.
+
+По умолчанию поднимает одноразовый PostgreSQL и API (`python -m app.serve`)
+в подпроцессе, прогоняет заранее сгенерированные батчи SDK
+с заданной конкуррентностью и пишет пропускную способность
+и перцентили задержек. С --url нагружает уже запущенный API.
+
+--workers 1,2,4,8 повторяет прогон для разного числа процессов API.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import asyncpg
+
+from bench.pg import env_for, temporary_postgres
+from bench.results import REPO_ROOT, write_results
+from bench.traffic import (
+    BATCH_FORMAT_SDK,
+    BATCH_FORMATS,
+    TrafficProfile,
+    batch_start_ts,
+    iter_sessions,
+    session_batches,
+)
+
+
+def build_payloads(sessions: int, seed: int, batch_format: str = BATCH_FORMAT_SDK) -> List[bytes]:
+    """
+    Готовит тела запросов заранее, чтобы сериализация не влияла на замер.
+    Батчи упорядочены по времени, как их прислали бы браузеры.
+    По умолчанию — формат sdk/sdk.js, как у реального трафика.
+    """
+    profile = TrafficProfile()
+    batches: List[Dict[str, Any]] = []
+
+    for session in iter_sessions(sessions, profile, seed=seed):
+        batches.extend(session_batches(session, profile, batch_format))
+
+    batches.sort(key=batch_start_ts)
+    return [json.dumps(b, ensure_ascii=False).encode("utf-8") for b in batches]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def drive(
+    url: str,
+    payloads: List[bytes],
+    concurrency: int,
+) -> Dict[str, Any]:
+    """
+    Отправляет все payloads на url из concurrency параллельных «клиентов».
+    """
+    latencies: List[float] = []
+    errors = 0
+    events_sent = 0
+    next_index = 0
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    # SDK шлёт fetch/sendBeacon без preflight — text/plain
+    headers = {"Content-Type": "text/plain;charset=UTF-8"}
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def client() -> None:
+            nonlocal next_index, errors, events_sent
+            while next_index < len(payloads):
+                body = payloads[next_index]
+                next_index += 1
+
+                started = time.perf_counter()
+                try:
+                    async with session.post(url, data=body, headers=headers) as resp:
+                        data = await resp.json(content_type=None)
+                        if resp.status != 200 or data.get("status") != "ok":
+                            errors += 1
+                        else:
+                            events_sent += data.get("inserted", 0)
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(payloads),
+        "errors": errors,
+        "events_inserted": events_sent,
+        "seconds": elapsed,
+        "requests_per_sec": len(payloads) / elapsed if elapsed else 0.0,
+        "events_per_sec": events_sent / elapsed if elapsed else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+        "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def wait_for_api(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"API не поднялся за {timeout:.0f} с: {url}")
+            await asyncio.sleep(0.2)
+
+
+def start_api(params: Dict[str, str], port: int, workers: int) -> subprocess.Popen:
+    """
+    Запускает API (python -m app.serve) в подпроцессе против указанной базы.
+    """
+    env = env_for(params)
+    env.update(
+        {
+            "API_HOST": "127.0.0.1",
+            "API_PORT": str(port),
+            "API_WORKERS": str(workers),
+        }
+    )
+    return subprocess.Popen([sys.executable, "-m", "app.serve"], cwd=REPO_ROOT, env=env)
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    payloads = build_payloads(args.sessions, args.seed, args.format)
+    print(f"[BENCH] Подготовлено батчей ({args.format}): {len(payloads)}")
+
+    results: List[Dict[str, Any]] = []
+
+    if args.url:
+        for concurrency in args.concurrency:
+            result = await drive(args.url, payloads, concurrency)
+            result["name"] = f"track_c{concurrency}"
+            results.append(result)
+        return results
+
+    async with temporary_postgres(
+        args.pg_bin, args.pg_external, {"max_connections": "200"}
+    ) as params:
+        for workers in args.workers:
+            process = start_api(params, args.port, workers)
+            base_url = f"http://127.0.0.1:{args.port}"
+            try:
+                await wait_for_api(f"{base_url}/track")
+
+                for concurrency in args.concurrency:
+                    conn = await asyncpg.connect(**params)
+                    try:
+                        await conn.execute("TRUNCATE events;")
+                    finally:
+                        await conn.close()
+
+                    result = await drive(f"{base_url}/track", payloads, concurrency)
+                    result["name"] = f"track_w{workers}_c{concurrency}"
+                    result["workers"] = workers
+                    result["concurrency"] = concurrency
+                    results.append(result)
+                    print(
+                        f"[BENCH] {result['name']}: {result['requests_per_sec']:,.0f} req/s, "
+                        f"p99 {result['latency_p99_ms']:.1f} мс, ошибок {result['errors']}"
+                    )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench load",
+        description="Нагрузка на POST /track синтетическими батчами SDK.",
+    )
+    parser.add_argument("--sessions", type=int, default=2_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--format",
+        choices=BATCH_FORMATS,
+        default=BATCH_FORMAT_SDK,
+        help="формат тела: sdk (sdk/sdk.js) или compact",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1, 16, 64],
+        help="уровни конкуррентности через запятую",
+    )
+    parser.add_argument(
+        "--workers",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1],
+        help="число процессов API через запятую (например 1,2,4,8)",
+    )
+    parser.add_argument("--url", default=None, help="нагружать уже запущенный API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--pg-bin", default=None)
+    parser.add_argument("--pg-external", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+
+    params = vars(args).copy()
+    write_results("load", params, results, args.output)
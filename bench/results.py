@@ -0,0 +1,122 @@
+"""
+Запись и сравнение результатов бенчмарков (JSON).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT: Path = Path(__file__).resolve().parent.parent
+RESULTS_DIR: Path = Path(__file__).resolve().parent / "results"
+
+
+def git_commit() -> Optional[str]:
+    """
+    Возвращает hash текущего коммита (или None, если git недоступен).
+    """
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def write_results(
+    suite: str,
+    params: Dict[str, Any],
+    results: List[Dict[str, Any]],
+    output: Optional[str] = None,
+) -> Path:
+    """
+    Сохраняет результаты прогона вместе с описанием окружения.
+
+    Args:
+        suite: имя набора (aggregator, load, worker ...).
+        params: параметры запуска.
+        results: список измерений; у каждого есть ключ "name".
+        output: явный путь к файлу (иначе bench/results/<suite>-<время>.json).
+
+    Returns:
+        Path: путь к записанному файлу.
+    """
+    started_at = datetime.now(tz=timezone.utc)
+
+    if output:
+        path = Path(output)
+    else:
+        stamp = started_at.strftime("%Y%m%dT%H%M%SZ")
+        path = RESULTS_DIR / f"{suite}-{stamp}.json"
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    document = {
+        "suite": suite,
+        "created_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+        "results": results,
+    }
+
+    path.write_text(
+        json.dumps(document, ensure_ascii=False, indent=2, default=str),
+        encoding="utf-8",
+    )
+    print(f"[BENCH] Результаты записаны: {path}")
+    return path
+
+
+def compare_results(baseline_path: str, candidate_path: str) -> None:
+    """
+    Печатает изменение числовых метрик между двумя прогонами.
+    Измерения сопоставляются по ключу "name".
+    """
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    candidate = json.loads(Path(candidate_path).read_text(encoding="utf-8"))
+
+    if baseline.get("suite") != candidate.get("suite"):
+        print(
+            f"[WARN] Разные наборы: {baseline.get('suite')} vs {candidate.get('suite')}"
+        )
+
+    base_by_name = {r["name"]: r for r in baseline.get("results", [])}
+
+    print(
+        f"baseline:  {baseline.get('git_commit')} ({baseline.get('created_at')})\n"
+        f"candidate: {candidate.get('git_commit')} ({candidate.get('created_at')})"
+    )
+
+    for result in candidate.get("results", []):
+        name = result["name"]
+        base = base_by_name.get(name)
+        if base is None:
+            print(f"\n{name}: нет в baseline")
+            continue
+
+        print(f"\n{name}")
+        for key, value in result.items():
+            old = base.get(key)
+            if key == "name" or isinstance(value, bool):
+                continue
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            if old:
+                delta = f"{(value - old) / old * 100:+.1f}%"
+            else:
+                delta = "n/a"
+            print(f"  {key:<24} {old:>14.4f} -> {value:>14.4f}  {delta}")
@@ -0,0 +1,144 @@
+"""
+Число запросов SDK на просмотр страницы.
+
+Настоящий sdk/sdk.js выполняется в node (bench/sdk_sim.js) на
+виртуальных часах: скролл, клики и уход вкладки в фон берутся
+из генератора трафика, в конце просмотра — pagehide.
+Считаются fetch, sendBeacon и CORS preflight (OPTIONS),
+а также события, отложенные в localStorage до следующего визита.
+
+Сравнение с прошлой версией SDK:
+    python -m bench sdk --baseline <git-ref>
+
+Таймеры скрытой вкладки не замедляются (в браузере они
+срабатывают реже), так что для старого SDK оценка снизу.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from bench.results import REPO_ROOT, write_results
+from bench.traffic import TrafficProfile, iter_sessions
+
+SIMULATOR: Path = Path(__file__).resolve().parent / "sdk_sim.js"
+SDK_PATH: Path = REPO_ROOT / "sdk" / "sdk.js"
+
+# вкладка уходит в фон вскоре после последнего события визита
+HIDE_AFTER_MS = 5_000
+
+
+def session_pageview(session: Dict[str, Any], profile: TrafficProfile) -> Dict[str, Any]:
+    """
+    Сессия генератора трафика как один просмотр страницы:
+    паузы между визитами — время, когда вкладка скрыта.
+    """
+    events = session["events"]
+    start = events[0]["ts"]
+    actions: List[Dict[str, Any]] = []
+
+    previous_ts = start
+    for event in events:
+        gap = event["ts"] - previous_ts
+        if gap > profile.min_idle_gap_sec * 1000:
+            actions.append({"t": previous_ts - start + HIDE_AFTER_MS, "kind": "hide"})
+            actions.append({"t": event["ts"] - start, "kind": "show"})
+
+        if event["et"] == "hb":
+            actions.append({"t": event["ts"] - start, "kind": "scroll", "depth": event["p"]["sp"]})
+        else:
+            actions.append({"t": event["ts"] - start, "kind": "click"})
+        previous_ts = event["ts"]
+
+    return {
+        "start": start,
+        "duration": events[-1]["ts"] - start + profile.heartbeat_interval_ms,
+        "actions": actions,
+    }
+
+
+def run_sdk(label: str, sdk_path: Path, pageviews: List[Dict[str, Any]], node: str) -> Dict[str, Any]:
+    out = subprocess.run(
+        [node, str(SIMULATOR)],
+        input=json.dumps({"sdk": str(sdk_path), "pageviews": pageviews}),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    totals = json.loads(out.stdout)
+    views = max(totals["pageviews"], 1)
+    requests = totals["fetches"] + totals["beacons"] + totals["preflights"]
+
+    return {
+        "name": f"sdk_{label}",
+        **totals,
+        "requests": requests,
+        "requests_per_pageview": requests / views,
+        "events_per_request": totals["events_sent"] / requests if requests else 0.0,
+        "bytes_per_pageview": totals["bytes"] / views,
+        "deferred_per_pageview": totals["events_deferred"] / views,
+    }
+
+
+def _sdk_at_ref(ref: str, directory: Path) -> Path:
+    source = subprocess.run(
+        ["git", "show", f"{ref}:sdk/sdk.js"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    path = directory / "sdk-baseline.js"
+    path.write_text(source, encoding="utf-8")
+    return path
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench sdk",
+        description="Запросы SDK на просмотр страницы (sdk/sdk.js в node).",
+    )
+    parser.add_argument("--pageviews", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=None, help="git-ref с версией SDK для сравнения")
+    parser.add_argument("--node", default=shutil.which("node") or "node")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    profile = TrafficProfile()
+    pageviews = [
+        session_pageview(session, profile)
+        for session in iter_sessions(args.pageviews, profile, seed=args.seed)
+    ]
+
+    variants = [("current", SDK_PATH)]
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory(prefix="bench-sdk-") as tmp:
+        if args.baseline:
+            variants.insert(0, ("baseline", _sdk_at_ref(args.baseline, Path(tmp))))
+
+        for label, path in variants:
+            result = run_sdk(label, path, pageviews, args.node)
+            results.append(result)
+            print(
+                f"[BENCH] {result['name']}: {result['requests_per_pageview']:.2f} запросов/просмотр "
+                f"(fetch {result['fetches']}, beacon {result['beacons']}, "
+                f"preflight {result['preflights']}), "
+                f"{result['events_per_request']:.1f} событий/запрос, "
+                f"{result['bytes_per_pageview'] / 1024:.1f} КБ/просмотр, "
+                f"отложено до след. визита {result['deferred_per_pageview']:.2f} событий/просмотр"
+            )
+
+    write_results(
+        "sdk",
+        {"pageviews": args.pageviews, "seed": args.seed, "baseline": args.baseline},
+        results,
+        args.output,
+    )
@@ -0,0 +1,196 @@
+// Прогон sdk/sdk.js на виртуальных часах (node, без браузера).
+//
+// stdin:  {"sdk": "<путь к sdk.js>", "pageviews": [{start, duration, actions: [...]}]}
+//         action: {t, kind: "scroll"|"click"|"hide"|"show", depth}
+//         t — мс от начала просмотра страницы
+// stdout: счётчики запросов и событий (JSON)
+//
+// Запускается из bench/sdk_requests.py.
+
+"use strict";
+
+const fs = require("fs");
+const vm = require("vm");
+
+// Starlette CORSMiddleware: Access-Control-Max-Age по умолчанию
+const PREFLIGHT_MAX_AGE_MS = 600000;
+const BEACON_QUOTA_BYTES = 65536;
+
+// микрозадачи (then у fetch) выполняются между шагами часов
+function drain() {
+    return new Promise(function (resolve) { setImmediate(resolve); });
+}
+
+async function simulate(source, view, totals) {
+    let now = view.start;
+    let timerSeq = 0;
+    const timers = new Map();
+    const listeners = {};
+    const store = {
+        // посетитель вернулся в пределах SESSION_TIMEOUT_MS
+        ai_scan_session: JSON.stringify({ id: "s-" + view.start, start: now, lastActivity: now }),
+    };
+    let preflightUntil = -1;
+    let hidden = false;
+
+    const scrollEl = { scrollTop: 0, scrollHeight: 10800, clientHeight: 800 };
+
+    function addTimer(fn, ms, repeat) {
+        const id = ++timerSeq;
+        timers.set(id, { fn: fn, at: now + Math.max(ms || 0, 0), every: repeat ? Math.max(ms, 1) : 0 });
+        return id;
+    }
+
+    function countEvents(body) {
+        try {
+            return JSON.parse(body).events.length;
+        } catch (e) {
+            return 0;
+        }
+    }
+
+    function on(target) {
+        return function (type, fn) {
+            (listeners[target + type] = listeners[target + type] || []).push(fn);
+        };
+    }
+
+    function fire(name, arg) {
+        (listeners[name] || []).forEach(function (fn) { fn(arg || {}); });
+    }
+
+    const FakeDate = function () {};
+    FakeDate.now = function () { return now; };
+
+    const ctx = {
+        window: {
+            innerWidth: 1280,
+            innerHeight: 800,
+            screen: { width: 1920, height: 1080 },
+            pageYOffset: 0,
+            addEventListener: on("w:"),
+            aiScanConfig: { apiUrl: "https://ai-scan.test/track" },
+        },
+        document: {
+            addEventListener: on("d:"),
+            scrollingElement: scrollEl,
+            documentElement: scrollEl,
+            body: {},
+            get hidden() { return hidden; },
+            get visibilityState() { return hidden ? "hidden" : "visible"; },
+        },
+        localStorage: {
+            getItem: function (k) { return k in store ? store[k] : null; },
+            setItem: function (k, v) { store[k] = String(v); },
+            removeItem: function (k) { delete store[k]; },
+        },
+        navigator: {
+            userAgent: "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/124.0",
+            onLine: true,
+            sendBeacon: function (url, body) {
+                if (body.length > BEACON_QUOTA_BYTES) return false;
+                totals.beacons += 1;
+                totals.events_sent += countEvents(body);
+                totals.bytes += body.length;
+                return true;
+            },
+        },
+        location: { hostname: "bench-site.example" },
+        fetch: function (url, init) {
+            const headers = init.headers || {};
+            const simple = !headers["Content-Type"] || headers["Content-Type"].indexOf("text/plain") === 0;
+            if (!simple && now >= preflightUntil) {
+                totals.preflights += 1;
+                preflightUntil = now + PREFLIGHT_MAX_AGE_MS;
+            }
+            totals.fetches += 1;
+            totals.events_sent += countEvents(init.body);
+            totals.bytes += init.body.length;
+            return Promise.resolve({ ok: true, status: 200 });
+        },
+        setTimeout: function (fn, ms) { return addTimer(fn, ms, false); },
+        setInterval: function (fn, ms) { return addTimer(fn, ms, true); },
+        clearTimeout: function (id) { timers.delete(id); },
+        clearInterval: function (id) { timers.delete(id); },
+        Date: FakeDate,
+        Math: Math,
+        JSON: JSON,
+        Array: Array,
+        Object: Object,
+        Promise: Promise,
+        Error: Error,
+    };
+
+    vm.createContext(ctx);
+    vm.runInContext(source, ctx);
+
+    const button = {
+        tagName: "BUTTON", innerText: "Купить", id: "buy", className: "t-btn",
+        nodeType: 1, parentElement: null,
+    };
+
+    const end = view.start + view.duration;
+    const actions = view.actions.slice().sort(function (a, b) { return a.t - b.t; });
+    let next = 0;
+
+    for (;;) {
+        let timerId = null;
+        let timerAt = Infinity;
+        timers.forEach(function (timer, id) {
+            if (timer.at < timerAt) {
+                timerAt = timer.at;
+                timerId = id;
+            }
+        });
+        const actionAt = next < actions.length ? view.start + actions[next].t : Infinity;
+        const at = Math.min(timerAt, actionAt);
+        if (at > end) break;
+
+        now = at;
+        if (actionAt <= timerAt) {
+            const action = actions[next++];
+            if (action.kind === "scroll") {
+                scrollEl.scrollTop = Math.round((action.depth / 100) * (scrollEl.scrollHeight - scrollEl.clientHeight));
+            } else if (action.kind === "click") {
+                fire("d:click", { target: button });
+            } else if (action.kind === "hide" || action.kind === "show") {
+                hidden = action.kind === "hide";
+                fire("d:visibilitychange");
+            }
+        } else {
+            const timer = timers.get(timerId);
+            if (timer.every) timer.at += timer.every;
+            else timers.delete(timerId);
+            timer.fn();
+        }
+        await drain();
+    }
+
+    // уход со страницы
+    now = end;
+    if (!hidden) {
+        hidden = true;
+        fire("d:visibilitychange");
+    }
+    fire("w:pagehide");
+    fire("w:beforeunload");
+
+    try {
+        totals.events_deferred += JSON.parse(store.ai_scan_offline_queue || "[]").length;
+    } catch (e) {}
+}
+
+async function main() {
+    const input = JSON.parse(fs.readFileSync(0, "utf8"));
+    const source = fs.readFileSync(input.sdk, "utf8");
+    const totals = { pageviews: 0, fetches: 0, beacons: 0, preflights: 0, events_sent: 0, events_deferred: 0, bytes: 0 };
+
+    for (const view of input.pageviews) {
+        totals.pageviews += 1;
+        await simulate(source, view, totals);
+    }
+
+    process.stdout.write(JSON.stringify(totals) + "\n");
+}
+
+main();
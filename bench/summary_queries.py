@@ -0,0 +1,254 @@
+"""
+Запросы дашборда к session_summary: до и после секционирования.
+
+На одних и тех же синтетических данных (по умолчанию 5M визитов
+за 24 месяца, распределение по сайтам с «тяжёлым хвостом») сравниваются:
+- legacy — прежняя таблица: только первичный ключ по id;
+- partitioned — схема db/create_tables.py: месячные секции,
+  BRIN по visit_start, (site_url, visit_start) INCLUDE (...).
+
+Каждый запрос выполняется через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON);
+в результаты попадают время выполнения, прочитанные буферы,
+число просканированных секций и типы узлов плана.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import asyncpg
+
+from bench.pg import create_tables_module, temporary_postgres
+from bench.results import write_results
+
+LEGACY_TABLE = "bench_legacy.session_summary"
+PARTITIONED_TABLE = "public.session_summary"
+
+# сайт с наибольшим трафиком (распределение — power(random(), 3))
+TOP_SITE = "bench-site-0"
+
+# имя → (SQL, нужен ли сайт); $1..$2 — период, $3 — site_url
+QUERIES: Dict[str, Tuple[str, bool]] = {
+    # посещаемость сайта по дням
+    "site_daily": (
+        """
+        SELECT date_trunc('day', visit_start) AS day,
+               count(*) AS visits,
+               avg(duration_seconds) AS avg_duration,
+               avg(max_scroll_depth) AS avg_scroll,
+               sum(total_click_events) AS clicks
+        FROM {table}
+        WHERE site_url = $3 AND visit_start >= $1 AND visit_start < $2
+        GROUP BY 1
+        ORDER BY 1
+        """,
+        True,
+    ),
+    # разбивка по устройствам
+    "site_devices": (
+        """
+        SELECT device_type, count(*) AS visits, avg(duration_seconds) AS avg_duration
+        FROM {table}
+        WHERE site_url = $3 AND visit_start >= $1 AND visit_start < $2
+        GROUP BY 1
+        """,
+        True,
+    ),
+    # все сайты за период (админка)
+    "all_sites_total": (
+        """
+        SELECT count(*) AS visits, count(DISTINCT site_url) AS sites
+        FROM {table}
+        WHERE visit_start >= $1 AND visit_start < $2
+        """,
+        False,
+    ),
+}
+
+PERIODS_DAYS: List[int] = [7, 90]
+
+
+async def load_data(conn, rows: int, sites: int, months: int, end: datetime) -> None:
+    """
+    Генерирует визиты в legacy-таблицу (в порядке времени, как их пишет
+    воркер) и копирует те же строки в секционированную.
+    """
+    start = end - timedelta(days=30 * months)
+    span_sec = (end - start).total_seconds()
+
+    await conn.execute("CREATE SCHEMA IF NOT EXISTS bench_legacy")
+    await conn.execute(f"DROP TABLE IF EXISTS {LEGACY_TABLE}")
+    await conn.execute(
+        f"CREATE TABLE {LEGACY_TABLE} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS)"
+    )
+    await conn.execute(f"ALTER TABLE {LEGACY_TABLE} ADD PRIMARY KEY (id)")
+
+    started = time.perf_counter()
+    await conn.execute(
+        f"""
+        INSERT INTO {LEGACY_TABLE} (
+            site_url, uid, session_id, visit_start, visit_end, duration_seconds,
+            device_type, os, browser, max_scroll_depth, final_scroll_depth,
+            scroll_stops, click_buttons, total_scroll_events, total_click_events
+        )
+        SELECT
+            'bench-site-' || floor($2::int * power(random(), 3))::int,
+            'u' || (random() * 1e12)::bigint,
+            's' || i,
+            ts,
+            ts + d * interval '1 second',
+            d,
+            (ARRAY['desktop', 'mobile', 'tablet'])[1 + floor(random() * 2.4)::int],
+            (ARRAY['Windows', 'macOS', 'Android', 'iOS'])[1 + floor(random() * 4)::int],
+            (ARRAY['Chrome', 'Safari', 'Firefox', 'Edge'])[1 + floor(random() * 4)::int],
+            depth,
+            depth,
+            jsonb_build_array(
+                jsonb_build_object('t', 15000, 'depth', depth / 2, 'stop_ms', 30000),
+                jsonb_build_object('t', 45000, 'depth', depth, 'stop_ms', 15000)
+            ),
+            jsonb_build_array(jsonb_build_object('t', 20000, 'element', 1 + floor(random() * 20)::int)),
+            d / 15,
+            floor(random() * 3)::int
+        FROM (
+            SELECT
+                i,
+                $3::timestamptz + (i * $4::float8 / $1) * interval '1 second'
+                    + random() * interval '10 minutes' AS ts,
+                floor(random() * 600)::int AS d,
+                floor(random() * 101)::int AS depth
+            FROM generate_series(1, $1) AS i
+        ) g
+        """,
+        rows,
+        sites,
+        start,
+        span_sec,
+    )
+    print(f"[BENCH] {rows:,} визитов сгенерировано за {time.perf_counter() - started:.1f} с")
+
+    create_tables = create_tables_module()
+    async with conn.transaction():
+        await create_tables.ensure_summary_partitions(
+            conn, create_tables.month_of(start), create_tables.month_of(end)
+        )
+
+    started = time.perf_counter()
+    await conn.execute(f"TRUNCATE {PARTITIONED_TABLE}")
+    await conn.execute(f"INSERT INTO {PARTITIONED_TABLE} SELECT * FROM {LEGACY_TABLE}")
+    print(f"[BENCH] Скопировано в секционированную таблицу за {time.perf_counter() - started:.1f} с")
+
+    # карта видимости нужна для index-only scan
+    await conn.execute(f"VACUUM ANALYZE {LEGACY_TABLE}")
+    await conn.execute(f"VACUUM ANALYZE {PARTITIONED_TABLE}")
+
+
+def _walk(node: Dict[str, Any]) -> List[Dict[str, Any]]:
+    nodes = [node]
+    for child in node.get("Plans", []):
+        nodes.extend(_walk(child))
+    return nodes
+
+
+def summarize_plan(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Главное из EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+    """
+    root = plan["Plan"]
+    nodes = _walk(root)
+    scans = [n for n in nodes if "Relation Name" in n]
+
+    return {
+        "execution_ms": plan["Execution Time"],
+        "planning_ms": plan["Planning Time"],
+        "shared_hit": root.get("Shared Hit Blocks", 0),
+        "shared_read": root.get("Shared Read Blocks", 0),
+        "relations_scanned": len({n["Relation Name"] for n in scans}),
+        "scan_nodes": sorted({n["Node Type"] for n in scans}),
+        "heap_fetches": sum(n.get("Heap Fetches", 0) for n in scans),
+    }
+
+
+async def explain(conn, sql: str, args: List[Any], repeat: int) -> Dict[str, Any]:
+    """
+    Прогрев + repeat замеров; берётся медиана времени выполнения.
+    """
+    runs = []
+    for _ in range(repeat + 1):
+        raw = await conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}", *args)
+        plan = json.loads(raw)[0] if isinstance(raw, str) else raw[0]
+        runs.append(summarize_plan(plan))
+
+    result = runs[-1]
+    result["execution_ms"] = statistics.median(r["execution_ms"] for r in runs[1:])
+    return result
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    end = datetime.now(tz=timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    async with temporary_postgres(args.pg_bin, args.pg_external) as params:
+        conn = await asyncpg.connect(**params)
+        try:
+            await load_data(conn, args.rows, args.sites, args.months, end)
+
+            for days in PERIODS_DAYS:
+                for query_name, (template, per_site) in QUERIES.items():
+                    query_args = [end - timedelta(days=days), end]
+                    if per_site:
+                        query_args.append(TOP_SITE)
+
+                    by_table = {}
+                    for label, table in (("legacy", LEGACY_TABLE), ("partitioned", PARTITIONED_TABLE)):
+                        result = await explain(
+                            conn,
+                            template.format(table=table),
+                            query_args,
+                            args.repeat,
+                        )
+                        result.update({"name": f"{query_name}_{days}d_{label}", "days": days})
+                        by_table[label] = result
+                        results.append(result)
+
+                    legacy, partitioned = by_table["legacy"], by_table["partitioned"]
+                    speedup = legacy["execution_ms"] / max(partitioned["execution_ms"], 1e-3)
+                    print(
+                        f"[BENCH] {query_name} {days}d: "
+                        f"legacy {legacy['execution_ms']:.1f} мс "
+                        f"({legacy['shared_hit'] + legacy['shared_read']} буферов, "
+                        f"{'/'.join(legacy['scan_nodes'])}) -> "
+                        f"partitioned {partitioned['execution_ms']:.1f} мс "
+                        f"({partitioned['shared_hit'] + partitioned['shared_read']} буферов, "
+                        f"секций {partitioned['relations_scanned']}, "
+                        f"{'/'.join(partitioned['scan_nodes'])}), x{speedup:.1f}"
+                    )
+        finally:
+            await conn.execute("DROP SCHEMA IF EXISTS bench_legacy CASCADE")
+            await conn.close()
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench summary",
+        description="Запросы дашборда к session_summary: legacy vs секционирование.",
+    )
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--sites", type=int, default=200)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pg-bin", default=None)
+    parser.add_argument("--pg-external", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    write_results("summary", vars(args).copy(), results, args.output)
@@ -0,0 +1,385 @@
+"""
+Генератор синтетического трафика SDK.
+
+Эмулирует поведение посетителей так, как его видит POST /track:
+- сессии с heartbeat-событиями (et="hb") и глубиной скролла,
+- клики по кнопкам (et="click") и отправку форм после клика
+  по кнопке формы (et="form", по умолчанию выключено),
+- паузы бездействия внутри сессии (вкладка в фоне), в том числе
+  длиннее IDLE_TIMEOUT_SEC — они разбивают сессию на несколько визитов,
+- упаковку событий в батчи (интервал + размер батча) в формате
+  sdk/sdk.js ({site_url, session_id, device, events}) или в компактном
+  формате {site, sid, ev}, который /track тоже принимает.
+
+Генерация детерминирована: одинаковый seed даёт одинаковый трафик.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+# фиксированная точка отсчёта: трафик воспроизводим побайтно
+BASE_TS_MS: int = int(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+USER_AGENTS: List[str] = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Mobile Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+]
+
+BUTTONS: List[Dict[str, Optional[str]]] = [
+    {"button_text": "Купить", "id": "buy", "cls": "t-btn t-btn_md"},
+    {"button_text": "Оставить заявку", "id": None, "cls": "t-btn"},
+    {"button_text": "Подробнее", "id": None, "cls": "btn btn-link"},
+    {"button_text": "Записаться", "id": "signup", "cls": "t-submit"},
+    {"button_text": "Позвонить", "id": None, "cls": "button call"},
+]
+
+# element_id кнопки в site_structure (в бенчмарке — общий для всех сайтов)
+BUTTON_ELEMENT_IDS: Dict[Optional[str], int] = {
+    button["button_text"]: index + 1 for index, button in enumerate(BUTTONS)
+}
+
+# кнопки, открывающие форму
+FORM_BUTTONS: List[str] = ["Оставить заявку", "Записаться"]
+
+
+# форматы тела POST /track
+BATCH_FORMAT_SDK = "sdk"
+BATCH_FORMAT_COMPACT = "compact"
+BATCH_FORMATS: List[str] = [BATCH_FORMAT_SDK, BATCH_FORMAT_COMPACT]
+
+
+def _sdk_slug(text: str, fallback: str) -> str:
+    slug = re.sub(r"\s+", "_", text)
+    return re.sub(r"[^a-zA-Z0-9А-Яа-я_]", "", slug)[:40] or fallback
+
+
+def form_slug(button_text: str) -> str:
+    """
+    slug формы так же, как его строит sdk/sdk.js.
+    """
+    return _sdk_slug(button_text, "submit")
+
+
+def sdk_device(user_agent: str) -> Dict[str, Optional[str]]:
+    """
+    Устройство по user-agent — порт getDeviceInfo() из sdk/sdk.js.
+    """
+    ua = user_agent.lower()
+
+    device_type = "desktop"
+    if re.search(r"mobile|iphone|ipod|android.*mobile", ua):
+        device_type = "mobile"
+    elif re.search(r"ipad|tablet", ua):
+        device_type = "tablet"
+
+    os_name = "Other"
+    if "windows" in ua:
+        os_name = "Windows"
+    elif "mac os x" in ua or "macintosh" in ua:
+        os_name = "macOS"
+    elif "android" in ua:
+        os_name = "Android"
+    elif "iphone" in ua or "ipad" in ua or "ipod" in ua:
+        os_name = "iOS"
+    elif "linux" in ua:
+        os_name = "Linux"
+
+    browser = "Other"
+    if "edg/" in ua:
+        browser = "Edge"
+    elif "opr/" in ua or "opera" in ua:
+        browser = "Opera"
+    elif "chrome" in ua:
+        browser = "Chrome"
+    elif "safari" in ua and "chromium" not in ua:
+        browser = "Safari"
+    elif "firefox" in ua:
+        browser = "Firefox"
+
+    return {"device_type": device_type, "os": os_name, "browser": browser, "user_agent": user_agent}
+
+
+def sdk_event(event: Dict[str, Any], session_id: str, index: int) -> Dict[str, Any]:
+    """
+    Событие генератора в виде buildEvent() из sdk/sdk.js.
+    """
+    p = event["p"]
+    if event["et"] == "hb":
+        event_type, payload = "heartbeat", {"scroll_percent": p["sp"]}
+    elif event["et"] == "click":
+        text = p.get("button_text") or ""
+        event_type = "click_button:" + _sdk_slug(text, "button")
+        payload = {"id": p.get("id"), "class_name": p.get("cls"), "text": text}
+    else:
+        event_type, payload = "form_submit_success:" + p["slug"], {"button_text": None}
+
+    return {
+        "event_id": f"{session_id}-{index}",
+        "event_type": event_type,
+        "ts": event["ts"],
+        "session_id": session_id,
+        "payload": payload,
+    }
+
+
+def batch_start_ts(batch: Dict[str, Any]) -> int:
+    """
+    Время первого события батча (любого формата).
+    """
+    events = batch["events"] if "events" in batch else batch["ev"]
+    return events[0]["ts"]
+
+
+@dataclass
+class TrafficProfile:
+    """
+    Параметры поведения посетителей и SDK.
+    """
+
+    sites: int = 3
+    heartbeat_interval_ms: int = 15_000
+    batch_interval_ms: int = 2_000
+    batch_size: int = 20
+    mean_visit_sec: float = 120.0
+    clicks_per_minute: float = 1.0
+    # доля кликов по кнопкам формы, после которых форма отправлена
+    form_submit_probability: float = 0.0
+    idle_gap_probability: float = 0.15
+    min_idle_gap_sec: int = 360
+    max_idle_gap_sec: int = 1_800
+    max_visits_per_session: int = 3
+
+
+def _site_url(index: int) -> str:
+    return f"bench-site-{index}.example"
+
+
+def _generate_visit(
+    rng: random.Random,
+    profile: TrafficProfile,
+    start_ms: int,
+) -> List[Dict[str, Any]]:
+    """
+    Генерирует события одного визита (без пауз дольше idle-таймаута).
+    """
+    duration_ms = int(rng.expovariate(1.0 / profile.mean_visit_sec) * 1000)
+    duration_ms = max(duration_ms, profile.heartbeat_interval_ms)
+
+    events: List[Dict[str, Any]] = []
+    scroll = rng.randint(0, 10)
+
+    # heartbeat: глубина скролла монотонно «дрейфует» вниз с остановками
+    ts = start_ms
+    while ts <= start_ms + duration_ms:
+        if rng.random() < 0.6:
+            scroll = min(100, scroll + rng.randint(0, 25))
+        events.append({"et": "hb", "ts": ts, "p": {"sp": scroll}})
+        ts += profile.heartbeat_interval_ms
+
+    # клики: пуассоновский поток
+    rate_per_ms = profile.clicks_per_minute / 60_000
+    if rate_per_ms > 0:
+        ts = start_ms + int(rng.expovariate(rate_per_ms))
+        while ts <= start_ms + duration_ms:
+            button = rng.choice(BUTTONS)
+            events.append({"et": "click", "ts": ts, "p": dict(button)})
+
+            if (
+                profile.form_submit_probability > 0
+                and button["button_text"] in FORM_BUTTONS
+                and rng.random() < profile.form_submit_probability
+            ):
+                submit_ts = ts + rng.randint(3_000, 30_000)
+                events.append({"et": "form", "ts": submit_ts, "p": {"slug": form_slug(button["button_text"])}})
+
+            ts += int(rng.expovariate(rate_per_ms)) + 1
+
+    events.sort(key=lambda e: e["ts"])
+    return events
+
+
+def generate_session(
+    rng: random.Random,
+    profile: TrafficProfile,
+    start_ms: int,
+    index: int,
+) -> Dict[str, Any]:
+    """
+    Генерирует одну SDK-сессию: один или несколько визитов,
+    разделённых паузами бездействия.
+
+    Returns:
+        dict: {site, uid, sid, ua, events: [{et, ts, p}, ...]}
+    """
+    events: List[Dict[str, Any]] = []
+    visit_start = start_ms
+
+    for _ in range(profile.max_visits_per_session):
+        visit = _generate_visit(rng, profile, visit_start)
+        events.extend(visit)
+
+        if rng.random() >= profile.idle_gap_probability:
+            break
+
+        gap_sec = rng.randint(profile.min_idle_gap_sec, profile.max_idle_gap_sec)
+        visit_start = visit[-1]["ts"] + gap_sec * 1000
+
+    return {
+        "site": _site_url(index % max(profile.sites, 1)),
+        "uid": f"u{rng.getrandbits(48):012x}",
+        "sid": f"s{index:08d}-{rng.getrandbits(32):08x}",
+        "ua": rng.choice(USER_AGENTS),
+        "events": events,
+    }
+
+
+def iter_sessions(
+    count: int,
+    profile: Optional[TrafficProfile] = None,
+    seed: int = 42,
+    start_ms: Optional[int] = None,
+    spread_sec: int = 3_600,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Лениво выдаёт count сессий со стартами, равномерно
+    распределёнными на интервале spread_sec после start_ms.
+    """
+    profile = profile or TrafficProfile()
+    rng = random.Random(seed)
+
+    if start_ms is None:
+        start_ms = BASE_TS_MS
+
+    for index in range(count):
+        session_start = start_ms + rng.randint(0, spread_sec * 1000)
+        yield generate_session(rng, profile, session_start, index)
+
+
+def session_batches(
+    session: Dict[str, Any],
+    profile: Optional[TrafficProfile] = None,
+    batch_format: str = BATCH_FORMAT_SDK,
+) -> List[Dict[str, Any]]:
+    """
+    Упаковывает события сессии в тела запросов POST /track:
+    раз в batch_interval_ms, не более batch_size событий.
+    Правила упаковки задаёт профиль; формат тела — batch_format.
+    """
+    profile = profile or TrafficProfile()
+    batches: List[Dict[str, Any]] = []
+    device = sdk_device(session["ua"])
+
+    current: List[Dict[str, Any]] = []
+    window_end: Optional[int] = None
+
+    def flush() -> None:
+        if not current:
+            return
+        if batch_format == BATCH_FORMAT_COMPACT:
+            batches.append(
+                {
+                    "site": session["site"],
+                    "uid": session["uid"],
+                    "sid": session["sid"],
+                    "ua": session["ua"],
+                    "ev": [event for _, event in current],
+                }
+            )
+        else:
+            batches.append(
+                {
+                    "site_url": session["site"],
+                    "uid": session["uid"],
+                    "session_id": session["sid"],
+                    "device": device,
+                    "events": [sdk_event(event, session["sid"], i) for i, event in current],
+                }
+            )
+        current.clear()
+
+    for index, event in enumerate(session["events"]):
+        if window_end is None or event["ts"] >= window_end:
+            flush()
+            window_end = event["ts"] + profile.batch_interval_ms
+
+        current.append((index, event))
+
+        if len(current) >= profile.batch_size:
+            flush()
+
+    flush()
+    return batches
+
+
+# et компактного формата → events.event_type
+EVENT_TYPES: Dict[str, str] = {"hb": "scroll", "click": "click", "form": "form_submit"}
+
+
+def session_rows(session: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Переводит сессию в строки таблицы events — так же,
+    как это делает app/endpoints/track.track_batch.
+    """
+    rows: List[Dict[str, Any]] = []
+
+    for event in session["events"]:
+        p = event["p"]
+        row: Dict[str, Any] = {
+            "site_url": session["site"],
+            "uid": session["uid"],
+            "session_id": session["sid"],
+            "event_type": EVENT_TYPES[event["et"]],
+            "event_time": datetime.fromtimestamp(event["ts"] / 1000, tz=timezone.utc),
+            "scroll_position_percent": p.get("sp") if event["et"] == "hb" else None,
+            "element_id": (
+                BUTTON_ELEMENT_IDS.get(p.get("button_text")) if event["et"] == "click" else None
+            ),
+            "form_slug": p.get("slug") if event["et"] == "form" else None,
+            "device_type": None,
+            "os": None,
+            "browser": None,
+            "user_agent": session["ua"],
+        }
+        rows.append(row)
+
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    Печатает тела запросов POST /track в формате JSON Lines.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m bench traffic",
+        description="Синтетический трафик SDK (JSON Lines, одна строка = один батч).",
+    )
+    parser.add_argument("--sessions", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sites", type=int, default=TrafficProfile.sites)
+    parser.add_argument("--format", choices=BATCH_FORMATS, default=BATCH_FORMAT_SDK)
+    parser.add_argument("--profile", action="store_true", help="вывести профиль и выйти")
+    args = parser.parse_args(argv)
+
+    profile = TrafficProfile(sites=args.sites)
+
+    if args.profile:
+        print(json.dumps(asdict(profile), indent=2))
+        return
+
+    for session in iter_sessions(args.sessions, profile, seed=args.seed):
+        for batch in session_batches(session, profile, args.format):
+            sys.stdout.write(json.dumps(batch, ensure_ascii=False) + "\n")
@@ -0,0 +1,182 @@
+"""
+Время «догонки» summary-воркера.
+
+Заливает в events бэклог из N сессий (COPY), затем вызывает
+summary/worker.process_once, пока в events не останется сессий,
+и замеряет, сколько занял разбор всего бэклога.
+received_at = event_time: воркер считает сессию завершённой
+по времени получения последнего события.
+Архив пишется во временный каталог; после догонки сегменты
+сливаются (archive.compact) — замеряется и это.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import asyncpg
+
+from bench import add_summary_to_path
+from bench.pg import temporary_postgres
+from bench.results import write_results
+from bench.traffic import TrafficProfile, iter_sessions, session_rows
+
+EVENT_COLUMNS: List[str] = [
+    "site_url",
+    "uid",
+    "session_id",
+    "event_type",
+    "event_time",
+    "scroll_position_percent",
+    "element_id",
+    "form_slug",
+    "device_type",
+    "os",
+    "browser",
+    "user_agent",
+    "received_at",
+]
+
+
+async def load_backlog(params: Dict[str, str], sessions: int, seed: int) -> int:
+    """
+    Заливает бэклог сессий в events. Все визиты лежат в прошлом,
+    поэтому для воркера они уже завершены.
+
+    Returns:
+        int: число залитых событий.
+    """
+    start = datetime.now(tz=timezone.utc) - timedelta(days=2)
+    start_ms = int(start.timestamp() * 1000)
+
+    records = []
+    for session in iter_sessions(sessions, TrafficProfile(), seed=seed, start_ms=start_ms):
+        for row in session_rows(session):
+            row["received_at"] = row["event_time"]
+            records.append(tuple(row[c] for c in EVENT_COLUMNS))
+
+    conn = await asyncpg.connect(**params)
+    try:
+        await conn.execute("TRUNCATE events, session_summary;")
+        await conn.copy_records_to_table("events", records=records, columns=EVENT_COLUMNS)
+        await conn.execute("ANALYZE events;")
+    finally:
+        await conn.close()
+
+    return len(records)
+
+
+def _count_segments(archive_dir: str) -> int:
+    return sum(1 for _ in Path(archive_dir).glob("*/*/*.seg"))
+
+
+async def catch_up(params: Dict[str, str], archive_dir: str) -> Dict[str, Any]:
+    """
+    Прогоняет циклы воркера до опустошения events, затем сливает архив.
+    """
+    os.environ.update(
+        {
+            "POSTGRES_USER": params["user"],
+            "POSTGRES_PASSWORD": params["password"],
+            "POSTGRES_DB": params["database"],
+            "POSTGRES_HOST": params["host"],
+            "POSTGRES_PORT": params["port"],
+            "ARCHIVE_DIR": archive_dir,
+        }
+    )
+    add_summary_to_path()
+    import archive
+    import worker
+
+    # архив прошлого размера бэклога не должен попасть в замер
+    for child in Path(archive_dir).iterdir():
+        shutil.rmtree(child)
+
+    conn = await asyncpg.connect(**params)
+    try:
+        cycles = 0
+        started = time.perf_counter()
+        while True:
+            remaining = await conn.fetchval(
+                "SELECT count(DISTINCT session_id) FROM events WHERE session_id IS NOT NULL"
+            )
+            if not remaining:
+                break
+            await worker.process_once()
+            cycles += 1
+        elapsed = time.perf_counter() - started
+
+        summaries = await conn.fetchval("SELECT count(*) FROM session_summary")
+    finally:
+        await conn.close()
+
+    segments = _count_segments(archive_dir)
+    started = time.perf_counter()
+    archive.compact(date.max, root=archive_dir)
+    compact_sec = time.perf_counter() - started
+
+    return {
+        "cycles": cycles,
+        "seconds": elapsed,
+        "summaries": summaries,
+        "segments": segments,
+        "segments_compacted": _count_segments(archive_dir),
+        "compact_seconds": compact_sec,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+
+    with tempfile.TemporaryDirectory(prefix="bench-worker-archive-") as archive_dir:
+        async with temporary_postgres(args.pg_bin, args.pg_external) as params:
+            for sessions in args.sessions:
+                events = await load_backlog(params, sessions, args.seed)
+                result = await catch_up(params, archive_dir)
+                result.update(
+                    {
+                        "name": f"catchup_{sessions}",
+                        "sessions": sessions,
+                        "events": events,
+                        "sessions_per_sec": sessions / result["seconds"] if result["seconds"] else 0.0,
+                        "events_per_sec": events / result["seconds"] if result["seconds"] else 0.0,
+                    }
+                )
+                results.append(result)
+                print(
+                    f"[BENCH] {result['name']}: {events} событий за {result['seconds']:.2f} с "
+                    f"({result['sessions_per_sec']:,.0f} сессий/с); сегментов архива "
+                    f"{result['segments']} → {result['segments_compacted']} "
+                    f"за {result['compact_seconds']:.2f} с"
+                )
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m bench worker",
+        description="Время разбора бэклога summary-воркером.",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=lambda s: [int(x) for x in s.split(",")],
+        default=[1_000, 10_000],
+        help="размеры бэклога (в сессиях) через запятую",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--pg-bin", default=None)
+    parser.add_argument("--pg-external", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    write_results("worker", vars(args).copy(), results, args.output)
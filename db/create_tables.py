@@ -4,7 +4,11 @@
 Особенности:
 - читает SQL из db/tables.sql,
 - выполняет CREATE TABLE IF NOT EXISTS,
-- существующие таблицы НЕ изменяются и НЕ удаляются.
+- существующие таблицы НЕ изменяются и НЕ удаляются,
+  кроме session_summary: старая несекционированная таблица
+  переносится в секционированную (одной транзакцией),
+- создаёт месячные секции session_summary на год вперёд
+  (скрипт выполняется при каждом старте API).
 
 Запуск:
     uv run python db/create_tables.py
@@ -14,7 +18,8 @@ from __future__ import annotations
 
 import os
 import asyncio
-from typing import Optional
+from datetime import date, datetime, timezone
+from typing import List, Optional
 
 import asyncpg
 from asyncpg import Connection
@@ -34,6 +39,37 @@ DB_PORT: str = os.getenv("POSTGRES_PORT", "5432")
 # Путь к SQL-файлу
 TABLES_SQL_PATH: Path = Path(__file__).parent / "tables.sql"
 
+# Месячные секции session_summary: на сколько месяцев вперёд создавать
+# и насколько глубоко в прошлое при переносе старой таблицы
+# (визиты старше попадают в DEFAULT-секцию)
+SUMMARY_PARTITION_MONTHS_AHEAD: int = int(os.getenv("SUMMARY_PARTITION_MONTHS_AHEAD", "12"))
+SUMMARY_PARTITION_MONTHS_BACK: int = int(os.getenv("SUMMARY_PARTITION_MONTHS_BACK", "36"))
+
+LEGACY_SUMMARY_TABLE: str = "session_summary_unpartitioned"
+
+# все колонки session_summary — для переноса старой таблицы
+SESSION_SUMMARY_COLUMNS: List[str] = [
+    "id",
+    "site_url",
+    "uid",
+    "session_id",
+    "visit_start",
+    "visit_end",
+    "duration_seconds",
+    "country",
+    "city",
+    "device_type",
+    "os",
+    "browser",
+    "max_scroll_depth",
+    "final_scroll_depth",
+    "scroll_stops",
+    "click_buttons",
+    "total_scroll_events",
+    "total_click_events",
+    "created_at",
+]
+
 
 async def load_sql() -> str:
     """
@@ -62,6 +98,169 @@ async def connect_db() -> Connection:
     return conn
 
 
+def add_months(month: date, count: int) -> date:
+    """
+    Первое число месяца, отстоящего от month на count месяцев.
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_of(value: datetime) -> date:
+    value = value.astimezone(timezone.utc)
+    return date(value.year, value.month, 1)
+
+
+def summary_partition_name(month: date) -> str:
+    return f"session_summary_y{month.year:04d}m{month.month:02d}"
+
+
+async def detach_legacy_session_summary(conn: Connection) -> bool:
+    """
+    Если session_summary — обычная (несекционированная) таблица,
+    переименовывает её, освобождая имя для секционированной.
+
+    Returns:
+        bool: была ли старая таблица.
+    """
+    relkind: Optional[str] = await conn.fetchval(
+        "SELECT relkind::text FROM pg_class WHERE oid = to_regclass('session_summary')"
+    )
+    if relkind != "r":
+        return False
+
+    await conn.execute(f"ALTER TABLE session_summary RENAME TO {LEGACY_SUMMARY_TABLE}")
+    await conn.execute(
+        f"ALTER TABLE {LEGACY_SUMMARY_TABLE} "
+        f"RENAME CONSTRAINT session_summary_pkey TO {LEGACY_SUMMARY_TABLE}_pkey"
+    )
+    print(f"[INFO] session_summary переименована в {LEGACY_SUMMARY_TABLE} для переноса.")
+    return True
+
+
+async def ensure_summary_partition(conn: Connection, month: date) -> bool:
+    """
+    Создаёт секцию session_summary за месяц, если её ещё нет.
+    Визиты этого месяца, успевшие попасть в DEFAULT-секцию,
+    переносятся в новую секцию.
+
+    Returns:
+        bool: была ли секция создана.
+    """
+    name = summary_partition_name(month)
+    if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+        return False
+
+    start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    nxt = add_months(month, 1)
+    end = datetime(nxt.year, nxt.month, 1, tzinfo=timezone.utc)
+    bounds = f"FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+    in_default: bool = await conn.fetchval(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM session_summary_default
+            WHERE visit_start >= $1 AND visit_start < $2
+        )
+        """,
+        start,
+        end,
+    )
+
+    if not in_default:
+        await conn.execute(f"CREATE TABLE {name} PARTITION OF session_summary FOR VALUES {bounds}")
+        return True
+
+    # новая секция не может пересекаться со строками DEFAULT-секции
+    await conn.execute(f"CREATE TABLE {name} (LIKE session_summary INCLUDING DEFAULTS)")
+    await conn.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM session_summary_default
+            WHERE visit_start >= $1 AND visit_start < $2
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved;
+        """,
+        start,
+        end,
+    )
+    await conn.execute(f"ALTER TABLE session_summary ATTACH PARTITION {name} FOR VALUES {bounds}")
+    return True
+
+
+async def ensure_summary_partitions(conn: Connection, first_month: date, last_month: date) -> int:
+    """
+    Создаёт недостающие месячные секции first_month..last_month.
+
+    Returns:
+        int: число созданных секций.
+    """
+    created = 0
+    month = first_month
+    while month <= last_month:
+        if await ensure_summary_partition(conn, month):
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+async def copy_legacy_session_summary(conn: Connection) -> int:
+    """
+    Переносит строки старой таблицы в секционированную и удаляет её.
+
+    Returns:
+        int: число перенесённых строк.
+    """
+    columns = ", ".join(SESSION_SUMMARY_COLUMNS)
+    moved: int = await conn.fetchval(
+        f"""
+        WITH moved AS (
+            INSERT INTO session_summary ({columns})
+            SELECT {columns} FROM {LEGACY_SUMMARY_TABLE}
+            RETURNING 1
+        )
+        SELECT count(*) FROM moved;
+        """
+    )
+    await conn.execute(f"DROP TABLE {LEGACY_SUMMARY_TABLE}")
+    return moved
+
+
+async def apply_schema(conn: Connection, sql: str) -> None:
+    """
+    Применяет tables.sql и секционирование session_summary
+    одной транзакцией: при ошибке схема остаётся прежней.
+    """
+    this_month = month_of(datetime.now(tz=timezone.utc))
+    first_month = this_month
+
+    async with conn.transaction():
+        has_legacy = await detach_legacy_session_summary(conn)
+
+        await conn.execute(sql)
+
+        if has_legacy:
+            # визиты старше окна (и с часами клиента в 1970-м) уйдут в DEFAULT
+            back = add_months(this_month, -SUMMARY_PARTITION_MONTHS_BACK)
+            oldest = await conn.fetchval(
+                f"SELECT min(visit_start) FROM {LEGACY_SUMMARY_TABLE} WHERE visit_start >= $1",
+                datetime(back.year, back.month, 1, tzinfo=timezone.utc),
+            )
+            if oldest is not None:
+                first_month = min(month_of(oldest), this_month)
+
+        created = await ensure_summary_partitions(
+            conn, first_month, add_months(this_month, SUMMARY_PARTITION_MONTHS_AHEAD)
+        )
+        if created:
+            print(f"[INFO] Создано секций session_summary: {created}")
+
+        if has_legacy:
+            moved = await copy_legacy_session_summary(conn)
+            print(f"[INFO] Перенесено визитов в секционированную session_summary: {moved}")
+
+
 async def create_tables() -> None:
     """
     Выполняет SQL-скрипт создания таблиц.
@@ -75,7 +274,7 @@ async def create_tables() -> None:
         sql: str = await load_sql()
         print(f"[INFO] Загружен SQL-файл: {TABLES_SQL_PATH}")
 
-        await conn.execute(sql)
+        await apply_schema(conn, sql)
         print("[INFO] Таблицы созданы (или уже существовали).")
 
     finally:
@@ -43,6 +43,19 @@ CREATE TABLE IF NOT EXISTS sites (
     is_active BOOLEAN NOT NULL DEFAULT TRUE
 );
 
+-- Настройки SDK сайта, подставляются в загрузчик /sdk.js:
+-- {"batch_size": 20, "heartbeat_interval_ms": 15000, "sample_rate": 1.0}
+ALTER TABLE sites ADD COLUMN IF NOT EXISTS sdk_config JSONB;
+
+-- только JSON-объект; NOT VALID — старые строки не перепроверяются
+-- (их отбрасывает app/sdk_bundle.site_config)
+DO $$
+BEGIN
+    ALTER TABLE sites ADD CONSTRAINT sites_sdk_config_object
+        CHECK (jsonb_typeof(sdk_config) = 'object') NOT VALID;
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+
 -- SITE STRUCTURE
 CREATE TABLE IF NOT EXISTS site_structure (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -57,6 +70,20 @@ CREATE TABLE IF NOT EXISTS site_structure (
     last_seen TIMESTAMPTZ DEFAULT NOW()
 );
 
+-- Словарь кликнутых элементов (app/elements.py): events и
+-- session_summary.click_buttons хранят element_id вместо строк кнопки
+ALTER TABLE site_structure ADD COLUMN IF NOT EXISTS element_id BIGINT GENERATED BY DEFAULT AS IDENTITY;
+ALTER TABLE site_structure ADD COLUMN IF NOT EXISTS site_url TEXT;
+ALTER TABLE site_structure ADD COLUMN IF NOT EXISTS button_id TEXT;
+ALTER TABLE site_structure ADD COLUMN IF NOT EXISTS button_class TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS site_structure_element_id_key
+    ON site_structure (element_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS site_structure_element_key
+    ON site_structure (site_url, element_type, text_current, button_id, button_class)
+    NULLS NOT DISTINCT;
+
 ------------------------------------------------------------
 --                EVENTS (ACTUAL SDK VERSION)
 ------------------------------------------------------------
@@ -79,8 +106,8 @@ CREATE TABLE IF NOT EXISTS events (
     --------------------------------------------------------
     -- CLICK EVENT
     --------------------------------------------------------
-    button_text TEXT,
-    button_id TEXT,
+    button_text TEXT,             -- до словаря элементов; новые клики —
+    button_id TEXT,               -- только element_id
     button_class TEXT,
 
     --------------------------------------------------------
@@ -97,11 +124,26 @@ CREATE TABLE IF NOT EXISTS events (
     client_ip INET
 );
 
+-- site_structure.element_id кликнутого элемента
+ALTER TABLE events ADD COLUMN IF NOT EXISTS element_id BIGINT;
+
+-- FORM SUBMIT: slug формы из form_submit_success:<slug> (sdk/sdk.js)
+ALTER TABLE events ADD COLUMN IF NOT EXISTS form_slug TEXT;
+
+-- summary-воркер: поиск созревших сессий (max(received_at) по session_id)
+-- и загрузка событий пачки сессий
+CREATE INDEX IF NOT EXISTS events_session_received_idx
+    ON events (session_id, received_at);
+
 ------------------------------------------------------------
 --              SESSION_SUMMARY (AGGREGATED VISITS)
 ------------------------------------------------------------
+-- Секционирована по месяцам visit_start. Месячные секции (и перенос
+-- старой несекционированной таблицы) создаёт db/create_tables.py;
+-- DEFAULT-секция принимает всё, для чего месячной секции ещё нет
+-- (в том числе визиты с заведомо неверными часами клиента).
 CREATE TABLE IF NOT EXISTS session_summary (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
 
     --------------------------------------------------------
     -- IDENTIFIERS
@@ -142,7 +184,8 @@ CREATE TABLE IF NOT EXISTS session_summary (
     --------------------------------------------------------
     -- CLICKS SUMMARY
     --------------------------------------------------------
-    -- [{ t: ms_from_start, button: text }]
+    -- [{ t: ms_from_start, element: site_structure.element_id }]
+    -- (визиты, собранные до словаря элементов: { t, button: text })
     click_buttons JSONB,
 
     --------------------------------------------------------
@@ -154,5 +197,115 @@ CREATE TABLE IF NOT EXISTS session_summary (
     --------------------------------------------------------
     -- META
     --------------------------------------------------------
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+
+    PRIMARY KEY (id, visit_start)
+) PARTITION BY RANGE (visit_start);
+
+-- [{ t: ms_from_start, form: slug }] — отправленные формы визита
+ALTER TABLE session_summary ADD COLUMN IF NOT EXISTS form_submits JSONB;
+
+CREATE TABLE IF NOT EXISTS session_summary_default
+    PARTITION OF session_summary DEFAULT;
+
+-- Выборки по времени по всем сайтам: визиты пишутся почти
+-- в порядке visit_start, BRIN крошечный и почти не тормозит вставку
+CREATE INDEX IF NOT EXISTS session_summary_visit_start_brin
+    ON session_summary USING brin (visit_start);
+
+-- Дашборд сайта за период: index-only scan без обращения к строкам
+CREATE INDEX IF NOT EXISTS session_summary_site_visit_idx
+    ON session_summary (site_url, visit_start)
+    INCLUDE (device_type, duration_seconds, max_scroll_depth, total_click_events);
+
+------------------------------------------------------------
+--          ARCHIVE SEGMENTS (summary/archive.py)
+------------------------------------------------------------
+-- Сегменты архива, записанные во временные файлы (.seg.tmp) и
+-- зафиксированные в транзакции воркера вместе с DELETE events.
+-- Строка удаляется после публикации .seg; оставшиеся после падения
+-- строки публикует восстановление при старте воркера.
+CREATE TABLE IF NOT EXISTS archive_segments (
+    name TEXT PRIMARY KEY,        -- <сайт>/<YYYY-MM-DD>/<segment>.seg
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
+
+------------------------------------------------------------
+--     SESSION_SUMMARY BACKFILL (summary/cli.py backfill)
+------------------------------------------------------------
+-- Пересчитанные визиты до атомарной подмены в session_summary
+CREATE TABLE IF NOT EXISTS session_summary_backfill (
+    run_id TEXT NOT NULL,
+    unit_day DATE NOT NULL,       -- день первого события сессии
+    shard INT NOT NULL,
+
+    site_url TEXT NOT NULL,
+    uid TEXT,
+    session_id TEXT NOT NULL,
+    visit_start TIMESTAMPTZ NOT NULL,
+    visit_end TIMESTAMPTZ NOT NULL,
+    duration_seconds INT NOT NULL,
+    country TEXT,
+    city TEXT,
+    device_type TEXT,
+    os TEXT,
+    browser TEXT,
+    max_scroll_depth INT,
+    final_scroll_depth INT,
+    scroll_stops JSONB,
+    click_buttons JSONB,
+    total_scroll_events INT,
+    total_click_events INT
+);
+
+ALTER TABLE session_summary_backfill ADD COLUMN IF NOT EXISTS form_submits JSONB;
+
+CREATE INDEX IF NOT EXISTS session_summary_backfill_unit_idx
+    ON session_summary_backfill (run_id, unit_day, shard);
+
+-- Готовые шарды: при перезапуске пересчитываются только недостающие
+CREATE TABLE IF NOT EXISTS summary_backfill_shards (
+    run_id TEXT NOT NULL,
+    unit_day DATE NOT NULL,
+    shard INT NOT NULL,
+    sessions INT NOT NULL,
+    summaries INT NOT NULL,
+    finished_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (run_id, unit_day, shard)
+);
+
+-- Дни, уже подменённые в session_summary
+CREATE TABLE IF NOT EXISTS summary_backfill_days (
+    run_id TEXT NOT NULL,
+    unit_day DATE NOT NULL,
+    summaries INT NOT NULL,
+    swapped_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (run_id, unit_day)
+);
+
+------------------------------------------------------------
+--          FUNNELS (воронки конверсии, summary/funnels.py)
+------------------------------------------------------------
+-- steps: [{"click": element_id | [element_id, ...]} | {"form": "slug"}, ...]
+-- Шаги воронки не редактируются: для других шагов заводится новая воронка.
+CREATE TABLE IF NOT EXISTS funnels (
+    id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    site_url TEXT NOT NULL,
+    name TEXT NOT NULL,
+    steps JSONB NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS funnels_site_idx
+    ON funnels (site_url) WHERE is_active;
+
+-- Визиты дня (по visit_start, UTC), прошедшие не меньше step шагов
+-- воронки; step 0 — все визиты сайта. Ведёт summary-воркер.
+CREATE TABLE IF NOT EXISTS funnel_daily (
+    funnel_id BIGINT NOT NULL REFERENCES funnels(id) ON DELETE CASCADE,
+    day DATE NOT NULL,
+    step INT NOT NULL,
+    visits BIGINT NOT NULL,
+    PRIMARY KEY (funnel_id, day, step)
+);
@@ -1,7 +1,21 @@
 (function () {
-    const BATCH_SIZE = 20;
-    const BATCH_INTERVAL = 2000;
-    const HEARTBEAT_INTERVAL = 15000;
+    // конфиг подставляет загрузчик /sdk.js?site=<id> (см. app/sdk_bundle.py)
+    const config = window.aiScanConfig || {};
+
+    // очередь отправляется, когда набралось BATCH_SIZE событий
+    // или через FLUSH_DELAY после первого неотправленного
+    const BATCH_SIZE = config.batchSize || 50;
+    const FLUSH_DELAY = config.flushDelay || 30000;
+    const MAX_BACKOFF = 300000;
+    // пачка, которую сервер не принял столько раз подряд, выбрасывается:
+    // иначе она навсегда заблокирует отправку из этого браузера
+    const MAX_BATCH_ATTEMPTS = 8;
+    // свёрнутая серия heartbeat не длиннее этого окна, чтобы разрыв
+    // между событиями не превысил таймаут визита (IDLE_TIMEOUT_SEC)
+    const COALESCE_WINDOW_MS = 120000;
+    // keepalive-запросы и sendBeacon ограничены ~64 КБ на страницу
+    const MAX_BEACON_BYTES = 60000;
+    const HEARTBEAT_INTERVAL = config.heartbeatInterval || 15000;
     const SESSION_TIMEOUT_MS = 1800000;
 
     const UID_KEY = "ai_scan_uid";
@@ -9,7 +23,7 @@
     const OFFLINE_QUEUE_KEY = "ai_scan_offline_queue";
 
     const siteUrl = location.hostname;
-    const apiUrl = "https://ai-scan.tech/track";
+    const apiUrl = config.apiUrl || "https://ai-scan.tech/track";
 
     // ---------------------------
     //   ID / UID / SESSION
@@ -39,6 +53,22 @@
 
     const uid = getUID();
 
+    // ---------------------------
+    //   SAMPLING (стабильно по uid)
+    // ---------------------------
+    function hashToUnit(str) {
+        let h = 2166136261;
+        for (let i = 0; i < str.length; i++) {
+            h ^= str.charCodeAt(i);
+            h = Math.imul(h, 16777619);
+        }
+        return (h >>> 0) / 4294967296;
+    }
+
+    const sampleRate =
+        typeof config.sampleRate === "number" ? config.sampleRate : 1;
+    if (sampleRate < 1 && hashToUnit(uid) >= sampleRate) return;
+
     let sessionId, sessionStartTs, lastActivityTs;
 
     function loadOrCreateSession() {
@@ -88,8 +118,6 @@
         persistSession();
     }
 
-    loadOrCreateSession();
-
     // ---------------------------
     //   DEVICE / BROWSER META
     // ---------------------------
@@ -176,6 +204,9 @@
     // ---------------------------
     const queue = [];
     let offlineQueue = loadOfflineQueue();
+    let flushTimer = null;
+    let inFlight = false;
+    let failures = 0;
 
     function loadOfflineQueue() {
         try {
@@ -190,6 +221,10 @@
 
     function saveOfflineQueue() {
         try {
+            if (offlineQueue.length === 0) {
+                localStorage.removeItem(OFFLINE_QUEUE_KEY);
+                return;
+            }
             localStorage.setItem(
                 OFFLINE_QUEUE_KEY,
                 JSON.stringify(offlineQueue.slice(0, 2000))
@@ -197,80 +232,236 @@
         } catch (e) {}
     }
 
+    // один таймер на очередь; пустая очередь таймеров не держит
+    function scheduleFlush(delay) {
+        if (flushTimer !== null) return;
+        flushTimer = setTimeout(function () {
+            flushTimer = null;
+            flushQueue();
+        }, delay);
+    }
+
+    function cancelFlush() {
+        if (flushTimer === null) return;
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+
     function enqueueEvent(event) {
         queue.push(event);
+
+        // во время backoff не торопимся: ждём повтора
+        if (queue.length >= BATCH_SIZE && failures === 0) {
+            cancelFlush();
+            flushQueue();
+        } else {
+            scheduleFlush(FLUSH_DELAY);
+        }
     }
 
-    function flushQueue() {
-        if (!navigator.onLine) {
-            offlineQueue = offlineQueue.concat(queue);
-            queue.length = 0;
-            saveOfflineQueue();
+    function isHeartbeatAt(event, depth) {
+        return (
+            event.event_type === "heartbeat" &&
+            event.payload.scroll_percent === depth
+        );
+    }
+
+    // серия heartbeat на одной глубине сворачивается до первого
+    // и последнего: длительность визита и точки остановки скролла
+    // по ним восстанавливаются так же
+    function enqueueHeartbeat(event) {
+        const n = queue.length;
+        const depth = event.payload.scroll_percent;
+        if (
+            n >= 2 &&
+            isHeartbeatAt(queue[n - 1], depth) &&
+            isHeartbeatAt(queue[n - 2], depth) &&
+            event.ts - queue[n - 2].ts < COALESCE_WINDOW_MS
+        ) {
+            queue[n - 1] = event;
             return;
         }
+        enqueueEvent(event);
+    }
 
-        let payloadEvents = [];
-
+    function takeBatch(limit) {
+        let events = [];
         if (offlineQueue.length > 0) {
-            payloadEvents = payloadEvents.concat(
-                offlineQueue.splice(0, BATCH_SIZE)
-            );
+            events = offlineQueue.splice(0, limit);
+            saveOfflineQueue();
         }
-
-        if (queue.length > 0 && payloadEvents.length < BATCH_SIZE) {
-            const need = BATCH_SIZE - payloadEvents.length;
-            payloadEvents = payloadEvents.concat(queue.splice(0, need));
+        if (events.length < limit) {
+            events = events.concat(queue.splice(0, limit - events.length));
         }
+        return events;
+    }
 
-        if (payloadEvents.length === 0) return;
+    const encoder = typeof TextEncoder !== "undefined" ? new TextEncoder() : null;
 
-        fetch(apiUrl, {
-            method: "POST",
-            headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({
-                site_url: siteUrl,
-                uid: uid,
-                session_id: sessionId,
-                events: payloadEvents,
-            }),
-        }).catch(() => {
-            offlineQueue = payloadEvents.concat(offlineQueue);
+    // размер в байтах UTF-8: кириллица — 2 байта на символ
+    function byteLength(str) {
+        return encoder ? encoder.encode(str).length : str.length * 3;
+    }
+
+    // первые события пачки, которые вместе укладываются в лимит
+    // keepalive; остальные возвращаются в начало очереди
+    function fitBatch(events) {
+        let bytes = 0;
+        let n = 0;
+        while (n < events.length) {
+            bytes += byteLength(JSON.stringify(events[n]));
+            if (n > 0 && bytes > MAX_BEACON_BYTES) break;
+            n++;
+        }
+        if (n < events.length) {
+            offlineQueue = events.slice(n).concat(offlineQueue);
             saveOfflineQueue();
+        }
+        return events.slice(0, n);
+    }
+
+    function buildPayload(events) {
+        return JSON.stringify({
+            site_url: siteUrl,
+            uid: uid,
+            session_id: sessionId,
+            device: getDeviceInfo(),
+            events: events,
         });
     }
 
-    setInterval(flushQueue, BATCH_INTERVAL);
+    function backoffDelay() {
+        const delay = Math.min(MAX_BACKOFF, FLUSH_DELAY * Math.pow(2, failures - 1));
+        return delay / 2 + Math.random() * (delay / 2);
+    }
+
+    function flushQueue() {
+        if (inFlight) return;
 
-    window.addEventListener("beforeunload", function () {
-        if (queue.length > 0) {
+        if (!navigator.onLine) {
+            // продолжим по событию "online"
             offlineQueue = offlineQueue.concat(queue);
             queue.length = 0;
             saveOfflineQueue();
+            return;
+        }
+
+        const events = fitBatch(takeBatch(BATCH_SIZE));
+        if (events.length === 0) return;
+
+        inFlight = true;
+        const body = buildPayload(events);
+
+        // text/plain — «простой» CORS-запрос, без preflight OPTIONS;
+        // keepalive-запрос больше ~64 КБ браузер отклоняет
+        fetch(apiUrl, {
+            method: "POST",
+            body: body,
+            keepalive: byteLength(body) <= MAX_BEACON_BYTES,
+        })
+            .then(function (res) {
+                if (!res.ok) throw new Error("track: HTTP " + res.status);
+                inFlight = false;
+                failures = 0;
+
+                if (offlineQueue.length > 0 || queue.length >= BATCH_SIZE) {
+                    scheduleFlush(0);
+                } else if (queue.length > 0) {
+                    scheduleFlush(FLUSH_DELAY);
+                }
+            })
+            .catch(function () {
+                inFlight = false;
+                failures++;
+                const delay = backoffDelay();
+                if (failures >= MAX_BATCH_ATTEMPTS) {
+                    failures = 0;
+                } else {
+                    offlineQueue = events.concat(offlineQueue);
+                    saveOfflineQueue();
+                }
+                scheduleFlush(delay);
+            });
+    }
+
+    // страница скрыта или выгружается: отправляем всё через sendBeacon,
+    // не отправленное — в localStorage до следующего визита
+    function flushOnHide() {
+        cancelFlush();
+
+        const events = offlineQueue.concat(queue);
+        queue.length = 0;
+        offlineQueue = [];
+
+        if (events.length > 0 && navigator.onLine && navigator.sendBeacon) {
+            let chunk = [];
+            let chunkBytes = 0;
+
+            const sendChunk = function () {
+                if (chunk.length === 0) return;
+                if (!navigator.sendBeacon(apiUrl, buildPayload(chunk))) {
+                    offlineQueue = offlineQueue.concat(chunk);
+                }
+                chunk = [];
+                chunkBytes = 0;
+            };
+
+            events.forEach(function (event) {
+                const size = byteLength(JSON.stringify(event));
+                if (chunk.length >= BATCH_SIZE || chunkBytes + size > MAX_BEACON_BYTES) {
+                    sendChunk();
+                }
+                chunk.push(event);
+                chunkBytes += size;
+            });
+            sendChunk();
+        } else {
+            offlineQueue = events;
         }
+
+        saveOfflineQueue();
+    }
+
+    document.addEventListener("visibilitychange", function () {
+        if (document.visibilityState === "hidden") flushOnHide();
     });
+    window.addEventListener("pagehide", flushOnHide);
+
+    window.addEventListener("online", function () {
+        failures = 0;
+        cancelFlush();
+        scheduleFlush(0);
+    });
+
+    // хвост прошлого визита
+    if (offlineQueue.length > 0) scheduleFlush(FLUSH_DELAY);
 
     // ---------------------------
     //   BUILD EVENT / TRACK
     // ---------------------------
+    // site_url, uid и устройство передаются один раз на запрос
     function buildEvent(event_type, payload) {
         return {
             event_id: generateId(),
             event_type: event_type,
             ts: Date.now(),
-            site_url: siteUrl,
-            uid: uid,
             session_id: sessionId,
-            payload: Object.assign({}, payload || {}, {
-                device: getDeviceInfo(),
-            }),
+            payload: payload || {},
         };
     }
 
     function track(event_type, payload) {
         markActivity();
-        enqueueEvent(buildEvent(event_type, payload));
+        const event = buildEvent(event_type, payload);
+        if (event_type === "heartbeat") {
+            enqueueHeartbeat(event);
+        } else {
+            enqueueEvent(event);
+        }
     }
 
+    loadOrCreateSession();
+
     // ------------------------------
     //      CLICK ONLY ON BUTTONS
     // ------------------------------
@@ -425,6 +616,9 @@
     let maxScrollPercent = 0;
 
     setInterval(function () {
+        // скрытая вкладка не пишет heartbeat
+        if (document.hidden) return;
+
         const now = Date.now();
         const currentPercent = calcScrollPercent();
         if (currentPercent > maxScrollPercent) maxScrollPercent = currentPercent;
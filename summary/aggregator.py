@@ -38,6 +38,7 @@ def build_session_summaries(
 
         scroll_stops: List[Dict[str, Any]] = []
         click_buttons: List[Dict[str, Any]] = []
+        form_submits: List[Dict[str, Any]] = []
 
         last_scroll_depth = None
         last_scroll_time = None
@@ -78,12 +79,15 @@ def build_session_summaries(
 
             elif e["event_type"] == "click":
                 click_events_count += 1
-                click_buttons.append(
-                    {
-                        "t": t_from_start,
-                        "button": e.get("button_text"),
-                    }
-                )
+                # element_id из site_structure; текст — для событий,
+                # записанных до словаря элементов
+                if e.get("element_id") is not None:
+                    click_buttons.append({"t": t_from_start, "element": e["element_id"]})
+                else:
+                    click_buttons.append({"t": t_from_start, "button": e.get("button_text")})
+
+            elif e["event_type"] == "form_submit":
+                form_submits.append({"t": t_from_start, "form": e.get("form_slug")})
 
         return {
             "site_url": first["site_url"],
@@ -105,6 +109,8 @@ def build_session_summaries(
             "scroll_stops": scroll_stops,
             # clicks
             "click_buttons": click_buttons,
+            # forms
+            "form_submits": form_submits,
             # aggregates
             "total_scroll_events": scroll_events_count,
             "total_click_events": click_events_count,
@@ -0,0 +1,666 @@
+"""
+Холодный архив сырых событий.
+
+После суммаризации сырые события не удаляются бесследно, а пишутся
+в сжатые колоночные сегменты на локальном диске:
+
+    <ARCHIVE_DIR>/<site>/<YYYY-MM-DD>/<segment>.seg
+
+Формат сегмента:
+- MAGIC, затем заголовок (JSON: site_url, day, список колонок);
+- row group'ы по ROW_GROUP_SIZE строк: varint число строк,
+  затем по каждой колонке varint длина + zlib-сжатый блок;
+- row group с нулём строк — конец файла.
+
+Кодирование колонок внутри блока:
+- str — словарь значений + varint-индексы (0 = NULL),
+- ts  — битовая маска NULL + zigzag-дельты микросекунд,
+- int — битовая маска NULL + zigzag varint.
+
+Сегменты неизменяемы. Публикация после падения восстанавливается:
+1) сегмент пишется во временный <segment>.seg.tmp (fsync),
+2) его имя записывается в archive_segments в той же транзакции,
+   что и DELETE сырых событий,
+3) после COMMIT файл переименовывается в .seg, строка удаляется.
+При старте воркер вызывает recover(): .seg.tmp из archive_segments
+публикуются, остальные (транзакция не зафиксирована) удаляются.
+
+Воркер пишет по сегменту на (сайт, день) за пачку; compact() сливает
+сегменты закрытых дней в один. Замена атомарна для читателей:
+манифест <segment>.compact со списком входов пишется до результата,
+и входы, заменённые уже опубликованным результатом, читатели пропускают.
+
+Чтение потоковое — в памяти одновременно лежит один row group.
+"""
+
+import heapq
+import itertools
+import json
+import os
+import re
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+MAGIC = b"AISCANSEG\x01"
+ROW_GROUP_SIZE = 8192
+SEGMENT_SUFFIX = ".seg"
+TMP_SUFFIX = ".seg.tmp"
+MANIFEST_SUFFIX = ".compact"
+COMPACT_TMP_SUFFIX = ".compact.tmp"
+
+# сколько сегментов сливается за один проход compact (открытых файлов)
+COMPACT_FAN_IN = 64
+
+# site_url хранится в заголовке сегмента, а не в колонке
+ARCHIVE_COLUMNS: List[Tuple[str, str]] = [
+    ("id", "str"),
+    ("uid", "str"),
+    ("session_id", "str"),
+    ("event_type", "str"),
+    ("event_time", "ts"),
+    ("received_at", "ts"),
+    ("scroll_position_percent", "int"),
+    ("button_text", "str"),
+    ("button_id", "str"),
+    ("button_class", "str"),
+    ("element_id", "int"),
+    ("form_slug", "str"),
+    ("device_type", "str"),
+    ("os", "str"),
+    ("browser", "str"),
+    ("user_agent", "str"),
+    ("client_ip", "str"),
+]
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+# ----------------------------------------------------------------------
+# VARINT / ZIGZAG
+# ----------------------------------------------------------------------
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_varint_stream(stream: BinaryIO) -> Optional[int]:
+    result = 0
+    shift = 0
+    while True:
+        raw = stream.read(1)
+        if not raw:
+            return None
+        byte = raw[0]
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) if value >= 0 else ((-value) << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+
+# ----------------------------------------------------------------------
+# COLUMN ENCODING
+# ----------------------------------------------------------------------
+
+def _null_mask(values: List[Any]) -> bytes:
+    mask = bytearray((len(values) + 7) // 8)
+    for i, v in enumerate(values):
+        if v is None:
+            mask[i >> 3] |= 1 << (i & 7)
+    return bytes(mask)
+
+
+def _is_null(mask: bytes, i: int) -> bool:
+    return bool(mask[i >> 3] & (1 << (i & 7)))
+
+
+def _encode_str(values: List[Optional[str]]) -> bytes:
+    out = bytearray()
+    dictionary: Dict[str, int] = {}
+    indices: List[int] = []
+
+    for v in values:
+        if v is None:
+            indices.append(0)
+            continue
+        idx = dictionary.get(v)
+        if idx is None:
+            idx = len(dictionary) + 1
+            dictionary[v] = idx
+        indices.append(idx)
+
+    _write_varint(out, len(dictionary))
+    for v in dictionary:
+        raw = v.encode("utf-8")
+        _write_varint(out, len(raw))
+        out += raw
+
+    for idx in indices:
+        _write_varint(out, idx)
+    return bytes(out)
+
+
+def _decode_str(buf: bytes, rows: int) -> List[Optional[str]]:
+    pos = 0
+    size, pos = _read_varint(buf, pos)
+
+    dictionary: List[Optional[str]] = [None]
+    for _ in range(size):
+        length, pos = _read_varint(buf, pos)
+        dictionary.append(buf[pos:pos + length].decode("utf-8"))
+        pos += length
+
+    values: List[Optional[str]] = []
+    for _ in range(rows):
+        idx, pos = _read_varint(buf, pos)
+        values.append(dictionary[idx])
+    return values
+
+
+def _encode_ints(values: List[Optional[int]], delta: bool) -> bytes:
+    out = bytearray(_null_mask(values))
+    prev = 0
+    for v in values:
+        if v is None:
+            continue
+        _write_varint(out, _zigzag(v - prev if delta else v))
+        if delta:
+            prev = v
+    return bytes(out)
+
+
+def _decode_ints(buf: bytes, rows: int, delta: bool) -> List[Optional[int]]:
+    mask_len = (rows + 7) // 8
+    mask = buf[:mask_len]
+    pos = mask_len
+    prev = 0
+
+    values: List[Optional[int]] = []
+    for i in range(rows):
+        if _is_null(mask, i):
+            values.append(None)
+            continue
+        raw, pos = _read_varint(buf, pos)
+        v = _unzigzag(raw)
+        if delta:
+            v += prev
+            prev = v
+        values.append(v)
+    return values
+
+
+def _to_micros(value: Optional[datetime]) -> Optional[int]:
+    if value is None:
+        return None
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _from_micros(value: Optional[int]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _encode_column(kind: str, values: List[Any]) -> bytes:
+    if kind == "str":
+        raw = _encode_str([None if v is None else str(v) for v in values])
+    elif kind == "ts":
+        raw = _encode_ints([_to_micros(v) for v in values], delta=True)
+    else:
+        raw = _encode_ints(values, delta=False)
+    return zlib.compress(raw, 6)
+
+
+def _decode_column(kind: str, block: bytes, rows: int) -> List[Any]:
+    raw = zlib.decompress(block)
+    if kind == "str":
+        return _decode_str(raw, rows)
+    if kind == "ts":
+        return [_from_micros(v) for v in _decode_ints(raw, rows, delta=True)]
+    return _decode_ints(raw, rows, delta=False)
+
+
+# ----------------------------------------------------------------------
+# PATHS
+# ----------------------------------------------------------------------
+
+def _site_dir_name(site_url: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", site_url) or "_"
+
+
+def _day_of(event: Dict[str, Any]) -> date:
+    return event["event_time"].astimezone(timezone.utc).date()
+
+
+def _row_order(event: Dict[str, Any]) -> Tuple[str, datetime]:
+    return event.get("session_id") or "", event["event_time"]
+
+
+def _fsync_dir(directory: Path) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _segment_name() -> str:
+    return f"{time.time_ns():020d}-{os.getpid()}"
+
+
+# ----------------------------------------------------------------------
+# WRITER
+# ----------------------------------------------------------------------
+
+def write_segment(path: Path, site_url: str, day: date, events: List[Dict[str, Any]]) -> None:
+    """
+    Пишет один сегмент (события одного сайта за один день) и делает fsync.
+    """
+    _write_sorted_segment(path, site_url, day, sorted(events, key=_row_order), len(events))
+
+
+def _write_sorted_segment(
+    path: Path,
+    site_url: str,
+    day: date,
+    events: Iterator[Dict[str, Any]],
+    rows: int,
+) -> None:
+    """
+    Пишет сегмент из уже упорядоченного по (session_id, event_time)
+    потока событий; в памяти — один row group.
+    """
+    header = json.dumps(
+        {
+            "site_url": site_url,
+            "day": day.isoformat(),
+            "columns": ARCHIVE_COLUMNS,
+            "rows": rows,
+        }
+    ).encode("utf-8")
+
+    events = iter(events)
+    with open(path, "wb") as f:
+        out = bytearray(MAGIC)
+        _write_varint(out, len(header))
+        out += header
+        f.write(out)
+
+        while True:
+            group = list(itertools.islice(events, ROW_GROUP_SIZE))
+            if not group:
+                break
+            out = bytearray()
+            _write_varint(out, len(group))
+            for name, kind in ARCHIVE_COLUMNS:
+                block = _encode_column(kind, [e.get(name) for e in group])
+                _write_varint(out, len(block))
+                out += block
+            f.write(out)
+
+        f.write(b"\x00")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ArchiveWriter:
+    """
+    Буфер архивации на один цикл воркера.
+
+    Использование:
+        archive.recover(committed)   # при старте: committed — из archive_segments
+        archive.add(events)          # события завершённых сессий
+        archive.stage()              # временные файлы + fsync
+        ... в транзакции: summary, archive_segments += staged_segments(),
+            DELETE events, COMMIT ...
+        archive.commit()             # атомарное переименование в .seg
+    При ошибке — archive.abort(): временные файлы остаются до recover(),
+    потому что исход COMMIT при обрыве соединения неизвестен.
+    """
+
+    def __init__(self, root: str = ARCHIVE_DIR) -> None:
+        self.root = Path(root)
+        self._buffer: Dict[Tuple[str, date], List[Dict[str, Any]]] = {}
+        self._staged: List[Tuple[Path, Path]] = []
+        self._counter = 0
+
+    def _relative(self, path: Path) -> str:
+        return path.relative_to(self.root).as_posix()
+
+    def add(self, events: List[Dict[str, Any]]) -> None:
+        for event in events:
+            key = (event["site_url"], _day_of(event))
+            self._buffer.setdefault(key, []).append(event)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._buffer.values())
+
+    def stage(self) -> None:
+        for (site_url, day), events in self._buffer.items():
+            directory = self.root / _site_dir_name(site_url) / day.isoformat()
+            directory.mkdir(parents=True, exist_ok=True)
+
+            self._counter += 1
+            name = f"{_segment_name()}-{self._counter}"
+            tmp_path = directory / (name + TMP_SUFFIX)
+            final_path = directory / (name + SEGMENT_SUFFIX)
+
+            write_segment(tmp_path, site_url, day, events)
+            self._staged.append((tmp_path, final_path))
+
+        self._buffer.clear()
+
+    def staged_segments(self) -> List[str]:
+        """
+        Имена подготовленных сегментов для archive_segments.
+        """
+        return [self._relative(final_path) for _, final_path in self._staged]
+
+    def commit(self) -> List[str]:
+        """
+        Публикует подготовленные сегменты (после COMMIT).
+
+        Returns:
+            имена опубликованных сегментов — их строки archive_segments
+            больше не нужны.
+        """
+        published: List[str] = []
+        try:
+            directories = set()
+            for tmp_path, final_path in self._staged:
+                os.replace(tmp_path, final_path)
+                directories.add(final_path.parent)
+                published.append(self._relative(final_path))
+
+            # fsync каталогов, чтобы переименования пережили падение
+            for directory in directories:
+                _fsync_dir(directory)
+        finally:
+            # недоопубликованное доделает recover() по archive_segments
+            self._staged.clear()
+
+        return published
+
+    def abort(self) -> None:
+        self._staged.clear()
+        self._buffer.clear()
+
+    def recover(self, committed: List[str]) -> Tuple[int, int]:
+        """
+        Доводит прерванные публикации: .seg.tmp из committed
+        (зафиксированы в archive_segments) переименовываются в .seg,
+        остальные .seg.tmp удаляются — их транзакция не зафиксирована.
+        Вызывать, пока этот ARCHIVE_DIR больше никто не пишет.
+
+        Returns:
+            (опубликовано, удалено).
+        """
+        committed_set = set(committed)
+        published = removed = 0
+        directories = set()
+
+        for tmp_path in self.root.glob("*/*/*" + TMP_SUFFIX):
+            final_path = tmp_path.with_name(tmp_path.name[: -len(TMP_SUFFIX)] + SEGMENT_SUFFIX)
+            if self._relative(final_path) in committed_set:
+                os.replace(tmp_path, final_path)
+                published += 1
+            else:
+                tmp_path.unlink()
+                removed += 1
+            directories.add(tmp_path.parent)
+
+        for directory in directories:
+            _fsync_dir(directory)
+
+        return published, removed
+
+
+# ----------------------------------------------------------------------
+# COMPACTION
+# ----------------------------------------------------------------------
+
+def _manifest_output(manifest: Path) -> Path:
+    return manifest.with_name(manifest.name[: -len(MANIFEST_SUFFIX)] + SEGMENT_SUFFIX)
+
+
+def _read_manifest(manifest: Path) -> Optional[List[str]]:
+    try:
+        return json.loads(manifest.read_text(encoding="utf-8"))["inputs"]
+    except (ValueError, KeyError):
+        # манифест не дописан — результат ещё не публиковался
+        return None
+
+
+def _replaced_segments(directory: Path) -> set:
+    """
+    Сегменты каталога, уже заменённые опубликованным результатом слияния.
+    """
+    replaced = set()
+    for manifest in directory.glob("*" + MANIFEST_SUFFIX):
+        if _manifest_output(manifest).exists():
+            replaced.update(_read_manifest(manifest) or [])
+    return replaced
+
+
+def _finish_compactions(directory: Path) -> None:
+    """
+    Доводит прерванные слияния каталога: если результат опубликован —
+    удаляет входы, иначе — временный результат. Затем удаляет манифест.
+    """
+    for manifest in directory.glob("*" + MANIFEST_SUFFIX):
+        output = _manifest_output(manifest)
+        if output.exists():
+            for name in _read_manifest(manifest) or []:
+                try:
+                    (directory / name).unlink()
+                except FileNotFoundError:
+                    pass
+        else:
+            tmp = manifest.with_name(manifest.name[: -len(MANIFEST_SUFFIX)] + COMPACT_TMP_SUFFIX)
+            try:
+                tmp.unlink()
+            except FileNotFoundError:
+                pass
+        _fsync_dir(directory)
+        manifest.unlink()
+
+
+def _merge_segments(directory: Path, inputs: List[Path]) -> Path:
+    """
+    Сливает сегменты одного (сайт, день) в один: k-way merge
+    по (session_id, event_time), потоково.
+    """
+    headers = []
+    for path in inputs:
+        with open(path, "rb") as f:
+            headers.append(read_segment_header(f))
+    site_url = headers[0]["site_url"]
+    day = date.fromisoformat(headers[0]["day"])
+
+    name = _segment_name() + "-c"
+    manifest = directory / (name + MANIFEST_SUFFIX)
+    tmp_path = directory / (name + COMPACT_TMP_SUFFIX)
+    output = directory / (name + SEGMENT_SUFFIX)
+
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump({"inputs": [p.name for p in inputs]}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_dir(directory)
+
+    merged = heapq.merge(*(iter_segment_rows(p) for p in inputs), key=_row_order)
+    _write_sorted_segment(tmp_path, site_url, day, merged, sum(h["rows"] for h in headers))
+
+    # точка переключения: с этого момента читатели берут результат
+    os.replace(tmp_path, output)
+    _fsync_dir(directory)
+
+    _finish_compactions(directory)
+    return output
+
+
+def compact_day(directory: Path) -> int:
+    """
+    Сливает все сегменты каталога <сайт>/<день> в один.
+
+    Returns:
+        число слитых входных сегментов (0 — сливать нечего).
+    """
+    _finish_compactions(directory)
+
+    segments = sorted(directory.glob("*" + SEGMENT_SUFFIX))
+    merged = 0
+    while len(segments) > 1:
+        group = segments[:COMPACT_FAN_IN]
+        output = _merge_segments(directory, group)
+        merged += len(group)
+        segments = segments[len(group):] + [output]
+    return merged
+
+
+def compact(
+    before: date,
+    site_url: Optional[str] = None,
+    root: str = ARCHIVE_DIR,
+) -> Dict[str, int]:
+    """
+    Сливает сегменты дней раньше before (по сайту или по всем сайтам).
+    Не запускать одновременно с backfill по тем же сайтам: входы
+    удаляются сразу после публикации результата.
+    """
+    base = Path(root)
+    site_dirs = [base / _site_dir_name(site_url)] if site_url else sorted(base.glob("*"))
+
+    stats = {"days": 0, "segments": 0}
+    for site_dir in site_dirs:
+        if not site_dir.is_dir():
+            continue
+        for directory in sorted(site_dir.glob("*")):
+            try:
+                day = date.fromisoformat(directory.name)
+            except ValueError:
+                continue
+            if day >= before or not directory.is_dir():
+                continue
+
+            merged = compact_day(directory)
+            if merged:
+                stats["days"] += 1
+                stats["segments"] += merged
+    return stats
+
+
+# ----------------------------------------------------------------------
+# READER
+# ----------------------------------------------------------------------
+
+def read_segment_header(stream: BinaryIO) -> Dict[str, Any]:
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not an ai_scan archive segment")
+    length = _read_varint_stream(stream)
+    return json.loads(stream.read(length).decode("utf-8"))
+
+
+def iter_segment_rows(path: Path, site_url: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково читает сегмент: в памяти одновременно один row group.
+    Колонки, которых нет в сегменте (старый формат), отдаются как None.
+    Если передан site_url, сегменты другого сайта (коллизия имени
+    каталога после экранирования) пропускаются.
+    """
+    with open(path, "rb") as f:
+        header = read_segment_header(f)
+        if site_url is not None and header["site_url"] != site_url:
+            return
+        site_url = header["site_url"]
+        columns = [tuple(c) for c in header["columns"]]
+        missing = [name for name, _ in ARCHIVE_COLUMNS if name not in dict(columns)]
+
+        while True:
+            rows = _read_varint_stream(f)
+            if not rows:
+                return
+
+            decoded: List[List[Any]] = []
+            for _, kind in columns:
+                length = _read_varint_stream(f)
+                decoded.append(_decode_column(kind, f.read(length), rows))
+
+            names = [name for name, _ in columns]
+            for i in range(rows):
+                row = {"site_url": site_url}
+                for name, values in zip(names, decoded):
+                    row[name] = values[i]
+                for name in missing:
+                    row[name] = None
+                yield row
+
+
+def iter_segments(
+    site_url: str,
+    date_from: date,
+    date_to: date,
+    root: str = ARCHIVE_DIR,
+) -> Iterator[Path]:
+    """
+    Сегменты сайта за дни date_from..date_to (включительно), по порядку.
+    Неопубликованные (.seg.tmp) сегменты и входы уже опубликованного
+    слияния пропускаются.
+    """
+    site_dir = Path(root) / _site_dir_name(site_url)
+    day = date_from
+    while day <= date_to:
+        directory = site_dir / day.isoformat()
+        if directory.is_dir():
+            replaced = _replaced_segments(directory)
+            yield from (
+                p for p in sorted(directory.glob("*" + SEGMENT_SUFFIX)) if p.name not in replaced
+            )
+        day += timedelta(days=1)
+
+
+def iter_archived_events(
+    site_url: str,
+    date_from: date,
+    date_to: date,
+    root: str = ARCHIVE_DIR,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково отдаёт архивные события сайта за период — в том же виде,
+    что и sql.load_events_for_sessions (строки таблицы events).
+    Внутри сегмента события упорядочены по (session_id, event_time).
+    """
+    for path in iter_segments(site_url, date_from, date_to, root):
+        yield from iter_segment_rows(path, site_url)
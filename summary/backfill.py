@@ -0,0 +1,436 @@
+"""
+Пересчёт session_summary за период (после смены IDLE_TIMEOUT_SEC
+или логики aggregator.py).
+
+Источник — холодный архив (summary/archive.py): только события,
+которые summary-воркер уже суммаризировал и удалил из events.
+Ещё не разобранные события остаются воркеру — так один визит
+не попадает в session_summary дважды.
+
+Единица работы — (день, шард): сессии сайта, чьё первое событие
+попало в этот день, делятся на jobs шардов по хэшу session_id.
+Сессии, начавшиеся накануне date_from, считаются отдельным днём
+date_from - 1, но из них подменяются только визиты с date_from.
+Шарды считаются параллельно в ProcessPoolExecutor:
+- архивные сегменты читаются потоково,
+- результат пишется через COPY в session_summary_backfill,
+- готовый шард отмечается в summary_backfill_shards.
+
+Когда все шарды дня готовы, день подменяется в session_summary
+одной транзакцией: у пересчитанных сессий удаляются старые визиты,
+начавшиеся в прочитанном окне, и вставляются новые. Подменённые дни
+пишутся в summary_backfill_days. Каждый запуск по умолчанию новый;
+прерванный продолжается явно (resume=True или конкретный run_id)
+с места остановки.
+"""
+
+import asyncio
+import hashlib
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from db import get_connection
+from sql import SUMMARY_COLUMNS, summary_record
+from aggregator import build_session_summaries
+from archive import ARCHIVE_DIR, iter_archived_events
+from funnels import apply_counters, count_visits, load_funnels
+
+
+STAGING_TABLE = "session_summary_backfill"
+STAGING_COLUMNS = ["run_id", "unit_day", "shard"] + SUMMARY_COLUMNS
+
+
+def run_key(
+    site_url: str,
+    date_from: date,
+    date_to: date,
+    idle_timeout_sec: int,
+    jobs: int,
+) -> str:
+    """Общая часть run_id всех запусков с одним набором параметров."""
+    key = f"{site_url}|{date_from}|{date_to}|{idle_timeout_sec}|{jobs}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def make_run_id(
+    site_url: str,
+    date_from: date,
+    date_to: date,
+    idle_timeout_sec: int,
+    jobs: int,
+) -> str:
+    """
+    id нового запуска: ключ параметров и время старта. Каждый запуск
+    считает заново — после правки aggregator.py те же параметры
+    не должны находить «готовые» дни прошлого прогона.
+    """
+    started = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+    return f"{run_key(site_url, date_from, date_to, idle_timeout_sec, jobs)}-{started}"
+
+
+async def find_last_run(conn, key: str) -> Optional[str]:
+    """Последний запуск с ключом key (для --resume) или None."""
+    return await conn.fetchval(
+        """
+        SELECT max(run_id) FROM (
+            SELECT run_id FROM summary_backfill_shards WHERE run_id LIKE $1
+            UNION ALL
+            SELECT run_id FROM summary_backfill_days WHERE run_id LIKE $1
+        ) runs;
+        """,
+        key + "-%",
+    )
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, dtime.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+# ----------------------------------------------------------------------
+# SHARD INPUT
+# ----------------------------------------------------------------------
+
+def _archive_shard_of(session_id: str, jobs: int) -> int:
+    return zlib.crc32(session_id.encode("utf-8")) % jobs
+
+
+def _iter_archive_sessions(task: Dict[str, Any]) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Сессии шарда из архива. Читаются сегменты дня и соседних дней:
+    предыдущего — чтобы не приписать дню хвост вчерашней сессии,
+    следующего — чтобы забрать хвост сессии, перешедшей через полночь.
+
+    Пока у сессии есть события ближе idle_timeout_sec к концу
+    прочитанного окна, её последний визит может продолжаться —
+    окно для таких сессий расширяется на следующий день. Поэтому
+    каждая отданная сессия содержит все визиты, начавшиеся до её
+    последнего прочитанного события, целиком.
+    """
+    day: date = task["unit_day"]
+    idle = timedelta(seconds=task["idle_timeout_sec"])
+    sessions: Dict[str, List[Dict[str, Any]]] = {}
+
+    def read(date_from: date, date_to: date, wanted: Optional[set] = None) -> None:
+        for event in iter_archived_events(
+            task["site_url"], date_from, date_to, root=task["archive_dir"]
+        ):
+            session_id = event["session_id"]
+            if wanted is not None:
+                if session_id in wanted:
+                    sessions[session_id].append(event)
+            elif session_id is not None and _archive_shard_of(session_id, task["jobs"]) == task["shard"]:
+                sessions.setdefault(session_id, []).append(event)
+
+    last_day = day + timedelta(days=1)
+    read(day - timedelta(days=1), last_day)
+
+    for session_id in list(sessions):
+        events = sessions[session_id]
+        events.sort(key=lambda e: e["event_time"])
+        if events[0]["event_time"].astimezone(timezone.utc).date() != day:
+            del sessions[session_id]
+
+    continuing = set(sessions)
+    while continuing:
+        window_end = _day_bounds(last_day)[1]
+        continuing = {
+            session_id
+            for session_id in continuing
+            if sessions[session_id][-1]["event_time"] > window_end - idle
+        }
+        if not continuing:
+            break
+
+        # в следующем дне у сессии нет событий — разрыв больше idle
+        sizes = {session_id: len(sessions[session_id]) for session_id in continuing}
+        last_day += timedelta(days=1)
+        read(last_day, last_day, continuing)
+        continuing = {s for s in continuing if len(sessions[s]) > sizes[s]}
+        for session_id in continuing:
+            sessions[session_id].sort(key=lambda e: e["event_time"])
+
+    for session_id in sorted(sessions):
+        yield sessions.pop(session_id)
+
+
+# ----------------------------------------------------------------------
+# SHARD (выполняется в дочернем процессе)
+# ----------------------------------------------------------------------
+
+async def _process_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    stats = {"sessions": 0, "summaries": 0}
+
+    async def records() -> AsyncIterator[tuple]:
+        async for events in _as_async(_iter_archive_sessions(task)):
+            stats["sessions"] += 1
+            for summary in build_session_summaries(
+                events, idle_timeout_sec=task["idle_timeout_sec"]
+            ):
+                if task["visits_from"] and summary["visit_start"] < task["visits_from"]:
+                    continue
+                stats["summaries"] += 1
+                yield (task["run_id"], task["unit_day"], task["shard"]) + summary_record(summary)
+
+    writer = await get_connection()
+    try:
+        async with writer.transaction():
+            # остатки прерванной попытки этого же шарда
+            await writer.execute(
+                f"DELETE FROM {STAGING_TABLE} WHERE run_id = $1 AND unit_day = $2 AND shard = $3",
+                task["run_id"],
+                task["unit_day"],
+                task["shard"],
+            )
+            await writer.copy_records_to_table(
+                STAGING_TABLE, records=records(), columns=STAGING_COLUMNS
+            )
+            await writer.execute(
+                """
+                INSERT INTO summary_backfill_shards (run_id, unit_day, shard, sessions, summaries)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (run_id, unit_day, shard) DO UPDATE
+                SET sessions = EXCLUDED.sessions,
+                    summaries = EXCLUDED.summaries,
+                    finished_at = NOW();
+                """,
+                task["run_id"],
+                task["unit_day"],
+                task["shard"],
+                stats["sessions"],
+                stats["summaries"],
+            )
+    finally:
+        await writer.close()
+
+    return {"unit_day": task["unit_day"], "shard": task["shard"], **stats}
+
+
+async def _as_async(items: Iterator[Any]) -> AsyncIterator[Any]:
+    for item in items:
+        yield item
+
+
+def run_shard(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Точка входа дочернего процесса ProcessPoolExecutor.
+    """
+    return asyncio.run(_process_shard(task))
+
+
+# ----------------------------------------------------------------------
+# SWAP
+# ----------------------------------------------------------------------
+
+async def swap_day(
+    conn,
+    run_id: str,
+    site_url: str,
+    unit_day: date,
+    visits_from: Optional[datetime] = None,
+) -> int:
+    """
+    Атомарно подменяет визиты пересчитанных сессий дня.
+    Затрагиваются только сессии, попавшие в пересчёт, и только их
+    визиты, начавшиеся в прочитанном окне — не позже последнего
+    прочитанного события (конца последнего нового визита сессии).
+    Более поздние визиты той же сессии остаются как есть,
+    как и визиты раньше visits_from (начало периода пересчёта).
+    Счётчики воронок сайта сдвигаются на разницу старых и новых визитов.
+    """
+    columns = ", ".join(SUMMARY_COLUMNS)
+    funnel_columns = "site_url, visit_start, click_buttons, form_submits"
+
+    # в прочитанном окне у сессии нет событий раньше этого дня —
+    # кроме опоздавших, поэтому сутки запаса.
+    # Граница отсекает старые месячные секции session_summary.
+    window_from = _day_bounds(unit_day)[0] - timedelta(days=1)
+    if visits_from is not None:
+        window_from = max(window_from, visits_from)
+
+    async with conn.transaction():
+        funnels = await load_funnels(conn, [site_url])
+        # без воронок сайта нужны только количества
+        returned = funnel_columns if funnels else "1"
+
+        removed = await conn.fetch(
+            f"""
+            DELETE FROM session_summary s
+            USING (
+                SELECT session_id, max(visit_end) AS read_until
+                FROM {STAGING_TABLE}
+                WHERE run_id = $1 AND unit_day = $2
+                GROUP BY session_id
+            ) b
+            WHERE s.site_url = $3
+              AND s.visit_start >= $4
+              AND s.session_id = b.session_id
+              AND s.visit_start <= b.read_until
+            RETURNING {returned};
+            """,
+            run_id,
+            unit_day,
+            site_url,
+            window_from,
+        )
+        added = await conn.fetch(
+            f"""
+            INSERT INTO session_summary ({columns})
+            SELECT {columns}
+            FROM {STAGING_TABLE}
+            WHERE run_id = $1 AND unit_day = $2
+            RETURNING {returned};
+            """,
+            run_id,
+            unit_day,
+        )
+        inserted = len(added)
+
+        if funnels:
+            counters = count_visits(funnels, removed, sign=-1)
+            await apply_counters(conn, count_visits(funnels, added, counters=counters))
+
+        await conn.execute(
+            f"DELETE FROM {STAGING_TABLE} WHERE run_id = $1 AND unit_day = $2",
+            run_id,
+            unit_day,
+        )
+        await conn.execute(
+            """
+            INSERT INTO summary_backfill_days (run_id, unit_day, summaries)
+            VALUES ($1, $2, $3);
+            """,
+            run_id,
+            unit_day,
+            inserted,
+        )
+
+    return inserted
+
+
+# ----------------------------------------------------------------------
+# RUN
+# ----------------------------------------------------------------------
+
+async def backfill(
+    site_url: str,
+    date_from: date,
+    date_to: date,
+    jobs: int = 1,
+    idle_timeout_sec: int = 300,
+    archive_dir: str = ARCHIVE_DIR,
+    run_id: Optional[str] = None,
+    resume: bool = False,
+) -> str:
+    """
+    Пересчитывает session_summary сайта за дни date_from..date_to
+    (включительно). Возвращает run_id.
+
+    Без run_id и resume начинается новый запуск; resume=True продолжает
+    последний запуск с теми же параметрами (если он был).
+    """
+    key = run_key(site_url, date_from, date_to, idle_timeout_sec, jobs)
+
+    # сессии, начавшиеся накануне, тоже могут иметь визиты в периоде
+    range_start = _day_bounds(date_from)[0]
+    days: List[date] = []
+    day = date_from - timedelta(days=1)
+    while day <= date_to:
+        days.append(day)
+        day += timedelta(days=1)
+
+    conn = await get_connection()
+    try:
+        if run_id is None and resume:
+            run_id = await find_last_run(conn, key)
+            if run_id is None:
+                print("[BACKFILL] прерванного запуска с такими параметрами нет, начинаю новый")
+        if run_id is None:
+            run_id = make_run_id(site_url, date_from, date_to, idle_timeout_sec, jobs)
+            # незавершённый прошлый запуск с теми же параметрами уже не продолжить
+            await conn.execute(
+                f"DELETE FROM {STAGING_TABLE} WHERE run_id LIKE $1 AND run_id <> $2",
+                key + "-%",
+                run_id,
+            )
+
+        swapped = {
+            r["unit_day"]
+            for r in await conn.fetch(
+                "SELECT unit_day FROM summary_backfill_days WHERE run_id = $1", run_id
+            )
+        }
+        finished = {
+            (r["unit_day"], r["shard"])
+            for r in await conn.fetch(
+                "SELECT unit_day, shard FROM summary_backfill_shards WHERE run_id = $1",
+                run_id,
+            )
+        }
+
+        pending_days = [d for d in days if d not in swapped]
+        tasks = [
+            {
+                "run_id": run_id,
+                "site_url": site_url,
+                "unit_day": d,
+                "shard": shard,
+                "jobs": jobs,
+                "idle_timeout_sec": idle_timeout_sec,
+                "archive_dir": archive_dir,
+                "visits_from": range_start if d < date_from else None,
+            }
+            for d in pending_days
+            for shard in range(jobs)
+            if (d, shard) not in finished
+        ]
+
+        print(
+            f"[BACKFILL] run={run_id} site={site_url} {date_from}..{date_to} "
+            f"jobs={jobs}: дней {len(pending_days)}/{len(days)}, "
+            f"шардов к расчёту {len(tasks)}"
+        )
+
+        remaining = {d: jobs for d in pending_days}
+        for d, _ in finished:
+            if d in remaining:
+                remaining[d] -= 1
+
+        started = time.monotonic()
+        done = 0
+
+        async def swap_if_ready(d: date) -> None:
+            if remaining[d] == 0:
+                inserted = await swap_day(
+                    conn, run_id, site_url, d, range_start if d < date_from else None
+                )
+                print(f"[BACKFILL] {d}: подменено визитов {inserted}")
+
+        # дни, у которых все шарды уже посчитаны прошлым запуском
+        for d in pending_days:
+            await swap_if_ready(d)
+
+        loop = asyncio.get_running_loop()
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [loop.run_in_executor(executor, run_shard, t) for t in tasks]
+
+            for future in asyncio.as_completed(futures):
+                result = await future
+                done += 1
+                d = result["unit_day"]
+                remaining[d] -= 1
+                print(
+                    f"[BACKFILL] {d} шард {result['shard'] + 1}/{jobs}: "
+                    f"сессий {result['sessions']}, визитов {result['summaries']} "
+                    f"({done}/{len(tasks)}, {time.monotonic() - started:.1f} с)"
+                )
+                await swap_if_ready(d)
+
+    finally:
+        await conn.close()
+
+    print(f"[BACKFILL] run={run_id} завершён")
+    return run_id
@@ -0,0 +1,141 @@
+"""
+CLI summary-сервиса.
+
+Запуск:
+    python summary/cli.py backfill --site example.com \
+        --from 2025-01-01 --to 2025-01-31 --jobs 8
+
+Каждый запуск считает заново; прерванный пересчёт продолжается
+с --resume (последний запуск с теми же параметрами) или --run-id.
+
+Воронки конверсии (summary/funnels.py):
+    python summary/cli.py funnel-add --site example.com --name "Заявка" \
+        --steps '[{"click": 18}, {"form": "Оставить_заявку"}]'
+    python summary/cli.py funnel-report --funnel 1 --from 2025-01-01 --to 2025-01-31
+    python summary/cli.py funnel-rebuild --funnel 1
+
+Слияние сегментов архива закрытых дней (раз в сутки, не во время backfill):
+    python summary/cli.py archive-compact
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from datetime import date, datetime, timedelta, timezone
+
+from archive import ARCHIVE_DIR, compact
+from backfill import backfill
+from db import get_connection
+from funnels import create_funnel, funnel_report, rebuild_funnel
+from worker import IDLE_TIMEOUT_SEC
+
+
+async def _funnel_add(site_url: str, name: str, steps: str) -> None:
+    conn = await get_connection()
+    try:
+        funnel_id = await create_funnel(conn, site_url, name, json.loads(steps))
+    finally:
+        await conn.close()
+    print(f"[FUNNEL] воронка {funnel_id} создана и посчитана по session_summary")
+
+
+async def _funnel_rebuild(funnel_id: int) -> None:
+    conn = await get_connection()
+    try:
+        async with conn.transaction():
+            visits = await rebuild_funnel(conn, funnel_id)
+    finally:
+        await conn.close()
+    print(f"[FUNNEL] воронка {funnel_id} пересчитана: визитов {visits}")
+
+
+async def _funnel_report(funnel_id: int, date_from: date, date_to: date) -> None:
+    conn = await get_connection()
+    try:
+        report = await funnel_report(conn, funnel_id, date_from, date_to)
+    finally:
+        await conn.close()
+
+    total = report[0]
+    for step, visits in enumerate(report):
+        share = f"{visits / total:.1%}" if total else "—"
+        print(f"{'визиты' if step == 0 else f'шаг {step}'}: {visits} ({share})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python summary/cli.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bf = commands.add_parser(
+        "backfill",
+        help="пересчитать session_summary сайта за период по архиву",
+    )
+    bf.add_argument("--site", required=True, help="site_url как в events")
+    bf.add_argument("--from", dest="date_from", required=True, type=date.fromisoformat)
+    bf.add_argument("--to", dest="date_to", required=True, type=date.fromisoformat)
+    bf.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    bf.add_argument("--idle-timeout", type=int, default=IDLE_TIMEOUT_SEC)
+    bf.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    bf.add_argument(
+        "--resume",
+        action="store_true",
+        help="продолжить последний запуск с теми же параметрами",
+    )
+    bf.add_argument("--run-id", default=None, help="продолжить конкретный запуск")
+
+    fa = commands.add_parser("funnel-add", help="завести воронку и посчитать её по истории")
+    fa.add_argument("--site", required=True, help="site_url как в events")
+    fa.add_argument("--name", required=True)
+    fa.add_argument(
+        "--steps",
+        required=True,
+        help='JSON: [{"click": element_id | [element_id, ...]} | {"form": "slug"}, ...]',
+    )
+
+    fr = commands.add_parser("funnel-rebuild", help="пересчитать счётчики воронки по session_summary")
+    fr.add_argument("--funnel", required=True, type=int)
+
+    rp = commands.add_parser("funnel-report", help="визиты по шагам воронки за период")
+    rp.add_argument("--funnel", required=True, type=int)
+    rp.add_argument("--from", dest="date_from", required=True, type=date.fromisoformat)
+    rp.add_argument("--to", dest="date_to", required=True, type=date.fromisoformat)
+
+    ac = commands.add_parser("archive-compact", help="слить сегменты архива в один на сайт и день")
+    ac.add_argument("--site", default=None, help="только этот site_url")
+    ac.add_argument(
+        "--before",
+        type=date.fromisoformat,
+        default=datetime.now(tz=timezone.utc).date() - timedelta(days=1),
+        help="дни раньше этой даты (по умолчанию — вчера, UTC)",
+    )
+    ac.add_argument("--archive-dir", default=ARCHIVE_DIR)
+
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        asyncio.run(
+            backfill(
+                site_url=args.site,
+                date_from=args.date_from,
+                date_to=args.date_to,
+                jobs=max(args.jobs, 1),
+                idle_timeout_sec=args.idle_timeout,
+                archive_dir=args.archive_dir,
+                run_id=args.run_id,
+                resume=args.resume,
+            )
+        )
+    elif args.command == "funnel-add":
+        asyncio.run(_funnel_add(args.site, args.name, args.steps))
+    elif args.command == "funnel-rebuild":
+        asyncio.run(_funnel_rebuild(args.funnel))
+    elif args.command == "funnel-report":
+        asyncio.run(_funnel_report(args.funnel, args.date_from, args.date_to))
+    elif args.command == "archive-compact":
+        stats = compact(args.before, args.site, args.archive_dir)
+        print(f"[ARCHIVE] слито сегментов: {stats['segments']} в {stats['days']} днях")
+
+
+if __name__ == "__main__":
+    main()
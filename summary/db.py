@@ -4,7 +4,8 @@
 Логика:
 - При каждом вызове создаётся новое соединение asyncpg.connect().
 - После использования соединение нужно закрыть через conn.close().
-- Пул соединений НЕ используется.
+- Пул соединений НЕ используется: воркер держит одно соединение
+  на всё время работы (на нём же LISTEN), backfill — по одному на процесс.
 """
 
 import os
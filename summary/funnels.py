@@ -0,0 +1,307 @@
+"""
+Воронки конверсии: упорядоченные шаги — клик по элементу
+(site_structure.element_id) и отправка формы (slug из
+form_submit_success:<slug>).
+
+Определение воронки (таблица funnels):
+    steps = [{"click": 18}, {"click": [2, 7]}, {"form": "Оставить_заявку"}]
+
+Прогресс визита — сколько первых шагов пройдено по порядку; между шагами
+допустимы любые другие события. Действия визита упорядочены по времени,
+при равном времени клик идёт раньше формы (клик по кнопке отправки).
+
+Счётчики funnel_daily (funnel_id, day, step) → visits: визиты дня
+(по visit_start, UTC), прошедшие не меньше step шагов; step 0 — все
+визиты сайта. Их ведут в одной транзакции с session_summary:
+- summary-воркер — при финализации визитов (+1);
+- backfill — при подмене дня (старые визиты −1, пересчитанные +1);
+- funnel-add / funnel-rebuild — полный пересчёт по session_summary.
+Отчёт за период — сумма счётчиков: O(дней × шагов), без чтения визитов.
+
+Порядок блокировок: транзакции, меняющие session_summary, сначала берут
+funnel_daily в ROW EXCLUSIVE и только потом читают определения воронок;
+пересчёт держит SHARE ROW EXCLUSIVE. Поэтому пересчёт видит либо все
+визиты конкурирующей транзакции, либо ни одного — и тогда та сама
+добавит их уже с новой воронкой.
+"""
+
+import json
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# ("click", frozenset(element_id, ...)) | ("form", slug)
+Step = Tuple[str, Any]
+
+# (t от начала визита, 0 — клик / 1 — форма, element_id | slug)
+Action = Tuple[int, int, Any]
+
+# (funnel_id, day, step)
+CounterKey = Tuple[int, date, int]
+
+ACTION_CLICK = 0
+ACTION_FORM = 1
+
+REBUILD_FETCH = 5_000
+
+
+@dataclass(frozen=True)
+class Funnel:
+    id: int
+    site_url: str
+    steps: Tuple[Step, ...]
+
+
+def parse_steps(raw: Any) -> Tuple[Step, ...]:
+    """
+    Проверяет и разбирает funnels.steps.
+
+    Raises:
+        ValueError: неизвестный или пустой шаг.
+    """
+    if isinstance(raw, str):
+        raw = json.loads(raw)
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("steps: нужен непустой список шагов")
+
+    steps: List[Step] = []
+    for item in raw:
+        if not isinstance(item, dict) or len(item) != 1:
+            raise ValueError(f"шаг {item!r}: ожидается {{\"click\": ...}} или {{\"form\": ...}}")
+
+        if "click" in item:
+            ids = item["click"] if isinstance(item["click"], list) else [item["click"]]
+            if not ids or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+                raise ValueError(f"шаг {item!r}: click — element_id или список element_id")
+            steps.append(("click", frozenset(ids)))
+
+        elif "form" in item:
+            if not isinstance(item["form"], str) or not item["form"]:
+                raise ValueError(f"шаг {item!r}: form — slug формы")
+            steps.append(("form", item["form"]))
+
+        else:
+            raise ValueError(f"шаг {item!r}: неизвестный тип")
+
+    return tuple(steps)
+
+
+def _json_list(value: Any) -> List[Dict[str, Any]]:
+    # JSONB из asyncpg приходит строкой
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value or []
+
+
+def visit_actions(visit: Dict[str, Any]) -> List[Action]:
+    """
+    Клики (с element_id) и формы визита в порядке времени.
+    visit — summary из aggregator или строка session_summary.
+    """
+    actions: List[Action] = []
+
+    for click in _json_list(visit.get("click_buttons")):
+        if click.get("element") is not None:
+            actions.append((click["t"], ACTION_CLICK, click["element"]))
+
+    for form in _json_list(visit.get("form_submits")):
+        if form.get("form") is not None:
+            actions.append((form["t"], ACTION_FORM, form["form"]))
+
+    actions.sort()
+    return actions
+
+
+def _matches(step: Step, action: Action) -> bool:
+    kind, value = step
+    if kind == "click":
+        return action[1] == ACTION_CLICK and action[2] in value
+    return action[1] == ACTION_FORM and action[2] == value
+
+
+def visit_progress(steps: Tuple[Step, ...], actions: List[Action]) -> int:
+    """
+    Число пройденных по порядку шагов. Жадное совпадение с самым ранним
+    подходящим действием оптимально: любое более позднее оставляет
+    следующим шагам не больше вариантов.
+    """
+    reached = 0
+    for action in actions:
+        if reached == len(steps):
+            break
+        if _matches(steps[reached], action):
+            reached += 1
+    return reached
+
+
+def visit_day(visit: Dict[str, Any]) -> date:
+    return visit["visit_start"].astimezone(timezone.utc).date()
+
+
+def count_visits(
+    funnels: Dict[str, List[Funnel]],
+    visits: Iterable[Dict[str, Any]],
+    sign: int = 1,
+    counters: Optional[Counter] = None,
+) -> Counter:
+    """
+    Вклад визитов в funnel_daily: (funnel_id, day, step) → ±visits.
+    """
+    counters = counters if counters is not None else Counter()
+
+    for visit in visits:
+        site_funnels = funnels.get(visit["site_url"])
+        if not site_funnels:
+            continue
+
+        actions = visit_actions(visit)
+        day = visit_day(visit)
+        for funnel in site_funnels:
+            for step in range(visit_progress(funnel.steps, actions) + 1):
+                counters[(funnel.id, day, step)] += sign
+
+    return counters
+
+
+# ----------------------------------------------------------------------
+# DB
+# ----------------------------------------------------------------------
+
+async def load_funnels(conn, site_urls: Iterable[str]) -> Dict[str, List[Funnel]]:
+    """
+    Активные воронки сайтов: site_url → [Funnel].
+    Вызывается в транзакции, которая затем меняет session_summary
+    (см. порядок блокировок в описании модуля).
+    """
+    await conn.execute("LOCK TABLE funnel_daily IN ROW EXCLUSIVE MODE")
+
+    rows = await conn.fetch(
+        """
+        SELECT id, site_url, steps
+        FROM funnels
+        WHERE is_active AND site_url = ANY($1::text[])
+        ORDER BY id;
+        """,
+        sorted(set(site_urls)),
+    )
+
+    funnels: Dict[str, List[Funnel]] = {}
+    for r in rows:
+        funnels.setdefault(r["site_url"], []).append(
+            Funnel(r["id"], r["site_url"], parse_steps(r["steps"]))
+        )
+    return funnels
+
+
+async def apply_counters(conn, counters: Counter) -> None:
+    """
+    Прибавляет счётчики к funnel_daily одним upsert'ом.
+    Ключи упорядочены: воркер и backfill не блокируют друг друга взаимно.
+    """
+    keys = sorted(k for k, v in counters.items() if v)
+    if not keys:
+        return
+
+    await conn.execute(
+        """
+        INSERT INTO funnel_daily (funnel_id, day, step, visits)
+        SELECT * FROM unnest($1::bigint[], $2::date[], $3::int[], $4::bigint[])
+        ON CONFLICT (funnel_id, day, step)
+        DO UPDATE SET visits = funnel_daily.visits + EXCLUDED.visits;
+        """,
+        [k[0] for k in keys],
+        [k[1] for k in keys],
+        [k[2] for k in keys],
+        [counters[k] for k in keys],
+    )
+
+
+async def rebuild_funnel(conn, funnel_id: int) -> int:
+    """
+    Пересчитывает funnel_daily воронки по всем визитам сайта
+    в session_summary (в транзакции вызывающего).
+    На время пересчёта воркер ждёт на блокировке funnel_daily.
+
+    Returns:
+        int: число просмотренных визитов.
+    """
+    await conn.execute("LOCK TABLE funnel_daily IN SHARE ROW EXCLUSIVE MODE")
+
+    row = await conn.fetchrow(
+        "SELECT id, site_url, steps FROM funnels WHERE id = $1", funnel_id
+    )
+    if row is None:
+        raise ValueError(f"воронка {funnel_id} не найдена")
+
+    funnel = Funnel(row["id"], row["site_url"], parse_steps(row["steps"]))
+    await conn.execute("DELETE FROM funnel_daily WHERE funnel_id = $1", funnel_id)
+
+    counters: Counter = Counter()
+    visits = 0
+    async for visit in conn.cursor(
+        """
+        SELECT site_url, visit_start, click_buttons, form_submits
+        FROM session_summary
+        WHERE site_url = $1;
+        """,
+        funnel.site_url,
+        prefetch=REBUILD_FETCH,
+    ):
+        visits += 1
+        count_visits({funnel.site_url: [funnel]}, [visit], counters=counters)
+
+    await apply_counters(conn, counters)
+    return visits
+
+
+async def create_funnel(conn, site_url: str, name: str, steps: Any) -> int:
+    """
+    Заводит воронку и сразу считает её по уже собранным визитам.
+    """
+    parse_steps(steps)
+
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE funnel_daily IN SHARE ROW EXCLUSIVE MODE")
+        funnel_id = await conn.fetchval(
+            """
+            INSERT INTO funnels (site_url, name, steps)
+            VALUES ($1, $2, $3::jsonb)
+            RETURNING id;
+            """,
+            site_url,
+            name,
+            steps if isinstance(steps, str) else json.dumps(steps, ensure_ascii=False),
+        )
+        await rebuild_funnel(conn, funnel_id)
+
+    return funnel_id
+
+
+async def funnel_report(
+    conn, funnel_id: int, date_from: date, date_to: date
+) -> List[int]:
+    """
+    Визиты, дошедшие до каждого шага за [date_from, date_to]:
+    [все визиты, шаг 1, шаг 2, ...].
+    """
+    steps = await conn.fetchval("SELECT steps FROM funnels WHERE id = $1", funnel_id)
+    if steps is None:
+        raise ValueError(f"воронка {funnel_id} не найдена")
+
+    rows = await conn.fetch(
+        """
+        SELECT step, sum(visits) AS visits
+        FROM funnel_daily
+        WHERE funnel_id = $1 AND day >= $2 AND day <= $3
+        GROUP BY step;
+        """,
+        funnel_id,
+        date_from,
+        date_to,
+    )
+
+    report = [0] * (len(parse_steps(steps)) + 1)
+    for r in rows:
+        report[r["step"]] = int(r["visits"])
+    return report
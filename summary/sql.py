@@ -1,112 +1,219 @@
-from typing import List, Dict, Any
+import json
+from typing import List, Dict, Any, Tuple
 from datetime import datetime
 
 from db import get_connection
 
 
+# колонки events, которые нужны агрегатору и архиву
+EVENT_COLUMNS_SQL = """
+    site_url,
+    uid,
+    session_id,
+    event_type,
+    event_time,
+    received_at,
+    scroll_position_percent,
+    button_text,
+    button_id,
+    button_class,
+    element_id,
+    form_slug,
+    device_type,
+    os,
+    browser,
+    user_agent,
+    host(client_ip) AS client_ip
+"""
+
+# колонки session_summary в порядке summary_record()
+SUMMARY_COLUMNS: List[str] = [
+    "site_url",
+    "uid",
+    "session_id",
+    "visit_start",
+    "visit_end",
+    "duration_seconds",
+    "country",
+    "city",
+    "device_type",
+    "os",
+    "browser",
+    "max_scroll_depth",
+    "final_scroll_depth",
+    "scroll_stops",
+    "click_buttons",
+    "total_scroll_events",
+    "total_click_events",
+    "form_submits",
+]
+
+
+def summary_record(summary: Dict[str, Any]) -> tuple:
+    """
+    Строка session_summary для COPY (в порядке SUMMARY_COLUMNS).
+    """
+    return (
+        summary["site_url"],
+        summary.get("uid"),
+        summary["session_id"],
+        summary["visit_start"],
+        summary["visit_end"],
+        summary["duration_seconds"],
+        summary.get("country"),
+        summary.get("city"),
+        summary.get("device_type"),
+        summary.get("os"),
+        summary.get("browser"),
+        summary.get("max_scroll_depth"),
+        summary.get("final_scroll_depth"),
+        json.dumps(summary["scroll_stops"], ensure_ascii=False),
+        json.dumps(summary["click_buttons"], ensure_ascii=False),
+        summary.get("total_scroll_events", 0),
+        summary.get("total_click_events", 0),
+        json.dumps(summary.get("form_submits", []), ensure_ascii=False),
+    )
+
+
 # ----------------------------------------------------------------------
-# GET SESSION IDS WITH EVENTS
+# BACKLOG: сессии, ждущие суммаризации
 # ----------------------------------------------------------------------
+# Сессия готова к суммаризации, когда сервер не получал по ней событий
+# дольше idle-таймаута (received_at — часы сервера, а не клиента).
 
-async def get_pending_session_ids(conn) -> List[str]:
+BACKLOG_STATS_SQL = """
+    SELECT
+        count(*) FILTER (WHERE last_received < now() - $1 * interval '1 second') AS finalizable,
+        count(*) AS pending,
+        EXTRACT(EPOCH FROM now() - min(last_received)) AS oldest_sec
+    FROM (
+        SELECT max(received_at) AS last_received
+        FROM events
+        WHERE session_id IS NOT NULL
+        GROUP BY session_id
+    ) s;
+"""
+
+
+async def get_backlog_stats(conn, idle_timeout_sec: int) -> Dict[str, Any]:
+    """
+    Состояние очереди суммаризации:
+    - finalizable — сессий, готовых к суммаризации;
+    - pending — всего сессий с событиями в events;
+    - lag_sec — сколько прошло с последнего события самой давней сессии
+      (для готовой сессии — задержка summary от конца визита);
+    - next_due_sec — через сколько секунд созреет самая давняя сессия
+      (0 — уже готова, None — events пуста).
+    """
+    row = await conn.fetchrow(BACKLOG_STATS_SQL, idle_timeout_sec)
+    oldest = float(row["oldest_sec"]) if row["oldest_sec"] is not None else None
+
+    return {
+        "finalizable": row["finalizable"],
+        "pending": row["pending"],
+        "lag_sec": oldest if row["finalizable"] else 0.0,
+        "next_due_sec": max(idle_timeout_sec - oldest, 0.0) if oldest is not None else None,
+    }
+
+
+async def get_finalizable_sessions(
+    conn, idle_timeout_sec: int, limit: int
+) -> List[Tuple[str, float]]:
+    """
+    До limit готовых сессий, самые давние — первыми:
+    [(session_id, секунд с последнего события), ...].
+    """
     rows = await conn.fetch(
         """
-        SELECT DISTINCT session_id
+        SELECT session_id, EXTRACT(EPOCH FROM now() - max(received_at)) AS age_sec
         FROM events
         WHERE session_id IS NOT NULL
-        ORDER BY session_id;
-        """
+        GROUP BY session_id
+        HAVING max(received_at) < now() - $1 * interval '1 second'
+        ORDER BY max(received_at)
+        LIMIT $2;
+        """,
+        idle_timeout_sec,
+        limit,
     )
-    return [r["session_id"] for r in rows]
+    return [(r["session_id"], float(r["age_sec"])) for r in rows]
 
 
 # ----------------------------------------------------------------------
-# LOAD EVENTS FOR SESSION
+# LOAD EVENTS FOR SESSIONS (одним запросом на пачку)
 # ----------------------------------------------------------------------
 
-async def load_events_for_session(conn, session_id: str) -> List[Dict[str, Any]]:
+async def load_events_for_sessions(
+    conn, session_ids: List[str]
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    session_id → события сессии по event_time.
+    В каждом событии есть id — по нему события потом удаляются.
+    """
     rows = await conn.fetch(
-        """
-        SELECT
-            site_url,
-            uid,
-            session_id,
-            event_type,
-            event_time,
-            scroll_position_percent,
-            button_text,
-            device_type,
-            os,
-            browser
+        f"""
+        SELECT id, {EVENT_COLUMNS_SQL}
         FROM events
-        WHERE session_id = $1
-        ORDER BY event_time ASC;
+        WHERE session_id = ANY($1::text[])
+        ORDER BY session_id, event_time ASC;
         """,
-        session_id,
+        session_ids,
     )
 
-    return [dict(r) for r in rows]
+    events: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        events.setdefault(r["session_id"], []).append(dict(r))
+    return events
+
+
+# ----------------------------------------------------------------------
+# INSERT SESSION SUMMARIES (одним COPY на пачку)
+# ----------------------------------------------------------------------
+
+async def insert_session_summaries(conn, summaries: List[Dict[str, Any]]) -> None:
+    if not summaries:
+        return
+    await conn.copy_records_to_table(
+        "session_summary",
+        records=[summary_record(summary) for summary in summaries],
+        columns=SUMMARY_COLUMNS,
+    )
 
 
 # ----------------------------------------------------------------------
-# INSERT SESSION SUMMARY
+# DELETE RAW EVENTS (после архивации — одним запросом на пачку сессий)
 # ----------------------------------------------------------------------
+# Удаляются только прочитанные события: если по сессии успело прийти
+# новое событие, оно останется в events и попадёт в следующий визит.
 
-async def insert_session_summary(conn, summary: Dict[str, Any]) -> None:
+async def delete_events(conn, event_ids: List[Any]) -> None:
     await conn.execute(
-        """
-        INSERT INTO session_summary (
-            site_url,
-            uid,
-            session_id,
-            visit_start,
-            visit_end,
-            duration_seconds,
-            country,
-            city,
-            device_type,
-            os,
-            browser,
-            max_scroll_depth,
-            final_scroll_depth,
-            scroll_stops,
-            click_buttons,
-            total_scroll_events,
-            total_click_events
-        )
-        VALUES (
-            $1,$2,$3,$4,$5,$6,
-            $7,$8,$9,$10,$11,
-            $12,$13,$14::jsonb,$15::jsonb,
-            $16,$17
-        );
-        """,
-        summary["site_url"],
-        summary.get("uid"),
-        summary["session_id"],
-        summary["visit_start"],
-        summary["visit_end"],
-        summary["duration_seconds"],
-        summary.get("country"),
-        summary.get("city"),
-        summary.get("device_type"),
-        summary.get("os"),
-        summary.get("browser"),
-        summary.get("max_scroll_depth"),
-        summary.get("final_scroll_depth"),
-        summary["scroll_stops"],
-        summary["click_buttons"],
-        summary.get("total_scroll_events", 0),
-        summary.get("total_click_events", 0),
+        "DELETE FROM events WHERE id = ANY($1::uuid[]);",
+        event_ids,
     )
 
 
 # ----------------------------------------------------------------------
-# DELETE RAW EVENTS
+# ARCHIVE SEGMENTS (журнал публикации сегментов архива)
 # ----------------------------------------------------------------------
+# Имя сегмента пишется в транзакции пачки (вместе с DELETE events)
+# и удаляется после переименования .seg.tmp → .seg.
 
-async def delete_events_for_session(conn, session_id: str) -> None:
+async def record_archive_segments(conn, names: List[str]) -> None:
     await conn.execute(
-        "DELETE FROM events WHERE session_id = $1;",
-        session_id,
+        "INSERT INTO archive_segments (name) SELECT unnest($1::text[]);",
+        names,
     )
+
+
+async def get_archive_segments(conn) -> List[str]:
+    rows = await conn.fetch("SELECT name FROM archive_segments;")
+    return [r["name"] for r in rows]
+
+
+async def forget_archive_segments(conn, names: List[str]) -> None:
+    if names:
+        await conn.execute(
+            "DELETE FROM archive_segments WHERE name = ANY($1::text[]);",
+            names,
+        )
@@ -1,63 +1,314 @@
+"""
+Summary-воркер: сессии из events → session_summary (+ холодный архив).
+
+Планировщик:
+- одно постоянное соединение (переподключение с backoff при ошибке);
+- сессия готова к суммаризации, когда по ней IDLE_TIMEOUT_SEC
+  не приходило событий (received_at);
+- при бэклоге пачки идут подряд без пауз, размер пачки подстраивается
+  под измеренное время на сессию и под отставание;
+- без бэклога воркер спит до созревания ближайшей сессии
+  (с окном, чтобы собрать их в одну пачку), а при пустой events —
+  до NOTIFY events_ingested от API;
+- SIGTERM/SIGINT: текущая пачка дописывается, затем выход;
+- при старте и после переподключения доводится публикация сегментов
+  архива, прерванная падением (см. archive.py).
+"""
+
 import asyncio
-from typing import List, Dict, Any
+import os
+import signal
+import time
+from typing import List, Dict, Any, Optional, Tuple
+
+import asyncpg
 
 from db import get_connection
 from sql import (
-    get_pending_session_ids,
-    load_events_for_session,
-    insert_session_summary,
-    delete_events_for_session,
+    get_backlog_stats,
+    get_finalizable_sessions,
+    load_events_for_sessions,
+    insert_session_summaries,
+    delete_events,
+    forget_archive_segments,
+    get_archive_segments,
+    record_archive_segments,
 )
 from aggregator import build_session_summaries
+from archive import ArchiveWriter
+from funnels import apply_counters, count_visits, load_funnels
 
 
-SLEEP_SECONDS = 30
 IDLE_TIMEOUT_SEC = 300
 
+# целевая задержка summary от конца визита
+SUMMARY_MAX_LAG_SEC = int(os.getenv("SUMMARY_MAX_LAG_SEC", "360"))
 
-async def process_once() -> None:
-    conn = await get_connection()
-    try:
-        session_ids = await get_pending_session_ids(conn)
+# канал NOTIFY, в который API сообщает о новых событиях (app/db.py)
+EVENTS_CHANNEL = "events_ingested"
+
+# стартовый размер пачки: сессий на одну транзакцию (архив + summary + DELETE)
+ARCHIVE_BATCH_SESSIONS = 500
+MIN_BATCH_SESSIONS = 50
+MAX_BATCH_SESSIONS = 5000
+
+# желаемая длительность одной пачки (при отставании — x4)
+TARGET_BATCH_SEC = 2.0
+LAGGING_BATCH_FACTOR = 4
 
-        if not session_ids:
+# страховочный опрос, если NOTIFY потерялся
+MAX_SLEEP_SEC = 60
+
+ERROR_BACKOFF_MIN_SEC = 1
+ERROR_BACKOFF_MAX_SEC = 60
+
+
+class BatchSizer:
+    """
+    Размер следующей пачки: TARGET_BATCH_SEC / (EMA времени на сессию),
+    в границах MIN_BATCH_SESSIONS..MAX_BATCH_SESSIONS.
+    При отставании сверх SUMMARY_MAX_LAG_SEC пачки крупнее:
+    меньше транзакций и fsync архива на сессию.
+    """
+
+    def __init__(self, size: int = ARCHIVE_BATCH_SESSIONS) -> None:
+        self.size = size
+        self.sec_per_session: Optional[float] = None
+
+    def observe(self, sessions: int, seconds: float, lag_sec: float) -> None:
+        if sessions <= 0:
             return
 
-        for session_id in session_ids:
-            events: List[Dict[str, Any]] = await load_events_for_session(
-                conn, session_id
-            )
+        sample = seconds / sessions
+        if self.sec_per_session is None:
+            self.sec_per_session = sample
+        else:
+            self.sec_per_session = 0.7 * self.sec_per_session + 0.3 * sample
 
-            if not events:
-                continue
+        target = TARGET_BATCH_SEC
+        if lag_sec > SUMMARY_MAX_LAG_SEC:
+            target *= LAGGING_BATCH_FACTOR
+
+        size = int(target / max(self.sec_per_session, 1e-6))
+        self.size = max(MIN_BATCH_SESSIONS, min(MAX_BATCH_SESSIONS, size))
 
-            summaries = build_session_summaries(
-                events,
-                idle_timeout_sec=IDLE_TIMEOUT_SEC,
-            )
 
-            if not summaries:
-                continue
+async def recover_archive(conn, archive: ArchiveWriter) -> None:
+    """
+    Публикует сегменты, зафиксированные в archive_segments до падения,
+    и удаляет временные файлы незафиксированных пачек.
+    """
+    committed = await get_archive_segments(conn)
+    published, removed = archive.recover(committed)
+    await forget_archive_segments(conn, committed)
 
-            # сначала INSERT summaries
-            for summary in summaries:
-                await insert_session_summary(conn, summary)
+    if published or removed:
+        print(
+            f"[SUMMARY WORKER] архив восстановлен: опубликовано {published}, "
+            f"удалено незафиксированных {removed}"
+        )
+
+
+async def finalize_batch(
+    conn,
+    batch: List[Dict[str, Any]],
+    archive: ArchiveWriter,
+) -> None:
+    """
+    Финализирует пачку сессий:
+    1) сырые события пишутся во временные сегменты архива (fsync),
+    2) в одной транзакции — INSERT summaries, счётчики воронок,
+       имена сегментов в archive_segments и DELETE сырых событий,
+    3) после COMMIT сегменты атомарно публикуются.
+    """
+    if not batch:
+        return
+
+    for item in batch:
+        archive.add(item["events"])
+
+    try:
+        archive.stage()
+
+        summaries = [summary for item in batch for summary in item["summaries"]]
+
+        async with conn.transaction():
+            funnels = await load_funnels(conn, {s["site_url"] for s in summaries})
+
+            await insert_session_summaries(conn, summaries)
+
+            await apply_counters(conn, count_visits(funnels, summaries))
+            await record_archive_segments(conn, archive.staged_segments())
 
             # ТОЛЬКО ПОСЛЕ успешного insert — удаляем raw events
-            await delete_events_for_session(conn, session_id)
+            await delete_events(
+                conn, [event["id"] for item in batch for event in item["events"]]
+            )
+    except BaseException:
+        archive.abort()
+        raise
+
+    await forget_archive_segments(conn, archive.commit())
+
+
+async def process_batch(conn, archive: ArchiveWriter, limit: int) -> Tuple[int, float]:
+    """
+    Суммаризирует до limit готовых сессий (самые давние — первыми).
+
+    Returns:
+        (число сессий, задержка самой давней из них от конца визита, с).
+    """
+    sessions = await get_finalizable_sessions(conn, IDLE_TIMEOUT_SEC, limit)
+    if not sessions:
+        return 0, 0.0
+
+    events_by_session = await load_events_for_sessions(
+        conn, [session_id for session_id, _ in sessions]
+    )
+
+    batch: List[Dict[str, Any]] = []
+    for session_id, _ in sessions:
+        events = events_by_session.get(session_id)
+        if not events:
+            continue
 
+        batch.append(
+            {
+                "session_id": session_id,
+                "events": events,
+                "summaries": build_session_summaries(
+                    events,
+                    idle_timeout_sec=IDLE_TIMEOUT_SEC,
+                ),
+            }
+        )
+
+    await finalize_batch(conn, batch, archive)
+    return len(sessions), sessions[0][1]
+
+
+async def process_once() -> None:
+    """
+    Разбирает все готовые сессии пачками максимального размера
+    (разовый прогон — для бенчмарков и ручного запуска).
+    """
+    conn = await get_connection()
+    archive = ArchiveWriter()
+    try:
+        await recover_archive(conn, archive)
+        while True:
+            done, _ = await process_batch(conn, archive, MAX_BATCH_SESSIONS)
+            if done < MAX_BATCH_SESSIONS:
+                break
     finally:
         await conn.close()
 
 
+async def _wait(stop: asyncio.Event, wakeup: Optional[asyncio.Event], timeout: float) -> None:
+    """
+    Ждёт stop (или wakeup, если задан) не дольше timeout секунд.
+    """
+    waiters = [asyncio.ensure_future(stop.wait())]
+    if wakeup is not None:
+        waiters.append(asyncio.ensure_future(wakeup.wait()))
+
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+def _idle_sleep(next_due_sec: Optional[float]) -> float:
+    """
+    Сколько спать без готовых сессий. Созревшие сессии ждут окно
+    в половину запаса по задержке — так они собираются в одну пачку,
+    а summary всё равно укладывается в SUMMARY_MAX_LAG_SEC.
+    """
+    if next_due_sec is None:
+        return MAX_SLEEP_SEC
+
+    window = max(SUMMARY_MAX_LAG_SEC - IDLE_TIMEOUT_SEC, 0) / 2
+    return max(1.0, min(MAX_SLEEP_SEC, next_due_sec + window))
+
+
+async def run(stop: asyncio.Event) -> None:
+    """
+    Цикл планировщика до установки stop.
+    Пачка, начатая до stop, всегда дописывается.
+    """
+    wakeup = asyncio.Event()
+    sizer = BatchSizer()
+    archive = ArchiveWriter()
+    conn: Optional[asyncpg.Connection] = None
+    backoff = ERROR_BACKOFF_MIN_SEC
+
+    def on_events_ingested(*_: Any) -> None:
+        wakeup.set()
+
+    try:
+        while not stop.is_set():
+            try:
+                if conn is None or conn.is_closed():
+                    conn = await get_connection()
+                    await conn.add_listener(EVENTS_CHANNEL, on_events_ingested)
+                    await recover_archive(conn, archive)
+
+                wakeup.clear()
+
+                limit = sizer.size
+                started = time.perf_counter()
+                done, lag_sec = await process_batch(conn, archive, limit)
+
+                if done:
+                    sizer.observe(done, time.perf_counter() - started, lag_sec)
+                    if lag_sec > SUMMARY_MAX_LAG_SEC:
+                        print(
+                            f"[SUMMARY WORKER] отставание {lag_sec:.0f} с "
+                            f"(цель {SUMMARY_MAX_LAG_SEC} с), пачка {sizer.size} сессий"
+                        )
+
+                backoff = ERROR_BACKOFF_MIN_SEC
+
+                # полная пачка — вероятно, бэклог ещё есть
+                if done >= limit:
+                    continue
+
+                stats = await get_backlog_stats(conn, IDLE_TIMEOUT_SEC)
+                if stats["finalizable"]:
+                    continue
+
+                # пока в events есть сессии, новые события не приблизят
+                # созревание самой давней — NOTIFY нужен только при пустой events
+                await _wait(
+                    stop,
+                    wakeup if stats["next_due_sec"] is None else None,
+                    _idle_sleep(stats["next_due_sec"]),
+                )
+
+            except Exception as e:
+                print("[SUMMARY WORKER ERROR]", repr(e))
+
+                if conn is not None:
+                    conn.terminate()
+                    conn = None
+
+                await _wait(stop, None, backoff)
+                backoff = min(backoff * 2, ERROR_BACKOFF_MAX_SEC)
+    finally:
+        if conn is not None and not conn.is_closed():
+            await conn.close()
+
+
 async def main() -> None:
-    while True:
-        try:
-            await process_once()
-        except Exception as e:
-            print("[SUMMARY WORKER ERROR]", repr(e))
+    stop = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
 
-        await asyncio.sleep(SLEEP_SECONDS)
+    await run(stop)
+    print("[SUMMARY WORKER] остановлен")
 
 
 if __name__ == "__main__":
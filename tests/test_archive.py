@@ -0,0 +1,185 @@
+"""
+Холодный архив (summary/archive.py) без БД: формат сегмента,
+доведение публикации после падения воркера и чтение во время
+прерванного слияния. Сквозная проверка через воркер и backfill —
+python -m bench funnels.
+"""
+
+import json
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+import archive
+from archive import (
+    ARCHIVE_COLUMNS,
+    COMPACT_TMP_SUFFIX,
+    MANIFEST_SUFFIX,
+    SEGMENT_SUFFIX,
+    TMP_SUFFIX,
+    ArchiveWriter,
+    compact_day,
+    iter_archived_events,
+    iter_segment_rows,
+    write_segment,
+)
+
+SITE = "a.example"
+DAY = date(2025, 3, 1)
+BASE = datetime(2025, 3, 1, 10, tzinfo=timezone.utc)
+
+
+def make_events(count: int, prefix: str = "e") -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": f"{prefix}{i}",
+            "site_url": SITE,
+            "session_id": f"s{i % 7}",
+            "event_type": "click",
+            "event_time": BASE + timedelta(seconds=i),
+            "element_id": i % 5,
+        }
+        for i in range(count)
+    ]
+
+
+def row_key(row: Dict[str, Any]) -> tuple:
+    return tuple(row.get(name) for name, _ in ARCHIVE_COLUMNS)
+
+
+def read_day(root: Path) -> List[Dict[str, Any]]:
+    return list(iter_archived_events(SITE, DAY, DAY, root=str(root)))
+
+
+def day_dir(root: Path) -> Path:
+    return root / SITE / DAY.isoformat()
+
+
+def test_segment_round_trip(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # несколько row group'ов
+    monkeypatch.setattr(archive, "ROW_GROUP_SIZE", 3)
+    events = [
+        {
+            "id": "1",
+            "session_id": "s1",
+            "event_type": "click",
+            "event_time": BASE + timedelta(microseconds=123_456),
+            "received_at": BASE + timedelta(seconds=1),
+            "element_id": -5,
+            "button_text": "Купить 😀",
+            "form_slug": "Оставить_заявку",
+        },
+        {
+            "id": "2",
+            "session_id": "s1",
+            "event_type": "scroll",
+            "event_time": BASE - timedelta(seconds=30),
+            "scroll_position_percent": 0,
+        },
+        {
+            "id": "3",
+            "session_id": None,
+            "event_type": "heartbeat",
+            "event_time": BASE,
+            "scroll_position_percent": -1,
+            "user_agent": "",
+        },
+        {
+            "id": "4",
+            "session_id": "s0",
+            "event_type": "click",
+            "event_time": BASE + timedelta(days=1),
+            "element_id": 2**40,
+            "button_text": "Купить 😀",
+            "client_ip": "::1",
+        },
+    ]
+    path = tmp_path / ("x" + SEGMENT_SUFFIX)
+    write_segment(path, SITE, DAY, events)
+
+    rows = list(iter_segment_rows(path))
+    assert all(row["site_url"] == SITE for row in rows)
+    # упорядочено по (session_id, event_time), отсутствующие колонки — None
+    assert [row["id"] for row in rows] == ["3", "4", "2", "1"]
+    assert sorted(map(row_key, rows)) == sorted(map(row_key, events))
+
+    # сегмент чужого сайта пропускается
+    assert list(iter_segment_rows(path, "b.example")) == []
+
+
+def test_recover_publishes_only_committed(tmp_path: Path) -> None:
+    writer = ArchiveWriter(str(tmp_path))
+    writer.add(make_events(10, "a"))
+    writer.stage()
+    committed = writer.staged_segments()
+    # воркер упал после COMMIT, до переименования
+    writer.abort()
+
+    # транзакция этой пачки не зафиксирована
+    writer.add(make_events(10, "b"))
+    writer.stage()
+    writer.abort()
+
+    assert read_day(tmp_path) == []
+    assert len(list(day_dir(tmp_path).glob("*" + TMP_SUFFIX))) == 2
+
+    assert ArchiveWriter(str(tmp_path)).recover(committed) == (1, 1)
+
+    assert list(day_dir(tmp_path).glob("*" + TMP_SUFFIX)) == []
+    assert [p.relative_to(tmp_path).as_posix() for p in day_dir(tmp_path).iterdir()] == committed
+    assert sorted(row["id"] for row in read_day(tmp_path)) == sorted(f"a{i}" for i in range(10))
+
+
+def write_day(root: Path, batches: int) -> List[Dict[str, Any]]:
+    writer = ArchiveWriter(str(root))
+    events: List[Dict[str, Any]] = []
+    for batch in range(batches):
+        chunk = make_events(5, f"b{batch}-")
+        writer.add(chunk)
+        writer.stage()
+        writer.commit()
+        events.extend(chunk)
+    return events
+
+
+def test_readers_skip_inputs_of_published_compaction(tmp_path: Path) -> None:
+    events = write_day(tmp_path, 3)
+    directory = day_dir(tmp_path)
+    inputs = sorted(directory.glob("*" + SEGMENT_SUFFIX))
+
+    # слияние упало после публикации результата, до удаления входов
+    name = "99999999999999999999-1-c"
+    (directory / (name + MANIFEST_SUFFIX)).write_text(
+        json.dumps({"inputs": [p.name for p in inputs]}), encoding="utf-8"
+    )
+    write_segment(
+        directory / (name + SEGMENT_SUFFIX),
+        SITE,
+        DAY,
+        [row for p in inputs for row in iter_segment_rows(p)],
+    )
+
+    rows = read_day(tmp_path)
+    assert sorted(map(row_key, rows)) == sorted(map(row_key, events))
+
+    assert compact_day(directory) == 0
+    assert sorted(p.name for p in directory.iterdir()) == [name + SEGMENT_SUFFIX]
+    assert sorted(map(row_key, read_day(tmp_path))) == sorted(map(row_key, events))
+
+
+def test_unpublished_compaction_is_ignored(tmp_path: Path) -> None:
+    events = write_day(tmp_path, 2)
+    directory = day_dir(tmp_path)
+    inputs = sorted(p.name for p in directory.glob("*" + SEGMENT_SUFFIX))
+
+    # слияние упало до публикации: манифест не дописан, результат временный
+    (directory / ("x-c" + MANIFEST_SUFFIX)).write_text('{"inpu', encoding="utf-8")
+    (directory / ("x-c" + COMPACT_TMP_SUFFIX)).write_bytes(b"junk")
+
+    assert sorted(map(row_key, read_day(tmp_path))) == sorted(map(row_key, events))
+
+    assert compact_day(directory) == len(inputs)
+    assert len(list(directory.iterdir())) == 1
+    assert sorted(map(row_key, read_day(tmp_path))) == sorted(map(row_key, events))
@@ -0,0 +1,128 @@
+"""
+Воронки без БД: жадный visit_progress и count_visits из summary/funnels.py
+против эталона «в лоб» из bench/funnels.py на случайных визитах.
+Сквозная проверка через воркер и backfill — python -m bench funnels.
+"""
+
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import pytest
+
+from bench.funnels import reference_progress
+from funnels import ACTION_CLICK, Funnel, count_visits, parse_steps, visit_actions, visit_progress
+
+ELEMENT_IDS = [1, 2, 3, 4]
+FORM_SLUGS = ["Оставить_заявку", "Записаться"]
+SITES = ["a.example", "b.example"]
+
+
+def random_steps(rnd: random.Random) -> List[Dict[str, Any]]:
+    steps: List[Dict[str, Any]] = []
+    for _ in range(rnd.randint(1, 4)):
+        if rnd.random() < 0.3:
+            steps.append({"form": rnd.choice(FORM_SLUGS)})
+        elif rnd.random() < 0.5:
+            steps.append({"click": rnd.choice(ELEMENT_IDS)})
+        else:
+            steps.append({"click": rnd.sample(ELEMENT_IDS, rnd.randint(1, 3))})
+    return steps
+
+
+def random_visit(rnd: random.Random, start: datetime) -> Dict[str, Any]:
+    """
+    Визит в виде summary: клики и формы с совпадающими t (клик по
+    кнопке отправки) и клики без element_id (до словаря элементов).
+    """
+    clicks: List[Dict[str, Any]] = []
+    forms: List[Dict[str, Any]] = []
+    for _ in range(rnd.randint(0, 8)):
+        t = rnd.randint(0, 5) * 1000
+        roll = rnd.random()
+        if roll < 0.3:
+            forms.append({"t": t, "form": rnd.choice(FORM_SLUGS)})
+        elif roll < 0.4:
+            clicks.append({"t": t, "button": "Купить"})
+        else:
+            clicks.append({"t": t, "element": rnd.choice(ELEMENT_IDS)})
+
+    return {
+        "site_url": rnd.choice(SITES),
+        "visit_start": start + timedelta(hours=rnd.randint(0, 71)),
+        "click_buttons": clicks,
+        "form_submits": forms,
+    }
+
+
+def reference_rows(visit: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Действия визита строками events — в порядке эталона
+    (при равном времени клик раньше формы).
+    """
+    rows = [
+        {"t": c["t"], "event_type": "click", "element_id": c["element"], "form_slug": None}
+        for c in visit["click_buttons"]
+        if "element" in c
+    ] + [
+        {"t": f["t"], "event_type": "form_submit", "element_id": None, "form_slug": f["form"]}
+        for f in visit["form_submits"]
+    ]
+    rows.sort(
+        key=lambda r: (
+            r["t"],
+            r["event_type"] != "click",
+            r["element_id"] if r["event_type"] == "click" else r["form_slug"],
+        )
+    )
+    return rows
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_visit_progress_matches_reference(seed: int) -> None:
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    for _ in range(200):
+        raw_steps = random_steps(rnd)
+        visit = random_visit(rnd, start)
+
+        actions = visit_actions(visit)
+        assert [a[1] == ACTION_CLICK for a in actions] == [
+            r["event_type"] == "click" for r in reference_rows(visit)
+        ]
+        assert visit_progress(parse_steps(raw_steps), actions) == reference_progress(
+            raw_steps, reference_rows(visit)
+        )
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_count_visits_matches_reference(seed: int) -> None:
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1, 22, tzinfo=timezone.utc)
+
+    defined = {
+        funnel_id: (rnd.choice(SITES), random_steps(rnd)) for funnel_id in range(1, 6)
+    }
+    funnels: Dict[str, List[Funnel]] = {}
+    for funnel_id, (site_url, raw_steps) in defined.items():
+        funnels.setdefault(site_url, []).append(Funnel(funnel_id, site_url, parse_steps(raw_steps)))
+
+    visits = [random_visit(rnd, start) for _ in range(300)]
+
+    expected: Counter = Counter()
+    for visit in visits:
+        day = visit["visit_start"].date()
+        for funnel_id, (site_url, raw_steps) in defined.items():
+            if visit["site_url"] != site_url:
+                continue
+            for step in range(reference_progress(raw_steps, reference_rows(visit)) + 1):
+                expected[(funnel_id, day, step)] += 1
+
+    assert count_visits(funnels, visits) == expected
+
+    # backfill: снятие тех же визитов обнуляет счётчики
+    counters = count_visits(funnels, visits)
+    count_visits(funnels, visits, sign=-1, counters=counters)
+    assert not any(counters.values())
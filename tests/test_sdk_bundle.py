@@ -0,0 +1,90 @@
+"""
+Минификатор SDK (app/sdk_bundle.py): собранное ядро раздаётся
+с Cache-Control: immutable, поэтому сломанный JS проверяется здесь,
+а не на сайтах. Для тестов минификатора нужен node; без него они
+пропускаются. Там же — разбор sites.sdk_config для загрузчика.
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.sdk_bundle import SDK_SOURCE_PATH, minify_js, site_config
+
+NODE = shutil.which("node")
+needs_node = pytest.mark.skipif(NODE is None, reason="нужен node")
+
+# регулярные выражения с пробелами и кавычками, деление, шаблон
+# на несколько строк, ASI после return
+SNIPPET = r'''
+var s = "a  b \"c\"  d";
+var out = [];
+out.push(s.replace(/ +/g, "_"));              // пробелы внутри регулярки
+out.push(s.split(/"/).length);                 // кавычка внутри регулярки
+out.push(/ a  b /.test(" a  b "));
+out.push([" x ", "y"].map(function (v) { return v.replace(/^ | $/g, ""); }).join("|"));
+out.push(s.match(/[" /]+/g).length);           // «/» и кавычка в классе
+var a = 12, b = 3, c = 2;
+out.push(a / b / c);
+out.push(a / 2 + / 1 /.source);
+var t = `line 1
+    line  2 ${a + 1}`;
+out.push(t);
+function f() {
+    return /* комментарий */ typeof / x /;
+}
+out.push(f());
+out.push(1 - -1, 1 + +"2");
+console.log(JSON.stringify(out));
+'''
+
+
+def run_node(path: Path) -> str:
+    return subprocess.run(
+        [NODE, str(path)], check=True, capture_output=True, text=True
+    ).stdout
+
+
+@needs_node
+def test_sdk_core_passes_node_check(tmp_path: Path) -> None:
+    path = tmp_path / "sdk.min.js"
+    path.write_text(minify_js(SDK_SOURCE_PATH.read_text(encoding="utf-8")), encoding="utf-8")
+
+    subprocess.run([NODE, "--check", str(path)], check=True, capture_output=True)
+
+
+@needs_node
+def test_minified_snippet_behaves_like_source(tmp_path: Path) -> None:
+    source = tmp_path / "source.js"
+    minified = tmp_path / "minified.js"
+    source.write_text(SNIPPET, encoding="utf-8")
+    minified.write_text(minify_js(SNIPPET), encoding="utf-8")
+
+    subprocess.run([NODE, "--check", str(minified)], check=True, capture_output=True)
+    assert run_node(minified) == run_node(source)
+
+
+def test_regex_literals_are_kept_verbatim() -> None:
+    assert '/ +/g' in minify_js('x.replace(/ +/g, "_");\n')
+    assert 'split(/"/)' in minify_js('s.split(/"/) ;\nvar q = "  ";\n')
+    assert '"  "' in minify_js('s.split(/"/) ;\nvar q = "  ";\n')
+
+
+@pytest.mark.parametrize("raw", [[1, 2], "batch_size", 50, None, True])
+def test_site_config_ignores_non_objects(raw) -> None:
+    assert site_config(raw) == {}
+
+
+def test_site_config_clamps_and_filters() -> None:
+    config = site_config(
+        {
+            "batch_size": 10_000,
+            "flush_delay_ms": 10,
+            "heartbeat_interval_ms": True,
+            "sample_rate": float("nan"),
+            "unknown": 1,
+        }
+    )
+    assert config == {"batchSize": 200, "flushDelay": 1_000}
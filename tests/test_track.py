@@ -0,0 +1,90 @@
+"""
+Разбор батчей POST /track без БД: значения, которые PostgreSQL
+не примет, должны отбрасываться или чиниться до executemany —
+иначе 500 на весь батч, и SDK повторяет его раз за разом.
+"""
+
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from app.endpoints.track import MAX_EVENTS_PER_BATCH, MAX_TEXT_LEN, _percent, _sdk_rows, _text
+
+
+def test_text_strips_nul_and_lone_surrogates() -> None:
+    # SDK режет текст по UTF-16: .slice(0, 80) может разорвать эмодзи
+    lone = json.loads('"Купить \\ud83d"')
+    assert _text(lone) == "Купить ?"
+    assert _text("a\x00b") == "ab"
+    assert _text("ok 😀") == "ok 😀"
+
+    for value in (lone, "a\x00b", "\udfff" * 3):
+        _text(value).encode("utf-8")
+
+
+def test_text_types_and_length() -> None:
+    assert _text(None) is None
+    assert _text({"x": 1}) is None
+    assert _text([1]) is None
+    assert _text(42) == "42"
+    assert _text("я" * (MAX_TEXT_LEN + 10)) == "я" * MAX_TEXT_LEN
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (40, 40),
+        (55.9, 55),
+        ("70", 70),
+        (1e12, 100),
+        (10**30, 100),
+        (-5, 0),
+        (float("nan"), None),
+        (float("inf"), None),
+        (True, None),
+        ("x", None),
+        (None, None),
+        ({"sp": 1}, None),
+    ],
+)
+def test_percent_is_clamped(value, expected) -> None:
+    assert _percent(value) == expected
+
+
+def test_sdk_rows_maps_event_types() -> None:
+    ts = 1735689600000
+    events, rows = _sdk_rows(
+        {
+            "events": [
+                {"event_type": "heartbeat", "ts": ts, "payload": {"scroll_percent": 1e12}},
+                {
+                    "event_type": "click_button:Купить",
+                    "ts": ts,
+                    "session_id": "s1",
+                    "payload": {"text": "Купить \ud83d", "id": {"x": 1}, "class_name": "btn\x00"},
+                },
+                {"event_type": "form_submit_success:Оставить_заявку", "ts": ts, "payload": {}},
+                {"event_type": "page_view", "ts": ts, "payload": {}},
+                {"event_type": "heartbeat", "payload": "junk"},
+                "junk",
+            ]
+        }
+    )
+    assert len(events) == 6
+    assert len(rows) == 3
+
+    scroll, click, form = [row for row, _, _ in rows]
+    event_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    assert scroll == ("scroll", event_time, 100, None, None, None, None)
+    assert click == ("click", event_time, None, "Купить ?", None, "btn", None)
+    assert form == ("form_submit", event_time, None, None, None, None, "Оставить_заявку")
+    assert [session_id for _, session_id, _ in rows] == [None, "s1", None]
+
+
+def test_sdk_rows_rejects_non_list_and_caps_batch() -> None:
+    assert _sdk_rows({"events": {"a": 1}}) is None
+
+    heartbeat = {"event_type": "heartbeat", "ts": 0, "payload": {"scroll_percent": 1}}
+    _, rows = _sdk_rows({"events": [heartbeat] * (MAX_EVENTS_PER_BATCH + 10)})
+    assert len(rows) == MAX_EVENTS_PER_BATCH